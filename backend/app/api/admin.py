@@ -0,0 +1,257 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from app.database import get_db, pool_stats, replica_stats
+from app.cache import all_cache_stats
+from app.write_queue import write_queue_stats
+from app.password_hashing import password_pool
+from app.profiling import list_profiles, profile_path
+from app.slow_queries import reset_slow_query_stats, slow_query_stats
+from app.models import ApiKey, BackfillRun, PayloadNormalizationJob, ReencryptionJob, Study, User
+from app.schemas import (
+    ApiKeyCreate,
+    ApiKeyCreatedResponse,
+    ApiKeyResponse,
+    BackfillRunResponse,
+    PayloadNormalizationJobResponse,
+    ReencryptionJobResponse,
+)
+from app.api_keys import API_KEY_SCOPES, generate_api_key, invalidate_api_key
+from app.backfill import BACKFILLS, run_backfill, start_backfill_run
+from app.reencryption import run_reencryption_job, start_reencryption_job
+from app.payload_normalizer import run_normalization_job, start_normalization_job, storage_format_summary
+from app.middleware.auth_middleware import get_current_admin_user
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/cache-stats")
+def get_cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """Hit/miss/eviction counters of this worker's in-process caches (admin only)."""
+    return {"caches": all_cache_stats()}
+
+
+@router.get("/password-hashing-stats")
+def get_password_hashing_stats(current_user: User = Depends(get_current_admin_user)):
+    """bcrypt pool occupancy, queue depth, rejections and latency percentiles (admin only)."""
+    return password_pool.stats()
+
+
+@router.get("/db-pool-stats")
+def get_db_pool_stats(current_user: User = Depends(get_current_admin_user)):
+    """Connection pool occupancy, overflow, checkout waits and timeouts for this worker (admin only)."""
+    return {**pool_stats(), "write_queue": write_queue_stats(), "read_replica": replica_stats()}
+
+
+@router.get("/slow-queries")
+def get_slow_queries(limit: int = 20, current_user: User = Depends(get_current_admin_user)):
+    """Slowest statement shapes in this worker by total time, with routes and plans (admin only)."""
+    if limit < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="limit must be at least 1")
+    return slow_query_stats(limit)
+
+
+@router.delete("/slow-queries")
+def reset_slow_queries(current_user: User = Depends(get_current_admin_user)):
+    """Forget this worker's slow-query offenders, e.g. after adding an index (admin only)."""
+    reset_slow_query_stats()
+    return {"message": "Slow-query statistics reset"}
+
+
+@router.get("/profiles")
+def get_profiles(current_user: User = Depends(get_current_admin_user)):
+    """Stored request profiles, newest first (admin only)."""
+    return {"profiles": list_profiles()}
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, current_user: User = Depends(get_current_admin_user)):
+    """Download a stored profile as speedscope JSON, to open at speedscope.app (admin only)."""
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
+
+
+@router.get("/api-keys", response_model=List[ApiKeyResponse])
+def list_api_keys(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """List service API keys (admin only); secrets are never returned."""
+    return db.query(ApiKey).order_by(ApiKey.id).all()
+
+
+@router.post("/api-keys", response_model=ApiKeyCreatedResponse, status_code=status.HTTP_201_CREATED)
+def create_api_key(
+    key_data: ApiKeyCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Issue a service API key (admin only). The key is shown once in the response."""
+    scopes = sorted(set(key_data.scopes))
+    invalid = [scope for scope in scopes if scope not in API_KEY_SCOPES]
+    if not scopes or invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Scopes must be a non-empty subset of: {', '.join(API_KEY_SCOPES)}"
+        )
+    if key_data.expires_in_days is not None and key_data.expires_in_days <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="expires_in_days must be positive"
+        )
+
+    owner_id = key_data.user_id if key_data.user_id is not None else current_user.id
+    owner = db.query(User).filter(User.id == owner_id).first()
+    if not owner or not owner.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="API key owner must be an active user"
+        )
+    if key_data.study_id is not None and not db.query(Study.id).filter(Study.id == key_data.study_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Study not found"
+        )
+
+    raw_key, prefix, key_hash = generate_api_key()
+    api_key = ApiKey(
+        name=key_data.name,
+        prefix=prefix,
+        key_hash=key_hash,
+        user_id=owner.id,
+        scopes=scopes,
+        study_id=key_data.study_id,
+        created_by=current_user.id,
+        expires_at=(
+            datetime.now(timezone.utc) + timedelta(days=key_data.expires_in_days)
+            if key_data.expires_in_days is not None else None
+        ),
+    )
+    db.add(api_key)
+    db.commit()
+    db.refresh(api_key)
+    response = ApiKeyResponse.model_validate(api_key).model_dump()
+    response["key"] = raw_key
+    return response
+
+
+@router.delete("/api-keys/{key_id}")
+def revoke_api_key(
+    key_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Revoke a service API key (admin only). Other workers stop accepting it within the cache TTL."""
+    api_key = db.query(ApiKey).filter(ApiKey.id == key_id).first()
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
+    if api_key.revoked_at is None:
+        api_key.revoked_at = datetime.now(timezone.utc)
+        db.commit()
+    invalidate_api_key(api_key.prefix)
+    return {"message": "API key revoked"}
+
+
+@router.post("/reencryption-jobs", response_model=ReencryptionJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def create_reencryption_job(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Re-encrypt stored payloads under the primary key after a key rotation (admin only)."""
+    job = start_reencryption_job(db, requested_by=current_user.id)
+    db.commit()
+    db.refresh(job)
+    background_tasks.add_task(run_reencryption_job, job.id)
+    return job
+
+
+@router.get("/reencryption-jobs", response_model=List[ReencryptionJobResponse])
+def list_reencryption_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Re-encryption jobs, newest first, with progress (admin only)."""
+    return db.query(ReencryptionJob).order_by(ReencryptionJob.id.desc()).all()
+
+
+@router.get("/payload-storage")
+def get_payload_storage_summary(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Submission rows per storage format and key, and how many still need normalising (admin only)."""
+    return storage_format_summary(db)
+
+
+@router.post("/payload-normalization-jobs", response_model=PayloadNormalizationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def create_payload_normalization_job(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Rewrite untagged or outdated payload rows into the configured storage format (admin only)."""
+    job = start_normalization_job(db, requested_by=current_user.id)
+    db.commit()
+    db.refresh(job)
+    background_tasks.add_task(run_normalization_job, job.id)
+    return job
+
+
+@router.get("/payload-normalization-jobs", response_model=List[PayloadNormalizationJobResponse])
+def list_payload_normalization_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Payload normalisation jobs, newest first, with progress and remaining rows (admin only)."""
+    return db.query(PayloadNormalizationJob).order_by(PayloadNormalizationJob.id.desc()).all()
+
+
+@router.get("/backfills")
+def list_backfills(current_user: User = Depends(get_current_admin_user)):
+    """Registered data backfills that can be run online (admin only)."""
+    return [{"name": backfill.name, "description": backfill.description} for backfill in BACKFILLS.values()]
+
+
+@router.post("/backfills/{name}/runs", response_model=BackfillRunResponse, status_code=status.HTTP_202_ACCEPTED)
+def create_backfill_run(
+    name: str,
+    background_tasks: BackgroundTasks,
+    max_rows_per_second: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Start a throttled, resumable run of a registered backfill (admin only)."""
+    if name not in BACKFILLS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Backfill not found"
+        )
+    if max_rows_per_second is not None and max_rows_per_second < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="max_rows_per_second must be 0 (unlimited) or positive"
+        )
+    backfill_run = start_backfill_run(
+        db, name, requested_by=current_user.id, max_rows_per_second=max_rows_per_second
+    )
+    db.commit()
+    db.refresh(backfill_run)
+    background_tasks.add_task(run_backfill, backfill_run.id)
+    return backfill_run
+
+
+@router.get("/backfill-runs", response_model=List[BackfillRunResponse])
+def list_backfill_runs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Backfill runs, newest first, with progress and rows/sec (admin only)."""
+    return db.query(BackfillRun).order_by(BackfillRun.id.desc()).all()
@@ -1,35 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from datetime import timedelta
-from app.database import get_db
+from app.database import begin_write, get_db
 from app.models import User
 from app.schemas import LoginRequest, RegisterRequest, Token, UserResponse
-from app.auth import verify_password, get_password_hash, create_access_token
+from app.auth import create_access_token
+from app.auth_cache import Principal
+from app.password_hashing import get_password_hash_async, verify_password_async
 from app.config import settings
 from app.middleware.auth_middleware import get_current_user
+from app.refresh_tokens import (
+    issue_refresh_token,
+    prune_expired_refresh_tokens,
+    revoke_refresh_token,
+    rotate_refresh_token,
+)
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
+REFRESH_COOKIE_PATH = "/api/auth"
 
-@router.post("/login", response_model=Token)
-def login(credentials: LoginRequest, db: Session = Depends(get_db)):
-    """Authenticate user; return JWT and set httpOnly cookie for browser clients."""
-    user = db.query(User).filter(User.email == credentials.email).first()
 
-    if not user or not verify_password(credentials.password, user.password_hash):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+def _cookie_security() -> dict:
+    return {
+        "httponly": True,
+        "samesite": settings.AUTH_COOKIE_SAMESITE.lower(),
+        "secure": settings.AUTH_COOKIE_SECURE or settings.is_production,
+    }
 
-    if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User account is inactive",
-        )
 
+def _session_response(user: Principal, refresh_token: str) -> JSONResponse:
+    """Issue a fresh access token; set it and the refresh token as httpOnly cookies."""
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": str(user.id), "email": user.email, "role": user.role},
@@ -42,16 +45,54 @@ def login(credentials: LoginRequest, db: Session = Depends(get_db)):
         value=access_token,
         path="/",
         max_age=max_age,
-        httponly=True,
-        samesite=settings.AUTH_COOKIE_SAMESITE.lower(),
-        secure=settings.AUTH_COOKIE_SECURE or settings.is_production,
+        **_cookie_security(),
+    )
+    response.set_cookie(
+        key=settings.REFRESH_COOKIE_NAME,
+        value=refresh_token,
+        path=REFRESH_COOKIE_PATH,
+        max_age=settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+        **_cookie_security(),
     )
     return response
 
 
-@router.post("/register", response_model=UserResponse)
-def register(user_data: RegisterRequest, db: Session = Depends(get_db)):
-    """Register first admin user (only if no users exist)"""
+def _start_session(db: Session, user_id: int) -> str:
+    begin_write(db)
+    prune_expired_refresh_tokens(db, user_id)
+    refresh_token, _ = issue_refresh_token(db, user_id)
+    db.commit()
+    return refresh_token
+
+
+@router.post("/login", response_model=Token)
+async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
+    """Authenticate user; return JWT and set httpOnly cookie for browser clients.
+
+    bcrypt runs in the bounded password hashing pool, so login bursts cannot
+    starve the request threadpool; a full pool answers 503 with Retry-After.
+    """
+    user = await run_in_threadpool(lambda: db.query(User).filter(User.email == credentials.email).first())
+
+    if not user or not await verify_password_async(credentials.password, user.password_hash):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is inactive",
+        )
+
+    principal = Principal.from_user(user)
+    refresh_token = await run_in_threadpool(_start_session, db, user.id)
+    return _session_response(principal, refresh_token)
+
+
+def _ensure_registration_open(db: Session, email: str):
     # Check if any users exist
     existing_user = db.query(User).first()
     if existing_user:
@@ -61,14 +102,15 @@ def register(user_data: RegisterRequest, db: Session = Depends(get_db)):
         )
     
     # Check if email already exists
-    if db.query(User).filter(User.email == user_data.email).first():
+    if db.query(User).filter(User.email == email).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    
-    # Create admin user
-    hashed_password = get_password_hash(user_data.password)
+
+
+def _create_first_admin(db: Session, user_data: RegisterRequest, hashed_password: str) -> User:
+    _ensure_registration_open(db, user_data.email)
     new_user = User(
         email=user_data.email,
         password_hash=hashed_password,
@@ -83,22 +125,56 @@ def register(user_data: RegisterRequest, db: Session = Depends(get_db)):
     return new_user
 
 
+@router.post("/register", response_model=UserResponse)
+async def register(user_data: RegisterRequest, db: Session = Depends(get_db)):
+    """Register first admin user (only if no users exist)"""
+    await run_in_threadpool(_ensure_registration_open, db, user_data.email)
+
+    # Create admin user (checks are repeated after hashing, right before the insert)
+    hashed_password = await get_password_hash_async(user_data.password)
+    return await run_in_threadpool(_create_first_admin, db, user_data, hashed_password)
+
+
 @router.get("/me", response_model=UserResponse)
 def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Get current authenticated user information."""
     return current_user
 
 
+@router.post("/refresh", response_model=Token)
+def refresh(request: Request, db: Session = Depends(get_db)):
+    """Exchange the refresh cookie for a new access token (no password check, no bcrypt).
+
+    The refresh token is rotated on every call; reusing an old one revokes the session.
+    """
+    raw_token = request.cookies.get(settings.REFRESH_COOKIE_NAME)
+    rotated = None
+    if raw_token:
+        # A writer from the first read: parallel tabs then queue for the lock
+        # instead of failing to upgrade a read snapshot another tab changed.
+        begin_write(db)
+        rotated = rotate_refresh_token(db, raw_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session expired, please log in again",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    principal, new_refresh_token = rotated
+    return _session_response(principal, new_refresh_token)
+
+
 @router.post("/logout")
-def logout():
-    """Clear auth cookie (for browser clients using httpOnly cookie)."""
+def logout(request: Request, db: Session = Depends(get_db)):
+    """Revoke the refresh session and clear auth cookies (for browser clients using httpOnly cookies)."""
+    raw_token = request.cookies.get(settings.REFRESH_COOKIE_NAME)
+    if raw_token:
+        begin_write(db)
+        revoke_refresh_token(db, raw_token)
+        db.commit()
+
     response = JSONResponse(content={"detail": "Logged out"})
-    response.delete_cookie(
-        key=settings.AUTH_COOKIE_NAME,
-        path="/",
-        httponly=True,
-        samesite=settings.AUTH_COOKIE_SAMESITE.lower(),
-        secure=settings.AUTH_COOKIE_SECURE or settings.is_production,
-    )
+    response.delete_cookie(key=settings.AUTH_COOKIE_NAME, path="/", **_cookie_security())
+    response.delete_cookie(key=settings.REFRESH_COOKIE_NAME, path=REFRESH_COOKIE_PATH, **_cookie_security())
     return response
-
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from typing import Any, AsyncIterator, List, Optional, Tuple
 from datetime import datetime
 import csv
 import json
 import io
-from app.database import get_db
+import time
+from app.config import settings
+from app.database import ReadSession, get_read_db, open_read_session
+from app.metrics import export_duration, export_rows
 from app.models import Submission, User
 from app.schemas import ExportRequest
 from app.middleware.auth_middleware import get_current_admin_user
+from app.api_keys import ensure_api_key_study
+from app.submission_storage import decode_submission_payloads
 
 router = APIRouter(prefix="/api/export", tags=["export"])
 
@@ -41,82 +48,156 @@ def _validate_export_dates(export_request: ExportRequest):
         )
 
 
-@router.post("/csv")
-def export_csv(
-    export_request: ExportRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
-):
-    """Export data as CSV (admin only)"""
-    _validate_export_dates(export_request)
-    query = db.query(Submission)
-    
+CSV_HEADER = [
+    "Submission ID",
+    "Form ID",
+    "Study ID",
+    "User ID",
+    "User Email",
+    "Hospital ID",
+    "Created At",
+    "Updated At",
+    "Data (JSON)",
+    "Schema Version"
+]
+
+
+def _fetch_chunk(db: Session, export_request: ExportRequest, after_id: int, limit: int) -> List[Tuple[Submission, Any]]:
+    """Next id-ordered chunk of matching submissions, each with its user (one query, no per-row lookups)."""
+    query = (
+        select(Submission, User)
+        .outerjoin(User, User.id == Submission.user_id)
+        .where(Submission.id > after_id)
+        .order_by(Submission.id)
+        .limit(limit)
+    )
     if export_request.study_id:
-        query = query.filter(Submission.study_id == export_request.study_id)
+        query = query.where(Submission.study_id == export_request.study_id)
     if export_request.form_id:
-        query = query.filter(Submission.form_id == export_request.form_id)
+        query = query.where(Submission.form_id == export_request.form_id)
     if export_request.hospital_id:
-        query = query.join(User).filter(User.hospital_id == export_request.hospital_id)
+        query = query.where(User.hospital_id == export_request.hospital_id)
     if export_request.start_date:
-        query = query.filter(Submission.created_at >= export_request.start_date)
+        query = query.where(Submission.created_at >= export_request.start_date)
     if export_request.end_date:
-        query = query.filter(Submission.created_at <= export_request.end_date)
-    
-    submissions = query.all()
-    
-    if not submissions:
+        query = query.where(Submission.created_at <= export_request.end_date)
+    rows = db.execute(query).all()
+    # Detach plain copies so the chunk can be used outside the session's thread/greenlet.
+    db.expunge_all()
+    return [(row[0], row[1]) for row in rows]
+
+
+async def _first_chunk(db: ReadSession, export_request: ExportRequest) -> List[Tuple[Submission, Any]]:
+    chunk = await db.run(_fetch_chunk, export_request, 0, settings.EXPORT_CHUNK_SIZE)
+    if not chunk:
         applied_filters = _format_filters_for_message(export_request)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No submissions found for export using filters: {applied_filters}."
         )
-    
-    # Create CSV in memory
+    return chunk
+
+
+async def _decoded_chunks(
+    export_request: ExportRequest,
+    first_chunk: List[Tuple[Submission, Any]],
+    use_replica: bool,
+) -> AsyncIterator[List[Tuple[Submission, Any, dict]]]:
+    """Yield (submission, user, data) chunks; corrupted submissions are skipped.
+
+    Later chunks are read on a session owned by the stream, since the request's
+    session may be closed before the response body is sent.
+    """
+    chunk = first_chunk
+    db = None
+    try:
+        while chunk:
+            payloads = await run_in_threadpool(
+                decode_submission_payloads, [submission for submission, _ in chunk], None
+            )
+            yield [
+                (submission, user, data_json)
+                for (submission, user), data_json in zip(chunk, payloads)
+                if data_json is not None
+            ]
+            if len(chunk) < settings.EXPORT_CHUNK_SIZE:
+                return
+            if db is None:
+                db = open_read_session(use_replica=use_replica)
+            chunk = await db.run(_fetch_chunk, export_request, chunk[-1][0].id, settings.EXPORT_CHUNK_SIZE)
+    finally:
+        if db is not None:
+            await db.close()
+
+
+def _csv_rows(rows: List[Tuple[Submission, Any, dict]]) -> str:
     output = io.StringIO()
     writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow([
-        "Submission ID",
-        "Form ID",
-        "Study ID",
-        "User ID",
-        "User Email",
-        "Hospital ID",
-        "Created At",
-        "Updated At",
-        "Data (JSON)"
-    ])
-    
-    # Write data
-    for submission in submissions:
-        try:
-            # Parse JSON data
-            if isinstance(submission.data_json, str):
-                data_json = json.loads(submission.data_json)
-            else:
-                data_json = submission.data_json if submission.data_json else {}
-            
-            user = db.query(User).filter(User.id == submission.user_id).first()
-            writer.writerow([
-                submission.id,
-                submission.form_id,
-                submission.study_id,
-                submission.user_id,
-                user.email if user else "",
-                user.hospital_id if user else "",
-                submission.created_at.isoformat() if submission.created_at else "",
-                submission.updated_at.isoformat() if submission.updated_at else "",
-                json.dumps(data_json)
-            ])
-        except Exception as e:
-            # Skip corrupted submissions
-            continue
-    
-    output.seek(0)
-    
+    for submission, user, data_json in rows:
+        writer.writerow([
+            submission.id,
+            submission.form_id,
+            submission.study_id,
+            submission.user_id,
+            user.email if user else "",
+            user.hospital_id if user else "",
+            submission.created_at.isoformat() if submission.created_at else "",
+            submission.updated_at.isoformat() if submission.updated_at else "",
+            json.dumps(data_json),
+            submission.schema_version if submission.schema_version is not None else ""
+        ])
+    return output.getvalue()
+
+
+def _json_item(submission: Submission, user, data_json: dict) -> dict:
+    return {
+        "id": submission.id,
+        "form_id": submission.form_id,
+        "study_id": submission.study_id,
+        "user": {
+            "id": submission.user_id,
+            "email": user.email if user else None,
+            "full_name": user.full_name if user else None,
+            "hospital_id": user.hospital_id if user else None
+        },
+        "schema_version": submission.schema_version,
+        "data": data_json,
+        "created_at": submission.created_at.isoformat() if submission.created_at else None,
+        "updated_at": submission.updated_at.isoformat() if submission.updated_at else None
+    }
+
+
+def _indent(text: str, prefix: str) -> str:
+    return "\n".join(prefix + line for line in text.split("\n"))
+
+
+@router.post("/csv")
+async def export_csv(
+    export_request: ExportRequest,
+    request: Request,
+    db: ReadSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Export data as CSV (admin only), streamed in chunks of EXPORT_CHUNK_SIZE submissions"""
+    started = time.perf_counter()
+    ensure_api_key_study(request, export_request.study_id)
+    _validate_export_dates(export_request)
+    first_chunk = await _first_chunk(db, export_request)
+
+    async def stream():
+        header = io.StringIO()
+        csv.writer(header).writerow(CSV_HEADER)
+        yield header.getvalue()
+        written = 0
+        async for rows in _decoded_chunks(export_request, first_chunk, db.use_replica):
+            written += len(rows)
+            yield _csv_rows(rows)
+        # Only complete exports are recorded; an aborted download never gets here.
+        export_duration.observe(time.perf_counter() - started, ("csv",))
+        export_rows.inc(("csv",), written)
+
     return StreamingResponse(
-        iter([output.getvalue()]),
+        stream(),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -125,37 +206,20 @@ def export_csv(
 
 
 @router.post("/json")
-def export_json(
+async def export_json(
     export_request: ExportRequest,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: ReadSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user)
 ):
-    """Export data as JSON (admin only)"""
+    """Export data as JSON (admin only), streamed in chunks of EXPORT_CHUNK_SIZE submissions"""
+    started = time.perf_counter()
+    ensure_api_key_study(request, export_request.study_id)
     _validate_export_dates(export_request)
-    query = db.query(Submission)
-    
-    if export_request.study_id:
-        query = query.filter(Submission.study_id == export_request.study_id)
-    if export_request.form_id:
-        query = query.filter(Submission.form_id == export_request.form_id)
-    if export_request.hospital_id:
-        query = query.join(User).filter(User.hospital_id == export_request.hospital_id)
-    if export_request.start_date:
-        query = query.filter(Submission.created_at >= export_request.start_date)
-    if export_request.end_date:
-        query = query.filter(Submission.created_at <= export_request.end_date)
-    
-    submissions = query.all()
-    
-    if not submissions:
-        applied_filters = _format_filters_for_message(export_request)
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No submissions found for export using filters: {applied_filters}."
-        )
-    
-    # Build export data
-    export_data = {
+    first_chunk = await _first_chunk(db, export_request)
+
+    # Same document as json.dumps(export_data, indent=2), written one submission at a time.
+    export_head = {
         "export_date": datetime.now().isoformat(),
         "filters": {
             "study_id": export_request.study_id,
@@ -164,41 +228,29 @@ def export_json(
             "start_date": export_request.start_date.isoformat() if export_request.start_date is not None else None,
             "end_date": export_request.end_date.isoformat() if export_request.end_date is not None else None
         },
-        "submissions": []
+        "submissions": [],
     }
-    
-    for submission in submissions:
-        try:
-            # Parse JSON data
-            if isinstance(submission.data_json, str):
-                data_json = json.loads(submission.data_json)
-            else:
-                data_json = submission.data_json if submission.data_json else {}
-            
-            user = db.query(User).filter(User.id == submission.user_id).first()
-            export_data["submissions"].append({
-                "id": submission.id,
-                "form_id": submission.form_id,
-                "study_id": submission.study_id,
-                "user": {
-                    "id": submission.user_id,
-                    "email": user.email if user else None,
-                    "full_name": user.full_name if user else None,
-                    "hospital_id": user.hospital_id if user else None
-                },
-                "data": data_json,
-                "created_at": submission.created_at.isoformat() if submission.created_at else None,
-                "updated_at": submission.updated_at.isoformat() if submission.updated_at else None
-            })
-        except Exception as e:
-            # Skip corrupted submissions
-            continue
-    
+
+    async def stream():
+        head = json.dumps(export_head, indent=2)
+        yield head[:head.rindex("[]")] + "["
+        written = 0
+        async for rows in _decoded_chunks(export_request, first_chunk, db.use_replica):
+            parts = []
+            for submission, user, data_json in rows:
+                item = _indent(json.dumps(_json_item(submission, user, data_json), indent=2), "    ")
+                parts.append(("," if written else "") + "\n" + item)
+                written += 1
+            if parts:
+                yield "".join(parts)
+        yield ("\n  ]" if written else "]") + "\n}"
+        export_duration.observe(time.perf_counter() - started, ("json",))
+        export_rows.inc(("json",), written)
+
     return StreamingResponse(
-        iter([json.dumps(export_data, indent=2)]),
+        stream(),
         media_type="application/json",
         headers={
             "Content-Disposition": f"attachment; filename=export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         }
     )
-
@@ -1,16 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
-from app.models import Form, StudyForm, User
-from app.schemas import FormCreate, FormUpdate, FormResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, defer
+from typing import List, Optional
+import json
+from app.database import ReadSession, begin_write, get_db, get_read_db
+from app.models import Form, FormVersion, StudyForm, UniqueKeyReindexJob, User
+from app.schemas import FormCreate, FormUpdate, FormResponse, FormVersionResponse, UniqueKeyReindexJobResponse
 from app.middleware.auth_middleware import get_current_admin_user, get_current_user
+from app.form_validation import FormSchemaError, schema_hash, validate_schema_definition
+from app.unique_keys import run_reindex_job, start_reindex_job, unique_field_names
+from app.form_cache import get_form_schemas, invalidate_form
 
 router = APIRouter(prefix="/api/forms", tags=["forms"])
 
 
 def validate_form_unique_key_requirements(schema_json: dict):
-    """Ensure form schema includes at least one field marked as unique_key."""
+    """Ensure form schema includes at least one unique_key field and compiles cleanly."""
     fields = schema_json.get("fields", []) if isinstance(schema_json, dict) else []
     if not isinstance(fields, list) or len(fields) == 0:
         raise HTTPException(
@@ -25,22 +30,83 @@ def validate_form_unique_key_requirements(schema_json: dict):
             detail="Form must include at least one field marked as unique key."
         )
 
+    try:
+        validate_schema_definition(schema_json)
+    except FormSchemaError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        )
 
-@router.get("", response_model=List[FormResponse])
-def list_forms(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """List forms (admin sees all, users see forms from their studies)"""
+
+def _form_response(form: Form, schema_json: dict) -> dict:
+    return {
+        "id": form.id,
+        "name": form.name,
+        "description": form.description,
+        "schema_json": schema_json,
+        "schema_version": form.schema_version or 1,
+        "schema_hash": form.schema_hash,
+        "created_by": form.created_by,
+        "created_at": form.created_at,
+    }
+
+
+def _schema_etag(form: Form) -> str:
+    return f'"{form.schema_version}-{form.schema_hash}"'
+
+
+def _ensure_form_access(db: Session, form_id: int, current_user: User):
+    """Admins see every form; users only forms assigned to a study."""
+    if current_user.role != "admin":
+        study_form = db.query(StudyForm).filter(StudyForm.form_id == form_id).first()
+        if not study_form:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions"
+            )
+
+
+def _reindex_job_response(job: UniqueKeyReindexJob) -> dict:
+    return {
+        "id": job.id,
+        "form_id": job.form_id,
+        "schema_version": job.schema_version,
+        "status": job.status,
+        "processed_count": job.processed_count or 0,
+        "missing_count": job.missing_count or 0,
+        "duplicate_count": job.duplicate_count or 0,
+        "duplicates": json.loads(job.duplicates_json) if job.duplicates_json else [],
+        "rows_per_second": job.rows_per_second,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _list_form_responses(db: Session, current_user: User) -> List[dict]:
+    # schema_json is served from the form schema cache rather than loaded per row.
+    query = db.query(Form).options(defer(Form.schema_json))
     if current_user.role == "admin":
-        forms = db.query(Form).all()
+        forms = query.all()
     else:
         # Get forms from studies (users can see forms from active studies)
         study_forms = db.query(StudyForm).join(Form).all()
         form_ids = [sf.form_id for sf in study_forms]
-        forms = db.query(Form).filter(Form.id.in_(form_ids)).all() if form_ids else []
-    
-    return forms
+        forms = query.filter(Form.id.in_(form_ids)).all() if form_ids else []
+
+    schemas = get_form_schemas(db, [(form.id, form.schema_version, form.schema_hash) for form in forms])
+    return [_form_response(form, schemas[form.id].schema_json) for form in forms if form.id in schemas]
+
+
+@router.get("", response_model=List[FormResponse])
+async def list_forms(
+    db: ReadSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List forms (admin sees all, users see forms from their studies)"""
+    return await db.run(_list_form_responses, current_user)
 
 
 @router.post("", response_model=FormResponse)
@@ -51,76 +117,208 @@ def create_form(
 ):
     """Create a new form (admin only)"""
     validate_form_unique_key_requirements(form_data.schema_json)
+    content_hash = schema_hash(form_data.schema_json)
 
     new_form = Form(
         name=form_data.name,
         description=form_data.description,
         schema_json=form_data.schema_json,
+        schema_version=1,
+        schema_hash=content_hash,
         created_by=current_user.id
     )
     
     db.add(new_form)
+    db.flush()
+    db.add(
+        FormVersion(
+            form_id=new_form.id,
+            version=1,
+            schema_json=form_data.schema_json,
+            schema_hash=content_hash,
+            created_by=current_user.id,
+        )
+    )
     db.commit()
     db.refresh(new_form)
     
     return new_form
 
 
+def _load_form(db: Session, form_id: int, current_user: User, if_none_match: Optional[str]):
+    """(etag, response body); the body is None when the client's copy is current."""
+    form = db.query(Form).options(defer(Form.schema_json)).filter(Form.id == form_id).first()
+    if not form:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Form not found"
+        )
+    
+    # Check if user has access (admin or form is in a study)
+    _ensure_form_access(db, form_id, current_user)
+
+    etag = _schema_etag(form)
+    if if_none_match == etag:
+        return etag, None
+
+    form_schema = get_form_schemas(db, [(form.id, form.schema_version, form.schema_hash)]).get(form.id)
+    return etag, _form_response(form, form_schema.schema_json if form_schema else {})
+
+
 @router.get("/{form_id}", response_model=FormResponse)
-def get_form(
+async def get_form(
+    form_id: int,
+    request: Request,
+    response: Response,
+    db: ReadSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get form schema. Honors If-None-Match with the schema ETag (version + content hash)."""
+    etag, body = await db.run(_load_form, form_id, current_user, request.headers.get("if-none-match"))
+    if body is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return body
+
+
+@router.get("/{form_id}/versions", response_model=List[FormVersionResponse])
+def list_form_versions(
     form_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get form schema"""
-    form = db.query(Form).filter(Form.id == form_id).first()
-    if not form:
+    """List all schema versions of a form, oldest first."""
+    if not db.query(Form.id).filter(Form.id == form_id).first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Form not found"
         )
-    
-    # Check if user has access (admin or form is in a study)
-    if current_user.role != "admin":
-        study_form = db.query(StudyForm).filter(StudyForm.form_id == form_id).first()
-        if not study_form:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not enough permissions"
-            )
-    
-    return form
+    _ensure_form_access(db, form_id, current_user)
+
+    return db.query(FormVersion).filter(FormVersion.form_id == form_id).order_by(FormVersion.version).all()
+
+
+@router.get("/{form_id}/versions/{version}", response_model=FormVersionResponse)
+def get_form_version(
+    form_id: int,
+    version: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the schema a form had at a given version."""
+    form_version = db.query(FormVersion).filter(
+        FormVersion.form_id == form_id,
+        FormVersion.version == version
+    ).first()
+    if not form_version:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Form version not found"
+        )
+    _ensure_form_access(db, form_id, current_user)
+
+    return form_version
 
 
 @router.put("/{form_id}", response_model=FormResponse)
 def update_form(
     form_id: int,
     form_data: FormUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
-    """Update form (admin only)"""
-    form = db.query(Form).filter(Form.id == form_id).first()
+    """Update form (admin only). Changing the unique-key fields starts an online key re-index."""
+    # The next version number is read under the write lock, so concurrent saves cannot both claim it.
+    begin_write(db)
+    form = db.query(Form).filter(Form.id == form_id).with_for_update().first()
     if not form:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Form not found"
         )
-    
+
+    reindex_job = None
     if form_data.name is not None:
         form.name = form_data.name
     if form_data.description is not None:
         form.description = form_data.description
     if form_data.schema_json is not None:
         validate_form_unique_key_requirements(form_data.schema_json)
-        form.schema_json = form_data.schema_json
+        content_hash = schema_hash(form_data.schema_json)
+        # Only a real content change creates a new immutable version.
+        if content_hash != form.schema_hash:
+            next_version = (form.schema_version or 0) + 1
+            db.add(
+                FormVersion(
+                    form_id=form.id,
+                    version=next_version,
+                    schema_json=form_data.schema_json,
+                    schema_hash=content_hash,
+                    created_by=current_user.id,
+                )
+            )
+            previous_unique_fields = unique_field_names(form.schema_json)
+            form.schema_json = form_data.schema_json
+            form.schema_version = next_version
+            form.schema_hash = content_hash
+            if unique_field_names(form_data.schema_json) != previous_unique_fields:
+                reindex_job = start_reindex_job(db, form, requested_by=current_user.id)
     
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The form was changed by another request. Reload it and try again."
+        )
+    invalidate_form(form_id)
     db.refresh(form)
+
+    if reindex_job is not None:
+        background_tasks.add_task(run_reindex_job, reindex_job.id)
     
     return form
 
 
+@router.post("/{form_id}/reindex", response_model=UniqueKeyReindexJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def reindex_form_unique_keys(
+    form_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Rebuild this form's unique keys online (admin only); replaces any job still in flight."""
+    form = db.query(Form).filter(Form.id == form_id).first()
+    if not form:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Form not found"
+        )
+
+    job = start_reindex_job(db, form, requested_by=current_user.id)
+    db.commit()
+    db.refresh(job)
+    background_tasks.add_task(run_reindex_job, job.id)
+
+    return _reindex_job_response(job)
+
+
+@router.get("/{form_id}/reindex-jobs", response_model=List[UniqueKeyReindexJobResponse])
+def list_reindex_jobs(
+    form_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Unique-key re-index jobs for a form, newest first, with progress and duplicates found (admin only)."""
+    jobs = db.query(UniqueKeyReindexJob).filter(
+        UniqueKeyReindexJob.form_id == form_id
+    ).order_by(UniqueKeyReindexJob.id.desc()).all()
+
+    return [_reindex_job_response(job) for job in jobs]
+
+
 @router.delete("/{form_id}")
 def delete_form(
     form_id: int,
@@ -144,6 +342,7 @@ def delete_form(
     
     db.delete(form)
     db.commit()
+    invalidate_form(form_id)
     
     return {"message": "Form deleted successfully"}
 
@@ -0,0 +1,135 @@
+import ipaddress
+from typing import Iterable
+
+import anyio.to_thread
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.orm import Session
+
+from app.cache import all_cache_stats
+from app.config import settings
+from app.database import get_db, pool_stats, replica_engine, replica_stats
+from app.metrics import CONTENT_TYPE, Family, gauge_family, register_collector, render
+from app.middleware.auth_middleware import get_current_admin_user, get_current_user
+from app.password_hashing import password_pool
+from app.write_queue import write_queue_stats
+
+router = APIRouter(tags=["metrics"])
+
+_allowed_networks = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in settings.METRICS_ALLOWED_NETWORKS.split(",")
+    if network.strip()
+]
+
+
+def _from_allowed_network(request: Request) -> bool:
+    if request.client is None:
+        return False
+    try:
+        address = ipaddress.ip_address(request.client.host)
+    except ValueError:
+        return False
+    return any(address in network for network in _allowed_networks)
+
+
+def require_metrics_access(request: Request, db: Session = Depends(get_db)) -> None:
+    """Scrapers from METRICS_ALLOWED_NETWORKS get in directly; anyone else must be an admin."""
+    if not _from_allowed_network(request):
+        get_current_admin_user(get_current_user(request, db))
+
+
+def _seconds(milliseconds):
+    return round(milliseconds / 1000, 6) if milliseconds is not None else None
+
+
+def _pool_families() -> Iterable[Family]:
+    pools = [("primary", pool_stats())]
+    if replica_engine is not None:
+        pools.append(("replica", pool_stats(replica_engine)))
+    yield gauge_family("db_pool_connections_checked_out", "Pooled connections currently in use.",
+                       (({"engine": name}, stats.get("checked_out")) for name, stats in pools))
+    yield gauge_family("db_pool_size", "Configured pool size (overflow not included).",
+                       (({"engine": name}, stats.get("pool_size")) for name, stats in pools))
+    yield gauge_family("db_pool_overflow", "Connections open beyond the pool size.",
+                       (({"engine": name}, stats.get("overflow")) for name, stats in pools))
+    yield gauge_family("db_pool_checkouts_total", "Connection checkouts.",
+                       (({"engine": name}, stats.get("checkouts")) for name, stats in pools), kind="counter")
+    yield gauge_family("db_pool_timeouts_total", "Checkouts that timed out waiting for a connection.",
+                       (({"engine": name}, stats.get("timeouts")) for name, stats in pools), kind="counter")
+    yield gauge_family("db_pool_connects_total", "New database connections opened.",
+                       (({"engine": name}, stats["connects"]) for name, stats in pools), kind="counter")
+    yield gauge_family("db_pool_invalidations_total", "Connections invalidated after errors.",
+                       (({"engine": name}, stats["invalidations"]) for name, stats in pools), kind="counter")
+    yield gauge_family(
+        "db_pool_checkout_wait_seconds", "Recent checkout wait percentiles.",
+        (({"engine": name, "quantile": quantile}, _seconds(stats.get(key)))
+         for name, stats in pools for quantile, key in (("0.5", "wait_ms_p50"), ("0.95", "wait_ms_p95"))),
+    )
+    if replica_engine is not None and replica_engine.dialect.name == "postgresql":
+        yield gauge_family("db_replica_lag_seconds", "Replay lag of the read replica.",
+                           [({}, replica_stats()["lag_seconds"])])
+
+
+def _cache_families() -> Iterable[Family]:
+    caches = all_cache_stats()
+    for name, key, documentation in (
+        ("cache_hits_total", "hits", "In-process cache hits."),
+        ("cache_misses_total", "misses", "In-process cache misses."),
+        ("cache_evictions_total", "evictions", "Entries evicted to make room."),
+        ("cache_expirations_total", "expirations", "Entries dropped after their TTL."),
+    ):
+        yield gauge_family(name, documentation, (({"cache": c["name"]}, c[key]) for c in caches), kind="counter")
+    yield gauge_family("cache_entries", "Entries currently cached.", (({"cache": c["name"]}, c["size"]) for c in caches))
+
+
+def _password_hashing_families() -> Iterable[Family]:
+    stats = password_pool.stats()
+    yield gauge_family("password_hash_running", "bcrypt operations running.", [({}, stats["running"])])
+    yield gauge_family("password_hash_queue_depth", "bcrypt operations waiting for a worker.",
+                       [({}, stats["queue_depth"])])
+    yield gauge_family("password_hash_completed_total", "bcrypt operations completed.",
+                       [({}, stats["completed"])], kind="counter")
+    yield gauge_family("password_hash_rejected_total", "Logins shed with 503 because the bcrypt queue was full.",
+                       [({}, stats["rejected"])], kind="counter")
+    yield gauge_family(
+        "password_hash_seconds", "Recent bcrypt duration percentiles.",
+        [({"quantile": "0.5"}, _seconds(stats["hash_ms_p50"])), ({"quantile": "0.95"}, _seconds(stats["hash_ms_p95"]))],
+    )
+
+
+def _write_queue_families() -> Iterable[Family]:
+    stats = write_queue_stats()
+    if not stats.get("enabled") or "queue_depth" not in stats:
+        return
+    yield gauge_family("write_queue_depth", "Writes waiting for the SQLite writer.", [({}, stats["queue_depth"])])
+    for name, key, documentation in (
+        ("write_queue_writes_total", "writes", "Writes group-committed by the SQLite writer."),
+        ("write_queue_batches_total", "batches", "Group commits."),
+        ("write_queue_write_errors_total", "write_errors", "Writes that failed and were rolled back."),
+        ("write_queue_commit_errors_total", "commit_errors", "Group commits that failed and were replayed one by one."),
+        ("write_queue_timeouts_total", "timeouts", "Writes answered 503 after waiting too long."),
+    ):
+        yield gauge_family(name, documentation, [({}, stats[key])], kind="counter")
+
+
+def _threadpool_families() -> Iterable[Family]:
+    # Called from the async /metrics handler, on the event loop that owns the limiter.
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    statistics = limiter.statistics()
+    yield gauge_family("threadpool_threads_limit", "Threads available to sync endpoints and dependencies.",
+                       [({}, limiter.total_tokens)])
+    yield gauge_family("threadpool_threads_busy", "Threads currently running sync work.",
+                       [({}, statistics.borrowed_tokens)])
+    yield gauge_family("threadpool_tasks_waiting", "Sync calls waiting for a free thread.",
+                       [({}, statistics.tasks_waiting)])
+
+
+for _collector in (_pool_families, _cache_families, _password_hashing_families, _write_queue_families,
+                   _threadpool_families):
+    register_collector(_collector)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(_: None = Depends(require_metrics_access)):
+    """Prometheus text metrics for this worker process."""
+    return Response(render(), headers={"Content-Type": CONTENT_TYPE})
@@ -1,24 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
+from starlette.concurrency import run_in_threadpool
 from typing import List
-import json
-from app.database import get_db
-from app.models import Study, Form, StudyForm, User, Submission
+import time
+from app.database import ReadSession, get_db, get_read_db
+from app.models import ApiKey, Study, Form, StudyForm, User, Submission
 from app.schemas import StudyCreate, StudyUpdate, StudyResponse, StudyWithForms
 from app.middleware.auth_middleware import get_current_admin_user, get_current_user
+from app.submission_storage import decode_submission_payloads
+from app.api_keys import invalidate_api_key
+from app.metrics import study_profile_duration
 
 router = APIRouter(prefix="/api/studies", tags=["studies"])
 
 
-@router.get("", response_model=List[StudyResponse])
-def list_studies(
-    include_closed_canceled: bool = False,
-    include_archived: bool = False,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """List studies filtered by role and lifecycle status."""
+def _query_studies(db: Session, current_user: User, include_closed_canceled: bool, include_archived: bool) -> List[Study]:
     query = db.query(Study)
     show_all_statuses = include_closed_canceled or include_archived
 
@@ -30,8 +27,18 @@ def list_studies(
         # Regular users only see ongoing studies.
         query = query.filter(or_(Study.status.in_(["Data Collection", "Analysis"]), Study.status.is_(None)))
 
-    studies = query.all()
-    return studies
+    return query.all()
+
+
+@router.get("", response_model=List[StudyResponse])
+async def list_studies(
+    include_closed_canceled: bool = False,
+    include_archived: bool = False,
+    db: ReadSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List studies filtered by role and lifecycle status."""
+    return await db.run(_query_studies, current_user, include_closed_canceled, include_archived)
 
 
 @router.post("", response_model=StudyResponse)
@@ -195,13 +202,8 @@ def unarchive_study(
     return study
 
 
-@router.get("/{study_id}", response_model=StudyWithForms)
-def get_study(
-    study_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get study with associated forms"""
+def _load_study(db: Session, study_id: int):
+    """Study, its forms, per-form submission aggregates and the submissions to profile."""
     study = db.query(Study).filter(Study.id == study_id).first()
     if not study:
         raise HTTPException(
@@ -224,17 +226,30 @@ def get_study(
         Submission.study_id == study_id,
         Submission.form_id.in_(form_ids) if form_ids else False
     ).group_by(Submission.form_id).all()
-    profile_by_form_id = {row.form_id: row for row in submission_profile_rows}
 
-    # Completion profiling using required fields in each form schema.
-    submissions_by_form_id = {}
+    all_submissions = []
     if form_ids:
         all_submissions = db.query(Submission).filter(
             Submission.study_id == study_id,
             Submission.form_id.in_(form_ids)
         ).all()
-        for submission in all_submissions:
-            submissions_by_form_id.setdefault(submission.form_id, []).append(submission)
+    return study, forms, submission_profile_rows, all_submissions
+
+
+def _study_with_forms(study: Study, forms: List[Form], submission_profile_rows, all_submissions: List[Submission]) -> dict:
+    """Serialize a study with per-form completion and dataframe profiles (CPU-bound; no queries)."""
+    profile_by_form_id = {row.form_id: row for row in submission_profile_rows}
+
+    # Completion profiling using required fields in each form schema.
+    submissions_by_form_id = {}
+    for submission in all_submissions:
+        submissions_by_form_id.setdefault(submission.form_id, []).append(submission)
+
+    # Decode every payload once (decrypting in parallel batches when encrypted at rest).
+    payload_by_submission_id = dict(zip(
+        [submission.id for submission in all_submissions],
+        decode_submission_payloads(all_submissions),
+    ))
 
     def _is_filled(value):
         if value is None:
@@ -251,23 +266,15 @@ def get_study(
             if isinstance(field, dict) and field.get("required") is True and field.get("name")
         ]
 
-    def _parse_submission_payload(raw_payload):
-        if isinstance(raw_payload, dict):
-            return raw_payload
-        if isinstance(raw_payload, str):
-            try:
-                parsed = json.loads(raw_payload)
-                return parsed if isinstance(parsed, dict) else {}
-            except Exception:
-                return {}
-        return {}
+    def _submission_payload(submission):
+        return payload_by_submission_id.get(submission.id, {})
 
     def _build_dataframe_profile(form_schema_json, form_submissions):
         schema = form_schema_json if isinstance(form_schema_json, dict) else {}
         fields = schema.get("fields", []) if isinstance(schema, dict) else []
         total_submissions = len(form_submissions)
 
-        parsed_payloads = [_parse_submission_payload(submission.data_json) for submission in form_submissions]
+        parsed_payloads = [_submission_payload(submission) for submission in form_submissions]
 
         field_profiles = []
         for field in fields:
@@ -334,7 +341,7 @@ def get_study(
                     1
                     for submission in submissions_by_form_id.get(form.id, [])
                     if all(
-                        _is_filled(_parse_submission_payload(submission.data_json).get(required_field))
+                        _is_filled(_submission_payload(submission).get(required_field))
                         for required_field in _get_required_fields(form.schema_json if isinstance(form.schema_json, dict) else {})
                     )
                 ),
@@ -345,7 +352,7 @@ def get_study(
                                 1
                                 for submission in submissions_by_form_id.get(form.id, [])
                                 if all(
-                                    _is_filled(_parse_submission_payload(submission.data_json).get(required_field))
+                                    _is_filled(_submission_payload(submission).get(required_field))
                                     for required_field in _get_required_fields(form.schema_json if isinstance(form.schema_json, dict) else {})
                                 )
                             )
@@ -387,6 +394,20 @@ def get_study(
     return study_dict
 
 
+@router.get("/{study_id}", response_model=StudyWithForms)
+async def get_study(
+    study_id: int,
+    db: ReadSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get study with associated forms"""
+    study, forms, submission_profile_rows, all_submissions = await db.run(_load_study, study_id)
+    started = time.perf_counter()
+    result = await run_in_threadpool(_study_with_forms, study, forms, submission_profile_rows, all_submissions)
+    study_profile_duration.observe(time.perf_counter() - started)
+    return result
+
+
 @router.put("/{study_id}", response_model=StudyResponse)
 def update_study(
     study_id: int,
@@ -469,9 +490,17 @@ def delete_study(
             detail=f"Cannot delete study with {submission_count} submission(s). Please set status to Closed or Canceled instead."
         )
     
+    # API keys limited to this study cannot outlive it (widening them to every study is not an option)
+    key_prefixes = [
+        prefix for (prefix,) in db.query(ApiKey.prefix).filter(ApiKey.study_id == study_id).all()
+    ]
+    db.query(ApiKey).filter(ApiKey.study_id == study_id).delete(synchronize_session=False)
+
     # Delete study (cascade will handle StudyForm relationships)
     db.delete(study)
     db.commit()
+    for prefix in key_prefixes:
+        invalidate_api_key(prefix)
     
     return {"message": "Study deleted successfully"}
 
@@ -1,69 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from datetime import datetime, timezone
-import json
-from app.database import get_db
-from app.models import Submission, Form, Study, StudyForm, User, SubmissionUniqueKey
+from starlette.concurrency import run_in_threadpool
+from app.database import ReadSession, begin_write, get_db, get_read_db, mark_recent_write
+from app.models import Submission, Study, StudyForm, User, SubmissionUniqueKey
 from app.schemas import SubmissionCreate, SubmissionUpdate, SubmissionResponse
+from app.form_cache import CachedFormSchema, get_form_schema
+from app.unique_keys import UniqueKeyError, build_unique_key_entries
+from app.submission_storage import EncodedPayload, decode_submission_payload, decode_submission_payloads, encode_payload
+from app.write_queue import WriteQueueBusy, get_write_coordinator
 from app.middleware.auth_middleware import get_current_user
+from app.api_keys import ensure_api_key_study
 
-router = APIRouter(prefix="/api/submissions", tags=["submissions"])
-
-
-def _normalize_unique_value(value) -> str:
-    """Normalize values so uniqueness checks are consistent."""
-    if isinstance(value, str):
-        return value.strip()
-    return str(value).strip()
+logger = logging.getLogger(__name__)
 
+router = APIRouter(prefix="/api/submissions", tags=["submissions"])
 
-def _extract_unique_key_entries(form: Form, data_json: dict) -> List[dict]:
-    fields = form.schema_json.get("fields", []) if isinstance(form.schema_json, dict) else []
-    unique_fields = [field for field in fields if isinstance(field, dict) and field.get("unique_key") is True]
 
-    if len(unique_fields) == 0:
+def _validate_submission_data(form_schema: CachedFormSchema, data_json: dict):
+    """Reject payloads that do not satisfy the form schema (types, options, required, bounds, pattern)."""
+    if form_schema.compiled is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="This form is invalid: no unique key field is configured. Please contact an administrator."
+            detail=f"This form is invalid: {form_schema.error}. Please contact an administrator."
         )
 
-    normalized_parts = []
-    labels = []
-    field_names = []
-
-    for field in unique_fields:
-        field_name = field.get("name")
-        label = field.get("label") or field_name
-        raw_value = data_json.get(field_name)
-
-        if raw_value is None or _normalize_unique_value(raw_value) == "":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Unique key field '{label}' is required and cannot be empty."
-            )
-
-        normalized_parts.append(_normalize_unique_value(raw_value))
-        labels.append(label)
-        field_names.append(field_name)
+    errors = form_schema.compiled.validate(data_json)
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid submission data: " + "; ".join(errors)
+        )
 
-    # Single unique key field: keep one-field behavior.
-    if len(unique_fields) == 1:
-        return [{
-            "key_name": field_names[0],
-            "key_value": normalized_parts[0],
-            "label": labels[0],
-            "display_value": normalized_parts[0],
-        }]
 
-    # Multiple unique key fields: enforce uniqueness on composed key combination.
-    return [{
-        "key_name": f"__composite__:{'|'.join(field_names)}",
-        "key_value": json.dumps(normalized_parts, ensure_ascii=False, separators=(",", ":")),
-        "label": " + ".join(labels),
-        "display_value": " + ".join(normalized_parts),
-    }]
+def _extract_unique_key_entries(form_schema: CachedFormSchema, data_json: dict) -> List[dict]:
+    try:
+        return build_unique_key_entries(form_schema.compiled.unique_key_fields, data_json)
+    except UniqueKeyError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        )
 
 
 def _ensure_unique_values_available(
@@ -89,14 +69,72 @@ def _ensure_unique_values_available(
             )
 
 
-@router.get("", response_model=List[SubmissionResponse])
-def list_submissions(
-    study_id: Optional[int] = None,
-    form_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """List submissions (filtered by user/study)"""
+def _insert_submission(
+    db: Session,
+    submission_data: SubmissionCreate,
+    user_id: int,
+    schema_version: Optional[int],
+    encoded: EncodedPayload,
+    unique_entries: List[dict],
+) -> Submission:
+    """Add a submission and its unique keys (flushed, not committed)."""
+    new_submission = Submission(
+        form_id=submission_data.form_id,
+        study_id=submission_data.study_id,
+        user_id=user_id,
+        data_json=encoded.data_json,
+        data_format=encoded.data_format,
+        data_key_id=encoded.data_key_id,
+        schema_version=schema_version,
+        updated_at=datetime.now(timezone.utc)
+    )
+    db.add(new_submission)
+    db.flush()
+
+    for entry in unique_entries:
+        db.add(
+            SubmissionUniqueKey(
+                submission_id=new_submission.id,
+                form_id=submission_data.form_id,
+                key_name=entry["key_name"],
+                key_value=entry["key_value"],
+            )
+        )
+    db.flush()
+    return new_submission
+
+
+def _replace_submission_data(
+    db: Session,
+    submission: Submission,
+    schema_version: Optional[int],
+    encoded: EncodedPayload,
+    unique_entries: List[dict],
+) -> None:
+    """Store new data on a submission and swap its unique keys (flushed, not committed)."""
+    submission.data_json = encoded.data_json
+    submission.data_format = encoded.data_format
+    submission.data_key_id = encoded.data_key_id
+    submission.schema_version = schema_version
+    submission.updated_at = datetime.now(timezone.utc)
+    db.flush()
+    db.query(SubmissionUniqueKey).filter(
+        SubmissionUniqueKey.submission_id == submission.id
+    ).delete(synchronize_session=False)
+
+    for entry in unique_entries:
+        db.add(
+            SubmissionUniqueKey(
+                submission_id=submission.id,
+                form_id=submission.form_id,
+                key_name=entry["key_name"],
+                key_value=entry["key_value"],
+            )
+        )
+    db.flush()
+
+
+def _query_submissions(db: Session, current_user: User, study_id: Optional[int], form_id: Optional[int]) -> List[Submission]:
     query = db.query(Submission)
     
     if current_user.role != "admin":
@@ -108,28 +146,30 @@ def list_submissions(
     if form_id:
         query = query.filter(Submission.form_id == form_id)
     
-    submissions = query.all()
+    return query.all()
+
+
+@router.get("", response_model=List[SubmissionResponse])
+async def list_submissions(
+    study_id: Optional[int] = None,
+    form_id: Optional[int] = None,
+    db: ReadSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List submissions (filtered by user/study)"""
+    submissions = await db.run(_query_submissions, current_user, study_id, form_id)
     
-    # Parse submission data as JSON
+    # Decode stored payloads (plain JSON or encrypted); unreadable rows come back as {}
+    payloads = await run_in_threadpool(decode_submission_payloads, submissions)
     result = []
-    for submission in submissions:
-        try:
-            # Parse JSON data (handle both encrypted legacy data and plain JSON)
-            if isinstance(submission.data_json, str):
-                data_json = json.loads(submission.data_json)
-            else:
-                data_json = submission.data_json if submission.data_json else {}
-        except (json.JSONDecodeError, TypeError):
-            # If parsing fails, try to handle legacy encrypted data gracefully
-            # For now, return empty dict for corrupted data
-            data_json = {}
-        
+    for submission, data_json in zip(submissions, payloads):
         result.append({
             "id": submission.id,
             "form_id": submission.form_id,
             "study_id": submission.study_id,
             "user_id": submission.user_id,
             "data_json": data_json,
+            "schema_version": submission.schema_version,
             "created_at": submission.created_at,
             "updated_at": submission.updated_at
         })
@@ -140,13 +180,18 @@ def list_submissions(
 @router.post("", response_model=SubmissionResponse)
 def create_submission(
     submission_data: SubmissionCreate,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new submission"""
-    # Verify form exists
-    form = db.query(Form).filter(Form.id == submission_data.form_id).first()
-    if not form:
+    ensure_api_key_study(request, submission_data.study_id)
+    write_queue = get_write_coordinator()
+    if write_queue is None:
+        begin_write(db)
+    # Verify form exists (schema comes from the per-process form schema cache)
+    form_schema = get_form_schema(db, submission_data.form_id)
+    if not form_schema:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Form not found"
@@ -179,59 +224,54 @@ def create_submission(
             detail="Form is not assigned to this study"
         )
 
-    unique_entries = _extract_unique_key_entries(form, submission_data.data_json)
+    _validate_submission_data(form_schema, submission_data.data_json)
+    unique_entries = _extract_unique_key_entries(form_schema, submission_data.data_json)
     _ensure_unique_values_available(
         db=db,
         form_id=submission_data.form_id,
         unique_entries=unique_entries
     )
     
+    # Store submission data in the configured format (JSON, optionally compressed/encrypted)
+    encoded = encode_payload(submission_data.data_json)
     try:
-        # Store submission data as JSON string
-        data_json_str = json.dumps(submission_data.data_json)
-        
-        new_submission = Submission(
-            form_id=submission_data.form_id,
-            study_id=submission_data.study_id,
-            user_id=current_user.id,
-            data_json=data_json_str,
-            updated_at=datetime.now(timezone.utc)
-        )
-        
-        db.add(new_submission)
-        db.flush()
-
-        for entry in unique_entries:
-            db.add(
-                SubmissionUniqueKey(
-                    submission_id=new_submission.id,
-                    form_id=submission_data.form_id,
-                    key_name=entry["key_name"],
-                    key_value=entry["key_value"],
+        if write_queue is not None:
+            # Reads are done; only the inserts go through the group-commit writer.
+            db.rollback()
+
+            def write(writer_db: Session) -> Submission:
+                created = _insert_submission(
+                    writer_db, submission_data, current_user.id, form_schema.version, encoded, unique_entries
                 )
-            )
+                writer_db.refresh(created)
+                return created
 
-        db.commit()
-        db.refresh(new_submission)
+            new_submission = write_queue.submit(write)
+            mark_recent_write(current_user.id)
+        else:
+            new_submission = _insert_submission(
+                db, submission_data, current_user.id, form_schema.version, encoded, unique_entries
+            )
+            db.commit()
+            db.refresh(new_submission)
     except IntegrityError:
         db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Duplicate value detected for a unique key field."
         )
-    except Exception as e:
+    except WriteQueueBusy:
+        raise
+    except Exception:
         db.rollback()
-        print(f"Database error creating submission: {e}")  # Debug logging
+        logger.exception("Could not save a submission for form %s", submission_data.form_id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to save submission: {str(e)}"
+            detail="Failed to save submission"
         )
     
-    # Parse the stored JSON data for response
-    try:
-        data_json = json.loads(new_submission.data_json) if isinstance(new_submission.data_json, str) else new_submission.data_json
-    except (json.JSONDecodeError, TypeError):
-        data_json = {}
+    # Parse the stored data for response
+    data_json = decode_submission_payload(new_submission)
     
     return {
         "id": new_submission.id,
@@ -239,25 +279,33 @@ def create_submission(
         "study_id": new_submission.study_id,
         "user_id": new_submission.user_id,
         "data_json": data_json,
+        "schema_version": new_submission.schema_version,
         "created_at": new_submission.created_at,
         "updated_at": new_submission.updated_at
     }
 
 
+def _get_submission_row(db: Session, submission_id: int) -> Optional[Submission]:
+    return db.query(Submission).filter(Submission.id == submission_id).first()
+
+
 @router.get("/{submission_id}", response_model=SubmissionResponse)
-def get_submission(
+async def get_submission(
     submission_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: ReadSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get submission details"""
-    submission = db.query(Submission).filter(Submission.id == submission_id).first()
+    submission = await db.run(_get_submission_row, submission_id)
     if not submission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Submission not found"
         )
     
+    ensure_api_key_study(request, submission.study_id)
+
     # Check permissions
     if current_user.role != "admin" and submission.user_id != current_user.id:
         raise HTTPException(
@@ -265,15 +313,8 @@ def get_submission(
             detail="Not enough permissions"
         )
     
-    # Parse JSON data
-    try:
-        if isinstance(submission.data_json, str):
-            data_json = json.loads(submission.data_json)
-        else:
-            data_json = submission.data_json if submission.data_json else {}
-    except (json.JSONDecodeError, TypeError):
-        # Handle legacy encrypted data or corrupted data gracefully
-        data_json = {}
+    # Parse stored data (plain JSON or encrypted; corrupted rows give {})
+    data_json = decode_submission_payload(submission)
     
     return {
         "id": submission.id,
@@ -281,6 +322,7 @@ def get_submission(
         "study_id": submission.study_id,
         "user_id": submission.user_id,
         "data_json": data_json,
+        "schema_version": submission.schema_version,
         "created_at": submission.created_at,
         "updated_at": submission.updated_at
     }
@@ -289,11 +331,15 @@ def get_submission(
 @router.put("/{submission_id}", response_model=SubmissionResponse)
 def update_submission(
     submission_id: int,
+    request: Request,
     submission_data: SubmissionUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update submission"""
+    write_queue = get_write_coordinator() if submission_data.data_json is not None else None
+    if write_queue is None:
+        begin_write(db)
     submission = db.query(Submission).filter(Submission.id == submission_id).first()
     if not submission:
         raise HTTPException(
@@ -301,6 +347,8 @@ def update_submission(
             detail="Submission not found"
         )
     
+    ensure_api_key_study(request, submission.study_id)
+
     # Check permissions
     if current_user.role != "admin" and submission.user_id != current_user.id:
         raise HTTPException(
@@ -309,14 +357,15 @@ def update_submission(
         )
     
     if submission_data.data_json is not None:
-        form = db.query(Form).filter(Form.id == submission.form_id).first()
-        if not form:
+        form_schema = get_form_schema(db, submission.form_id)
+        if not form_schema:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Form not found"
             )
 
-        unique_entries = _extract_unique_key_entries(form, submission_data.data_json)
+        _validate_submission_data(form_schema, submission_data.data_json)
+        unique_entries = _extract_unique_key_entries(form_schema, submission_data.data_json)
         _ensure_unique_values_available(
             db=db,
             form_id=submission.form_id,
@@ -324,27 +373,32 @@ def update_submission(
             exclude_submission_id=submission.id
         )
 
-        # Store submission data as JSON string
-        submission.data_json = json.dumps(submission_data.data_json)
-        submission.updated_at = datetime.now(timezone.utc)
-        db.flush()
-        db.query(SubmissionUniqueKey).filter(
-            SubmissionUniqueKey.submission_id == submission.id
-        ).delete(synchronize_session=False)
-
-        for entry in unique_entries:
-            db.add(
-                SubmissionUniqueKey(
-                    submission_id=submission.id,
-                    form_id=submission.form_id,
-                    key_name=entry["key_name"],
-                    key_value=entry["key_value"],
-                )
-            )
+        # Store submission data in the configured format (JSON, optionally compressed/encrypted)
+        encoded = encode_payload(submission_data.data_json)
+        if write_queue is None:
+            _replace_submission_data(db, submission, form_schema.version, encoded, unique_entries)
 
     try:
-        db.commit()
-        db.refresh(submission)
+        if write_queue is not None:
+            db.rollback()
+
+            def write(writer_db: Session) -> Optional[Submission]:
+                target = writer_db.query(Submission).filter(Submission.id == submission_id).first()
+                if target is not None:
+                    _replace_submission_data(writer_db, target, form_schema.version, encoded, unique_entries)
+                    writer_db.refresh(target)
+                return target
+
+            submission = write_queue.submit(write)
+            mark_recent_write(current_user.id)
+            if submission is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Submission not found"
+                )
+        else:
+            db.commit()
+            db.refresh(submission)
     except IntegrityError:
         db.rollback()
         raise HTTPException(
@@ -352,11 +406,8 @@ def update_submission(
             detail="Duplicate value detected for a unique key field."
         )
     
-    # Parse the stored JSON data for response
-    try:
-        data_json = json.loads(submission.data_json) if isinstance(submission.data_json, str) else submission.data_json
-    except (json.JSONDecodeError, TypeError):
-        data_json = {}
+    # Parse the stored data for response
+    data_json = decode_submission_payload(submission)
     
     return {
         "id": submission.id,
@@ -364,6 +415,7 @@ def update_submission(
         "study_id": submission.study_id,
         "user_id": submission.user_id,
         "data_json": data_json,
+        "schema_version": submission.schema_version,
         "created_at": submission.created_at,
         "updated_at": submission.updated_at
     }
@@ -376,6 +428,7 @@ def delete_submission(
     current_user: User = Depends(get_current_user)
 ):
     """Delete submission"""
+    begin_write(db)
     submission = db.query(Submission).filter(Submission.id == submission_id).first()
     if not submission:
         raise HTTPException(
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.database import get_db
 from app.models import User
 from app.schemas import UserCreate, UserUpdate, UserResponse
-from app.auth import get_password_hash
+from app.password_hashing import get_password_hash_async
+from app.auth_cache import invalidate_user
+from app.refresh_tokens import revoke_user_refresh_tokens
 from app.middleware.auth_middleware import get_current_admin_user, get_current_user
 
 router = APIRouter(prefix="/api/users", tags=["users"])
@@ -20,21 +23,16 @@ def list_users(
     return users
 
 
-@router.post("", response_model=UserResponse)
-def create_user(
-    user_data: UserCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
-):
-    """Create a new user (admin only)"""
-    # Check if email already exists
-    if db.query(User).filter(User.email == user_data.email).first():
+def _ensure_email_available(db: Session, email: str):
+    if db.query(User).filter(User.email == email).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    
-    hashed_password = get_password_hash(user_data.password)
+
+
+def _insert_user(db: Session, user_data: UserCreate, hashed_password: str) -> User:
+    _ensure_email_available(db, user_data.email)
     new_user = User(
         email=user_data.email,
         password_hash=hashed_password,
@@ -50,6 +48,20 @@ def create_user(
     return new_user
 
 
+@router.post("", response_model=UserResponse)
+async def create_user(
+    user_data: UserCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Create a new user (admin only)"""
+    # Check if email already exists (again inside the insert, after hashing)
+    await run_in_threadpool(_ensure_email_available, db, user_data.email)
+
+    hashed_password = await get_password_hash_async(user_data.password)
+    return await run_in_threadpool(_insert_user, db, user_data, hashed_password)
+
+
 @router.get("/{user_id}", response_model=UserResponse)
 def get_user(
     user_id: int,
@@ -74,20 +86,18 @@ def get_user(
     return user
 
 
-@router.put("/{user_id}", response_model=UserResponse)
-def update_user(
-    user_id: int,
-    user_data: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
-):
-    """Update user (admin only)"""
+def _get_user_or_404(db: Session, user_id: int) -> User:
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    return user
+
+
+def _apply_user_update(db: Session, user_id: int, user_data: UserUpdate, password_hash: Optional[str]) -> User:
+    user = _get_user_or_404(db, user_id)
     
     # Check email uniqueness if updating email
     if user_data.email and user_data.email != user.email:
@@ -106,15 +116,35 @@ def update_user(
         user.hospital_id = user_data.hospital_id
     if user_data.is_active is not None:
         user.is_active = user_data.is_active
-    if user_data.password:
-        user.password_hash = get_password_hash(user_data.password)
+    if password_hash:
+        user.password_hash = password_hash
+    if password_hash or user_data.is_active is False:
+        # Force re-login everywhere after a password reset or deactivation.
+        revoke_user_refresh_tokens(db, user.id)
     
     db.commit()
+    invalidate_user(user_id)
     db.refresh(user)
     
     return user
 
 
+@router.put("/{user_id}", response_model=UserResponse)
+async def update_user(
+    user_id: int,
+    user_data: UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Update user (admin only)"""
+    password_hash = None
+    if user_data.password:
+        # Unknown ids answer 404 without taking a slot in the password hashing pool.
+        await run_in_threadpool(_get_user_or_404, db, user_id)
+        password_hash = await get_password_hash_async(user_data.password)
+    return await run_in_threadpool(_apply_user_update, db, user_id, user_data, password_hash)
+
+
 @router.delete("/{user_id}")
 def delete_user(
     user_id: int,
@@ -136,7 +166,9 @@ def delete_user(
         )
     
     user.is_active = False
+    revoke_user_refresh_tokens(db, user.id)
     db.commit()
+    invalidate_user(user_id)
     
     return {"message": "User deactivated successfully"}
 
@@ -0,0 +1,210 @@
+"""Service API keys for ETL, monitoring and other machine clients.
+
+A key looks like ``mrc_<prefix>_<secret>``. The prefix is stored in clear and
+indexed, so a lookup is one equality query. The secret is checked against an
+HMAC-SHA256 keyed with ``SECRET_KEY``; this is safe because the secret is 256
+random bits, so it needs no bcrypt. Verified keys are cached per worker for
+``API_KEY_CACHE_TTL_SECONDS``; after the first request a key costs a dict
+lookup and one HMAC.
+
+A key acts as its owning user and can never do more than that user. Its scopes
+narrow that further:
+
+- ``read``: GET requests (except user and admin management);
+- ``submit``: create and update submissions;
+- ``export``: the CSV/JSON export endpoints.
+
+A key with ``study_id`` set only reaches the routes in ``_STUDY_ROUTES``. The
+study is checked either from the path/query (``"param"``) or by the endpoint
+once it knows the study (``"endpoint"``: a body field or the loaded submission).
+"""
+import hashlib
+import hmac
+import secrets
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import FrozenSet, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy.orm import Session
+
+from app.cache import LRUCache
+from app.config import settings
+from app.models import ApiKey
+
+API_KEY_PREFIX = "mrc_"
+API_KEY_HEADER = "X-API-Key"
+API_KEY_SCOPES = ("read", "submit", "export")
+
+# Never reachable with an API key, whatever its scopes (keys cannot mint keys).
+_FORBIDDEN_PATHS = ("/api/admin", "/api/users", "/api/auth/login", "/api/auth/refresh", "/api/auth/register")
+
+# (method, route template) -> how a study-limited key's study is checked.
+_STUDY_ROUTES = {
+    ("GET", "/api/auth/me"): None,
+    ("GET", "/api/studies/{study_id}"): "param",
+    ("GET", "/api/submissions"): "param",
+    ("POST", "/api/submissions"): "endpoint",
+    ("GET", "/api/submissions/{submission_id}"): "endpoint",
+    ("PUT", "/api/submissions/{submission_id}"): "endpoint",
+    ("POST", "/api/export/csv"): "endpoint",
+    ("POST", "/api/export/json"): "endpoint",
+}
+
+# Refresh last_used_at at most this often per key.
+_LAST_USED_RESOLUTION = timedelta(minutes=5)
+
+
+@dataclass(frozen=True)
+class ApiKeyContext:
+    key_id: int
+    prefix: str
+    user_id: int
+    scopes: FrozenSet[str]
+    study_id: Optional[int]
+
+
+_keys = LRUCache("api_keys", settings.AUTH_CACHE_MAX_ENTRIES, ttl_seconds=settings.API_KEY_CACHE_TTL_SECONDS)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_aware(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite returns naive datetimes for timezone-aware columns.
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def hash_api_key_secret(secret: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), secret.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def generate_api_key() -> Tuple[str, str, str]:
+    """Return (raw key, prefix, secret hash) for a new key."""
+    prefix = secrets.token_hex(6)
+    secret = secrets.token_urlsafe(32)
+    return f"{API_KEY_PREFIX}{prefix}_{secret}", prefix, hash_api_key_secret(secret)
+
+
+def _split_key(raw_key: str) -> Optional[Tuple[str, str]]:
+    if not raw_key.startswith(API_KEY_PREFIX):
+        return None
+    prefix, sep, secret = raw_key[len(API_KEY_PREFIX):].partition("_")
+    if not sep or not prefix or not secret:
+        return None
+    return prefix, secret
+
+
+def get_api_key_from_request(request: Request) -> Optional[str]:
+    """API key from the X-API-Key header, or a Bearer credential that looks like one."""
+    key = request.headers.get(API_KEY_HEADER)
+    if key:
+        return key.strip()
+    auth = request.headers.get("Authorization")
+    if auth and auth.startswith("Bearer " + API_KEY_PREFIX):
+        return auth[7:].strip()
+    return None
+
+
+def authenticate_api_key(db: Session, raw_key: str) -> Optional[ApiKeyContext]:
+    """Resolve a raw key to its context, or None if it is unknown, revoked or expired."""
+    parts = _split_key(raw_key)
+    if parts is None:
+        return None
+    prefix, secret = parts
+    secret_hash = hash_api_key_secret(secret)
+
+    cached = _keys.get(prefix)
+    if cached is not None:
+        cached_hash, context = cached
+        return context if hmac.compare_digest(cached_hash, secret_hash) else None
+
+    row = db.query(ApiKey).filter(ApiKey.prefix == prefix).first()
+    if row is None or not hmac.compare_digest(row.key_hash, secret_hash):
+        return None
+    now = _utcnow()
+    expires_at = _as_aware(row.expires_at)
+    if row.revoked_at is not None or (expires_at is not None and expires_at <= now):
+        return None
+
+    context = ApiKeyContext(
+        key_id=row.id,
+        prefix=row.prefix,
+        user_id=row.user_id,
+        scopes=frozenset(row.scopes or ()),
+        study_id=row.study_id,
+    )
+    last_used_at = _as_aware(row.last_used_at)
+    if last_used_at is None or now - last_used_at > _LAST_USED_RESOLUTION:
+        row.last_used_at = now
+        db.commit()
+
+    ttl = settings.API_KEY_CACHE_TTL_SECONDS
+    if expires_at is not None:
+        ttl = min(ttl, (expires_at - now).total_seconds())
+    _keys.set(prefix, (row.key_hash, context), ttl_seconds=ttl)
+    return context
+
+
+def invalidate_api_key(prefix: str) -> None:
+    """Forget a cached key on this worker; others notice revocation within the TTL."""
+    _keys.pop(prefix)
+
+
+def _required_scope(method: str, path: str) -> Optional[str]:
+    if any(path == p or path.startswith(p + "/") for p in _FORBIDDEN_PATHS):
+        return None
+    if method in ("GET", "HEAD"):
+        return "read"
+    if path.startswith("/api/export/") and method == "POST":
+        return "export"
+    if (path == "/api/submissions" and method == "POST") or (
+        path.startswith("/api/submissions/") and method == "PUT"
+    ):
+        return "submit"
+    return None
+
+
+def enforce_api_key_scope(request: Request, context: ApiKeyContext) -> None:
+    """Reject requests outside the key's scopes or study (403)."""
+    method = request.method.upper()
+    path = request.url.path.rstrip("/") or "/"
+    scope = _required_scope(method, path)
+    if scope is None or scope not in context.scopes:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="API key does not allow this operation"
+        )
+
+    if context.study_id is None:
+        return
+    route = request.scope.get("route")
+    route_key = (method, getattr(route, "path", path))
+    if route_key not in _STUDY_ROUTES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"API key is limited to study {context.study_id}; this endpoint is not study-specific"
+        )
+    if _STUDY_ROUTES[route_key] == "param":
+        requested = request.path_params.get("study_id") or request.query_params.get("study_id")
+        if requested is None or str(requested) != str(context.study_id):
+            raise _study_mismatch(context)
+
+
+def _study_mismatch(context: ApiKeyContext) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=f"API key is limited to study {context.study_id}; pass study_id={context.study_id}"
+    )
+
+
+def ensure_api_key_study(request: Request, study_id: Optional[int]) -> None:
+    """Endpoint-side study check: a study-limited key may only act on its own study."""
+    context = getattr(request.state, "api_key", None)
+    if context is None or context.study_id is None:
+        return
+    if study_id != context.study_id:
+        raise _study_mismatch(context)
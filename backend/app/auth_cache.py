@@ -0,0 +1,82 @@
+"""Short-lived caches for request authentication.
+
+``get_current_user`` used to decode the JWT and load the user row on every
+call. Verified token payloads and the few user attributes authorization needs
+are now cached per worker for ``AUTH_CACHE_TTL_SECONDS``. ``update_user`` and
+``delete_user`` invalidate a user's principal immediately; other workers pick
+up the change within the TTL.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from app.cache import LRUCache
+from app.config import settings
+from app.models import User
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Authorization-relevant snapshot of a user row (never includes the password hash)."""
+    id: int
+    email: str
+    full_name: str
+    role: str
+    hospital_id: Optional[int]
+    is_active: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            hospital_id=user.hospital_id,
+            is_active=bool(user.is_active),
+            created_at=user.created_at,
+        )
+
+    def to_user(self) -> User:
+        """Transient (session-less) User carrying the cached attributes."""
+        return User(
+            id=self.id,
+            email=self.email,
+            full_name=self.full_name,
+            role=self.role,
+            hospital_id=self.hospital_id,
+            is_active=self.is_active,
+            created_at=self.created_at,
+        )
+
+
+_tokens = LRUCache("auth_tokens", settings.AUTH_CACHE_MAX_ENTRIES, ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS)
+_principals = LRUCache("auth_principals", settings.AUTH_CACHE_MAX_ENTRIES, ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS)
+
+
+def get_cached_token(token: str) -> Optional[dict]:
+    return _tokens.get(token)
+
+
+def cache_token(token: str, payload: dict) -> None:
+    """Remember a verified payload, never beyond the token's own expiry."""
+    ttl = settings.AUTH_CACHE_TTL_SECONDS
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = min(ttl, exp - time.time())
+    _tokens.set(token, payload, ttl_seconds=ttl)
+
+
+def get_cached_principal(user_id: int) -> Optional[Principal]:
+    return _principals.get(user_id)
+
+
+def cache_principal(principal: Principal) -> None:
+    _principals.set(principal.id, principal)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop a user's cached principal; call after any change to the user row."""
+    _principals.pop(user_id)
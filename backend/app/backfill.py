@@ -0,0 +1,381 @@
+"""Resumable, throttled batch processing for background jobs and data backfills.
+
+Everything that rewrites many rows while the API is serving traffic uses one loop,
+``run_job``:
+
+- The job row is claimed with a lease, so several workers can try to resume
+  it at startup and only one runs it.
+- Each step reads one keyset-ordered batch (``id > cursor ORDER BY id LIMIT n``),
+  never the whole table. The runner commits the step together with the
+  cursor, so memory stays bounded by the batch size. An interrupted run
+  resumes after its last committed batch.
+- A ``Throttle`` caps each job at ``BACKFILL_MAX_ROWS_PER_SECOND``. It sleeps
+  between batches, after the commit, so live writers get the write lock
+  and SQLite can checkpoint its WAL.
+- The measured rate is stored in the job's ``rows_per_second`` and logged
+  periodically.
+- Steps that rewrite submissions compare-and-set each row on the payload they
+  read (``WHERE id = :id AND data_json = :old``). A row the API edited in the
+  meantime matches nothing and keeps the edit.
+
+The unique-key re-index, re-encryption and payload normalisation jobs are built
+on ``run_job``. One-off data fixes (the kind that used to be ``migrate_*.py``
+scripts doing ``fetchall()`` on a whole table) register a ``Backfill`` instead.
+A backfill is a row filter plus a function that rewrites one batch. It runs as
+a ``BackfillRun`` started from the admin API
+(``POST /api/admin/backfills/{name}/runs``) or from the command line::
+
+    python -m app.backfill list
+    python -m app.backfill run <name> [--batch-size N] [--max-rows-per-second N]
+
+The command line resumes the active run of that backfill if there is one.
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, begin_write
+from app.models import BackfillRun, Submission
+
+logger = logging.getLogger(__name__)
+
+JOB_ACTIVE_STATUSES = ("pending", "running")
+# Seconds between progress lines while a job runs.
+PROGRESS_LOG_INTERVAL = 30.0
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Throttle:
+    """Keeps a batch loop under a rows-per-second cap by sleeping between batches."""
+
+    def __init__(self, max_rows_per_second: Optional[int] = None):
+        if max_rows_per_second is None:
+            max_rows_per_second = settings.BACKFILL_MAX_ROWS_PER_SECOND
+        self.max_rows_per_second = max(max_rows_per_second, 0)
+        self.started = time.monotonic()
+        self.rows = 0
+
+    def record(self, rows: int) -> None:
+        self.rows += rows
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return round(self.rows / elapsed, 1) if elapsed > 0 else 0.0
+
+    def pause(self) -> None:
+        """Sleep until the rows recorded so far fit under the cap; call between transactions."""
+        if not self.max_rows_per_second:
+            return
+        ahead = self.rows / self.max_rows_per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def claim_job(db: Session, model, job_id: int, lease_seconds: int) -> bool:
+    """Take the job's lease; fails if another worker holds a live lease."""
+    now = utcnow()
+    result = db.execute(
+        update(model)
+        .where(
+            model.id == job_id,
+            model.status.in_(JOB_ACTIVE_STATUSES),
+            or_(model.lease_expires_at.is_(None), model.lease_expires_at < now),
+        )
+        .values(
+            status="running",
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            started_at=func.coalesce(model.started_at, now),
+        )
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def run_job(
+    model,
+    job_id: int,
+    step: Callable[[Session, Any, int], Optional[int]],
+    *,
+    batch_size: int,
+    lease_seconds: int,
+    label: str,
+    finish: Optional[Callable[[Session, Any], None]] = None,
+    abandon: Optional[Callable[[Session, Any], None]] = None,
+    max_rows_per_second: Optional[int] = None,
+) -> Optional[str]:
+    """Claim a job and run it batch by batch to the end; returns the final status.
+
+    ``step(db, job, batch_size)`` processes the next batch and moves the job's
+    cursor and counters. It returns the number of rows read, or 0 once the
+    walk is done. It returns None to stop early, after setting the job's
+    status itself. The runner commits each step together with the lease and
+    the rate. When the walk is done, ``finish(db, job)`` runs in the completing
+    transaction. If the job stops without completing (superseded, or stopped
+    by ``step``), ``abandon(db, job)`` cleans up in the transaction that
+    records the stop. Failures mark the job failed with the error.
+
+    Returns None when another worker holds the job's lease.
+    """
+    db = SessionLocal()
+    try:
+        if not claim_job(db, model, job_id, lease_seconds):
+            return None
+
+        job = db.get(model, job_id)
+        throttle = Throttle(max_rows_per_second)
+        last_log = time.monotonic()
+        while True:
+            throttle.pause()
+            db.refresh(job)
+            if job.status == "running":
+                rows = step(db, job, batch_size)
+                if rows:
+                    throttle.record(rows)
+                    job.rows_per_second = throttle.rows_per_second
+                    job.lease_expires_at = utcnow() + timedelta(seconds=lease_seconds)
+                    db.commit()
+                    if time.monotonic() - last_log >= PROGRESS_LOG_INTERVAL:
+                        last_log = time.monotonic()
+                        logger.info(
+                            "%s %s: %s rows read, %s rows/s", label, job_id, job.processed_count, job.rows_per_second
+                        )
+                    continue
+                if rows == 0:
+                    if finish is not None:
+                        finish(db, job)
+                    job.status = "completed"
+                    job.finished_at = utcnow()
+                    job.lease_expires_at = None
+                    db.commit()
+                    return job.status
+
+            if abandon is not None:
+                abandon(db, job)
+            db.commit()
+            return job.status
+    except Exception as exc:
+        db.rollback()
+        logger.exception("%s %s failed", label, job_id)
+        db.execute(
+            update(model)
+            .where(model.id == job_id)
+            .values(status="failed", error=str(exc)[:1000], finished_at=utcnow(), lease_expires_at=None)
+        )
+        db.commit()
+        return "failed"
+    finally:
+        db.close()
+
+
+def active_job_ids(model) -> List[int]:
+    """Ids of the model's pending or running jobs, oldest first."""
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(model.id).where(model.status.in_(JOB_ACTIVE_STATUSES)).order_by(model.id)
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+# Named backfills
+
+class Backfill(NamedTuple):
+    """A one-off data fix, walked in primary key order over the rows matching ``where()``."""
+    name: str
+    description: str
+    model: Any
+    columns: Tuple[Any, ...]  # selected after the primary key; batch rows are (id, *columns)
+    where: Callable[[], Any]  # called per batch, so it may depend on current settings
+    apply: Callable[[Session, Sequence[Any]], int]  # rewrites a batch; returns rows changed
+
+
+BACKFILLS: Dict[str, Backfill] = {}
+
+
+def register_backfill(backfill: Backfill) -> Backfill:
+    if backfill.name in BACKFILLS:
+        raise ValueError(f"Backfill {backfill.name!r} is already registered")
+    BACKFILLS[backfill.name] = backfill
+    return backfill
+
+
+def _fill_submission_updated_at(db: Session, rows: Sequence[Any]) -> int:
+    return db.execute(
+        update(Submission)
+        .where(Submission.id.in_([row[0] for row in rows]), Submission.updated_at.is_(None))
+        .values(updated_at=Submission.created_at)
+    ).rowcount
+
+
+register_backfill(Backfill(
+    name="submission-updated-at",
+    description="Set updated_at to created_at on submissions that never recorded an update time",
+    model=Submission,
+    columns=(),
+    where=lambda: Submission.updated_at.is_(None),
+    apply=_fill_submission_updated_at,
+))
+
+
+def start_backfill_run(
+    db: Session, name: str, requested_by: Optional[int] = None, max_rows_per_second: Optional[int] = None,
+) -> BackfillRun:
+    """Queue a run of a registered backfill; supersedes its run still in flight. The caller commits."""
+    if name not in BACKFILLS:
+        raise KeyError(name)
+    db.query(BackfillRun).filter(
+        BackfillRun.name == name,
+        BackfillRun.status.in_(JOB_ACTIVE_STATUSES),
+    ).update({"status": "superseded", "finished_at": utcnow()}, synchronize_session=False)
+
+    backfill_run = BackfillRun(
+        name=name,
+        status="pending",
+        last_key=0,
+        processed_count=0,
+        changed_count=0,
+        max_rows_per_second=max_rows_per_second,
+        requested_by=requested_by,
+    )
+    db.add(backfill_run)
+    db.flush()
+    return backfill_run
+
+
+def _backfill_batch(db: Session, backfill_run: BackfillRun, batch_size: int) -> int:
+    backfill = BACKFILLS[backfill_run.name]
+    key = backfill.model.__mapper__.primary_key[0]
+    begin_write(db)
+    rows = db.execute(
+        select(key, *backfill.columns)
+        .where(key > backfill_run.last_key, backfill.where())
+        .order_by(key)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    changed = backfill.apply(db, rows)
+    backfill_run.last_key = rows[-1][0]
+    backfill_run.processed_count = (backfill_run.processed_count or 0) + len(rows)
+    backfill_run.changed_count = (backfill_run.changed_count or 0) + changed
+    return len(rows)
+
+
+def _log_backfill_completed(db: Session, backfill_run: BackfillRun) -> None:
+    logger.info(
+        "Backfill %s (run %s) completed: %s rows read, %s changed, %s rows/s",
+        backfill_run.name, backfill_run.id, backfill_run.processed_count, backfill_run.changed_count,
+        backfill_run.rows_per_second,
+    )
+
+
+def run_backfill(run_id: int, batch_size: Optional[int] = None) -> Optional[str]:
+    """Run (or resume) a backfill run to completion; returns the final status.
+
+    Returns None when another worker holds the run's lease.
+    """
+    db = SessionLocal()
+    try:
+        backfill_run = db.get(BackfillRun, run_id)
+        max_rows_per_second = backfill_run.max_rows_per_second if backfill_run else None
+        if backfill_run is not None and backfill_run.name not in BACKFILLS:
+            # Queued by a release that registered it; this code no longer knows how to run it.
+            logger.error("Backfill run %s names unknown backfill %r", run_id, backfill_run.name)
+            return None
+    finally:
+        db.close()
+
+    return run_job(
+        BackfillRun, run_id, _backfill_batch,
+        batch_size=batch_size or settings.BACKFILL_BATCH_SIZE,
+        lease_seconds=settings.BACKFILL_LEASE_SECONDS,
+        label="Backfill run",
+        finish=_log_backfill_completed,
+        max_rows_per_second=max_rows_per_second,
+    )
+
+
+def resume_pending_backfill_runs() -> None:
+    """Resume runs interrupted by a restart; run in a background thread at startup."""
+    for run_id in active_job_ids(BackfillRun):
+        run_backfill(run_id)
+
+
+def start_resume_thread() -> threading.Thread:
+    thread = threading.Thread(target=resume_pending_backfill_runs, name="backfill", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.backfill", description="Resumable data backfills")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list registered backfills and their latest run")
+    run_parser = commands.add_parser("run", help="run a backfill in the foreground, resuming its active run")
+    run_parser.add_argument("name", choices=sorted(BACKFILLS))
+    run_parser.add_argument("--batch-size", type=int, default=None)
+    run_parser.add_argument("--max-rows-per-second", type=int, default=None, help="0 = unlimited")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from app.database import engine
+    from app.migrations import ensure_schema_current
+
+    ensure_schema_current(engine)
+    db = SessionLocal()
+    try:
+        if args.command == "list":
+            for backfill in BACKFILLS.values():
+                latest = db.query(BackfillRun).filter(
+                    BackfillRun.name == backfill.name
+                ).order_by(BackfillRun.id.desc()).first()
+                state = f"run {latest.id} {latest.status}, {latest.processed_count} rows" if latest else "never run"
+                print(f"{backfill.name}  ({state})\n    {backfill.description}")
+            return 0
+
+        backfill_run = db.query(BackfillRun).filter(
+            BackfillRun.name == args.name,
+            BackfillRun.status.in_(JOB_ACTIVE_STATUSES),
+        ).order_by(BackfillRun.id.desc()).first()
+        if backfill_run is None:
+            backfill_run = start_backfill_run(db, args.name, max_rows_per_second=args.max_rows_per_second)
+        elif args.max_rows_per_second is not None:
+            backfill_run.max_rows_per_second = args.max_rows_per_second
+        db.commit()
+        run_id = backfill_run.id
+    finally:
+        db.close()
+
+    print(f"Running backfill {args.name} (run {run_id})")
+    final_status = run_backfill(run_id, args.batch_size)
+    if final_status is None:
+        print(f"Run {run_id} is held by another worker; it is already running there.")
+        return 1
+    db = SessionLocal()
+    try:
+        backfill_run = db.get(BackfillRun, run_id)
+        print(
+            f"Run {run_id} {final_status}: {backfill_run.processed_count} rows read, "
+            f"{backfill_run.changed_count} changed, {backfill_run.rows_per_second} rows/s"
+        )
+    finally:
+        db.close()
+    return 0 if final_status == "completed" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
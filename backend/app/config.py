@@ -17,11 +17,121 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Refresh tokens (httpOnly cookie scoped to /api/auth, rotated on every use)
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 14
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS: int = 10
+    REFRESH_COOKIE_NAME: str = "refresh_token"
+
+    # Service API keys: how long a verified key is trusted per worker before re-checking the DB
+    API_KEY_CACHE_TTL_SECONDS: int = 30
+
+    # bcrypt pool: concurrent hashes (0 = CPU count), waiting slots, Retry-After on overflow
+    PASSWORD_HASH_WORKERS: int = 0
+    PASSWORD_HASH_MAX_QUEUE: int = 32
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 2
+
+    # Per-worker cache of verified tokens and user principals (0 disables it)
+    AUTH_CACHE_TTL_SECONDS: int = 30
+    AUTH_CACHE_MAX_ENTRIES: int = 2048
+
     # Encryption (set ENCRYPTION_KEY in production; use Fernet.generate_key() and base64)
     ENCRYPTION_KEY: str = DEV_ENCRYPTION_KEY
+    # Retired keys still accepted for decryption during a rotation (comma-separated, newest first)
+    ENCRYPTION_PREVIOUS_KEYS: str = ""
+    # Opt-in encryption of submission payloads at rest; unique keys become HMAC blind indexes
+    SUBMISSION_ENCRYPTION_ENABLED: bool = False
+    BLIND_INDEX_KEY: str = ""  # required with encryption; changing it re-indexes every form at startup
+    # zlib-compress payloads of at least this many bytes before storing them (0 disables)
+    SUBMISSION_COMPRESSION_MIN_BYTES: int = 0
+    # Background normaliser that rewrites untagged/outdated payload rows
+    PAYLOAD_NORMALIZER_BATCH_SIZE: int = 500
+    PAYLOAD_NORMALIZER_LEASE_SECONDS: int = 300
+    # Bulk reads (exports) decode encrypted payloads in batches on this many threads
+    PAYLOAD_DECODE_WORKERS: int = 4
+    PAYLOAD_DECODE_BATCH_SIZE: int = 256
+    # Exports stream submissions in id-ordered chunks of this many rows
+    EXPORT_CHUNK_SIZE: int = 500
+    # Re-encryption job that rewrites old rows under the primary key
+    REENCRYPTION_BATCH_SIZE: int = 500
+    REENCRYPTION_LEASE_SECONDS: int = 300
 
     # Database
     DATABASE_URL: str = "sqlite:///./database/research_data.db"
+    # Apply pending schema migrations at startup; false = refuse to start until `python -m app.migrations upgrade`
+    DB_MIGRATE_ON_STARTUP: bool = True
+    # Connection pool (per worker process): size workers x (size + overflow) below the server's max_connections
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: int = 30
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # reconnect before the provider drops idle connections
+    DB_POOL_PRE_PING: bool = True
+    # Async engine for the read endpoints (aiosqlite / asyncpg); false runs them on the sync engine in the threadpool
+    DB_ASYNC_ENABLED: bool = False
+    DB_ASYNC_URL: str = ""  # default: DATABASE_URL with its async driver
+    # Read replica for the read endpoints (empty = read from the primary)
+    DB_READ_REPLICA_URL: str = ""
+    DB_READ_REPLICA_LAG_GUARD_SECONDS: int = 10  # a user's reads stay on the primary this long after they write
+    # SQLite tuning, applied to every new connection
+    SQLITE_TUNING_ENABLED: bool = True
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # safe with WAL; FULL also syncs every commit
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE_BYTES: int = 268435456
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_FOREIGN_KEYS: bool = True
+    SQLITE_OPTIMIZE_INTERVAL_SECONDS: int = 3600  # periodic PRAGMA optimize (0 disables)
+    # Single-writer group commit for submission writes (SQLite only, see app.write_queue)
+    SQLITE_WRITE_QUEUE_ENABLED: bool = False
+    SQLITE_WRITE_QUEUE_MAX_BATCH: int = 64
+    SQLITE_WRITE_QUEUE_MAX_WAIT_MS: float = 2.0
+    SQLITE_WRITE_QUEUE_TIMEOUT_SECONDS: float = 30.0
+    SQLITE_WRITE_QUEUE_RETRY_AFTER_SECONDS: int = 2
+    # Postgres session settings, sent with each new connection
+    DB_APPLICATION_NAME: str = "research-data-api"
+    DB_CONNECT_TIMEOUT_SECONDS: int = 10
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # 0 = server default
+    DB_SESSION_SETTINGS: str = ""  # e.g. "lock_timeout=5s,idle_in_transaction_session_timeout=60s"
+
+    # Parsed form schemas kept per worker process (0 disables the cache)
+    FORM_SCHEMA_CACHE_SIZE: int = 512
+
+    # Online unique-key re-index after form schema changes
+    UNIQUE_KEY_REINDEX_BATCH_SIZE: int = 500
+    UNIQUE_KEY_REINDEX_LEASE_SECONDS: int = 300
+
+    # Batch jobs and named backfills (app/backfill.py): rows/sec cap per running job (0 = unlimited)
+    BACKFILL_MAX_ROWS_PER_SECOND: int = 2000
+    BACKFILL_BATCH_SIZE: int = 1000
+    BACKFILL_LEASE_SECONDS: int = 300
+
+    # Opt-in Prometheus metrics at /metrics for admins; also open to these networks (comma-separated CIDRs)
+    METRICS_ENABLED: bool = False
+    METRICS_ALLOWED_NETWORKS: str = ""  # e.g. 10.0.5.0/24; never the address a reverse proxy connects from
+    # Opt-in slow-query log (app/slow_queries.py): statements over the threshold go to a rotating JSON-lines file
+    SLOW_QUERY_LOG_ENABLED: bool = False
+    SLOW_QUERY_THRESHOLD_MS: float = 500.0
+    SLOW_QUERY_EXPLAIN: bool = False  # also record EXPLAIN / EXPLAIN QUERY PLAN, run on a separate connection
+    SLOW_QUERY_LOG_FILE: str = "./logs/slow_queries.log"
+    SLOW_QUERY_LOG_MAX_BYTES: int = 10485760
+    SLOW_QUERY_LOG_BACKUPS: int = 5
+    # Query budget / N+1 detector (development and tests, app/query_budget.py); adds X-DB-Queries
+    QUERY_BUDGET_ENABLED: bool = False
+    QUERY_BUDGET_DEFAULT: int = 50  # statements per request (0 = unlimited)
+    QUERY_BUDGET_ROUTES: str = ""  # per-route overrides, e.g. "GET /api/studies/{study_id}=15,POST /api/export/csv=0"
+    QUERY_BUDGET_REPEAT_THRESHOLD: int = 5  # the same statement this often in one request is flagged as N+1
+    QUERY_BUDGET_MODE: str = "warn"  # warn | raise
+    # Opt-in request tracing (app/tracing.py) into TRACE_FILE (OTLP/JSON) and/or a Server-Timing header
+    TRACING_ENABLED: bool = False
+    TRACE_SERVER_TIMING: bool = False  # send Server-Timing to every client; development only
+    TRACE_FILE: str = ""  # e.g. ./logs/traces.jsonl
+    TRACE_SAMPLE_RATE: float = 1.0  # share of requests written to TRACE_FILE
+    TRACE_FILE_MAX_BYTES: int = 52428800
+    TRACE_FILE_BACKUPS: int = 5
+    # Opt-in profiling of an admin's request flagged with X-Profile: 1 or ?_profile=1 (app/profiling.py)
+    PROFILING_ENABLED: bool = False
+    PROFILING_DIR: str = "./logs/profiles"
+    PROFILING_SAMPLE_INTERVAL_MS: float = 1.0
+    PROFILING_MAX_FILES: int = 50  # oldest profiles are deleted beyond this
 
     # CORS (restrict to your frontend origin(s) in production)
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
@@ -49,6 +159,21 @@ class Settings(BaseSettings):
                 "Do not use default development values."
             )
 
+    def validate_encryption_settings(self) -> None:
+        """Raise if payload encryption is enabled without a persistent ENCRYPTION_KEY and a separate BLIND_INDEX_KEY."""
+        if not self.SUBMISSION_ENCRYPTION_ENABLED:
+            return
+        if self.ENCRYPTION_KEY == DEV_ENCRYPTION_KEY:
+            raise RuntimeError(
+                "SUBMISSION_ENCRYPTION_ENABLED requires ENCRYPTION_KEY to be set; "
+                "the generated development key does not survive a restart."
+            )
+        if not self.BLIND_INDEX_KEY or self.BLIND_INDEX_KEY in (self.SECRET_KEY, self.ENCRYPTION_KEY):
+            raise RuntimeError(
+                "SUBMISSION_ENCRYPTION_ENABLED requires BLIND_INDEX_KEY to be set to its own secret, "
+                "so rotating SECRET_KEY or ENCRYPTION_KEY does not invalidate stored unique keys."
+            )
+
     @property
     def cors_origins_list(self) -> List[str]:
         configured = [origin.strip() for origin in self.CORS_ORIGINS.split(",") if origin.strip()]
@@ -1,16 +1,244 @@
-from sqlalchemy import create_engine
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import Depends
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 import os
 
+from app.cache import LRUCache
 from app.config import settings
+from app.metrics import instrument_engine, percentile_ms
+from app.query_budget import install_query_budget
+from app.slow_queries import install_slow_query_log
+from app.tracing import trace_engine
+
+logger = logging.getLogger(__name__)
+
+# Checkout wait samples kept for percentile reporting.
+POOL_WAIT_WINDOW = 1000
+
+_SESSION_SETTING_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection and how often they time out."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self._wait_seconds = deque(maxlen=POOL_WAIT_WINDOW)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._metrics_lock:
+            self.checkouts += 1
+            self._wait_seconds.append(waited)
+        return connection
+
+    def wait_samples(self):
+        with self._metrics_lock:
+            return list(self._wait_seconds)
+
+
+def parse_session_settings(raw: str) -> Dict[str, str]:
+    """Parse ``DB_SESSION_SETTINGS`` ("lock_timeout=5s,idle_in_transaction_session_timeout=60s")."""
+    result = {}
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, value = item.partition("=")
+        name, value = name.strip(), value.strip()
+        if not sep or not _SESSION_SETTING_NAME.match(name) or not value or any(ch.isspace() for ch in value):
+            raise ValueError(f"Invalid DB_SESSION_SETTINGS entry: {item!r}")
+        result[name] = value
+    return result
+
+
+def _postgres_connect_args() -> Dict[str, Any]:
+    """Session settings sent in the startup packet, so they cost no extra round trip per connection."""
+    options = dict(parse_session_settings(settings.DB_SESSION_SETTINGS))
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        options["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    connect_args: Dict[str, Any] = {}
+    if settings.DB_APPLICATION_NAME:
+        connect_args["application_name"] = settings.DB_APPLICATION_NAME
+    if settings.DB_CONNECT_TIMEOUT_SECONDS > 0:
+        connect_args["connect_timeout"] = settings.DB_CONNECT_TIMEOUT_SECONDS
+    if options:
+        connect_args["options"] = " ".join(f"-c {name}={value}" for name, value in options.items())
+    return connect_args
+
+
+def _pool_kwargs() -> Dict[str, Any]:
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def sqlite_pragmas() -> List[str]:
+    """PRAGMAs applied to every new SQLite connection, from Settings."""
+    pragmas = [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA foreign_keys={'ON' if settings.SQLITE_FOREIGN_KEYS else 'OFF'}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if settings.SQLITE_CACHE_SIZE_KB:
+        pragmas.append(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")  # negative = KiB
+    if settings.SQLITE_MMAP_SIZE_BYTES:
+        pragmas.append(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_BYTES)}")
+    return pragmas
+
+
+def configure_sqlite_transactions(sqlite_engine) -> None:
+    """Let SQLAlchemy (not pysqlite) emit BEGIN, so DDL is transactional and the begin mode can be chosen.
+
+    The mode comes from the ``sqlite_begin`` execution option (default ``deferred``).
+    """
+    @event.listens_for(sqlite_engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sqlite_engine, "begin")
+    def _begin_sqlite_transaction(conn):
+        mode = conn.get_execution_options().get("sqlite_begin", "deferred")
+        conn.exec_driver_sql(f"BEGIN {mode.upper()}")
+
+
+def configure_sqlite_engine(sqlite_engine) -> None:
+    """Apply the SQLite tuning layer to an engine.
+
+    Every new connection gets the configured PRAGMAs. Transactions are begun
+    explicitly. Transactions opened with ``begin_write`` use ``BEGIN
+    IMMEDIATE``: they take the write lock up front and queue on
+    ``busy_timeout``. A deferred transaction that reads first and writes later
+    would instead fail at once with "database is locked" whenever another
+    writer committed in between.
+    """
+    pragmas = sqlite_pragmas()
+    configure_sqlite_transactions(sqlite_engine)
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+# Connect / invalidate counts per sync engine, for pool_stats.
+_pool_events: Dict[Any, Dict[str, int]] = {}
+
+
+def _create_sync_engine(url: str):
+    if url.startswith("sqlite"):
+        directory = os.path.dirname(url.replace("sqlite:///", ""))
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        sync_engine = create_engine(url, connect_args={"check_same_thread": False}, **_pool_kwargs())
+        if settings.SQLITE_TUNING_ENABLED:
+            configure_sqlite_engine(sync_engine)
+    else:
+        sync_engine = create_engine(url, connect_args=_postgres_connect_args(), **_pool_kwargs())
+
+    events = _pool_events[sync_engine] = {"connects": 0, "invalidations": 0}
+
+    @event.listens_for(sync_engine, "connect")
+    def _count_connect(dbapi_connection, connection_record):
+        events["connects"] += 1
+
+    @event.listens_for(sync_engine, "invalidate")
+    def _count_invalidate(dbapi_connection, connection_record, exception):
+        events["invalidations"] += 1
+
+    return sync_engine
+
 
 _db_url = settings.DATABASE_URL
-if _db_url.startswith("sqlite"):
-    os.makedirs(os.path.dirname(_db_url.replace("sqlite:///", "")), exist_ok=True)
-    engine = create_engine(_db_url, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(_db_url)
+engine = _create_sync_engine(_db_url)
+
+# Optional read replica for the read endpoints (see get_read_db).
+replica_engine = _create_sync_engine(settings.DB_READ_REPLICA_URL) if settings.DB_READ_REPLICA_URL else None
+
+
+def _instrument(target, role: str, explain_engine) -> None:
+    """Attach metrics, the slow-query log, the query budget and tracing to ``target`` (a sync Engine)."""
+    if settings.METRICS_ENABLED:
+        instrument_engine(target, role)
+    if settings.SLOW_QUERY_LOG_ENABLED:
+        # EXPLAIN is replayed with the statement's own parameters, so the paramstyles must match.
+        same_style = explain_engine.dialect.paramstyle == target.dialect.paramstyle
+        install_slow_query_log(target, role, explain_engine if same_style else None)
+    if settings.QUERY_BUDGET_ENABLED:
+        install_query_budget(target)
+    if settings.TRACING_ENABLED:
+        trace_engine(target)
+
+
+_instrument(engine, "primary", engine)
+if replica_engine is not None:
+    _instrument(replica_engine, "replica", replica_engine)
+
+
+def pool_stats(target=None) -> Dict[str, Any]:
+    """Connection pool occupancy and checkout latency for this worker process.
+
+    Reports the primary engine unless another engine (the replica) is given.
+    """
+    target = target if target is not None else engine
+    pool = target.pool
+    stats: Dict[str, Any] = {
+        "pool_class": type(pool).__name__,
+        "connects": _pool_events[target]["connects"],
+        "invalidations": _pool_events[target]["invalidations"],
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "pool_size": pool.size(),
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        samples = pool.wait_samples()
+        stats.update({
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "wait_ms_p50": percentile_ms(samples, 0.5),
+            "wait_ms_p95": percentile_ms(samples, 0.95),
+            "wait_ms_max": percentile_ms(samples, 1.0),
+        })
+    return stats
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -25,3 +253,264 @@ def get_db():
     finally:
         db.close()
 
+
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine is not None else None
+)
+
+# Users who committed a write in the last DB_READ_REPLICA_LAG_GUARD_SECONDS read from the primary.
+RECENT_WRITERS_MAX_ENTRIES = 10000
+_recent_writers = LRUCache(
+    "replica_recent_writers", RECENT_WRITERS_MAX_ENTRIES, ttl_seconds=settings.DB_READ_REPLICA_LAG_GUARD_SECONDS
+)
+
+
+def note_session_user(db: Session, user_id: int) -> None:
+    """Attribute the session's commits to a user, for the replica lag guard."""
+    db.info["user_id"] = user_id
+
+
+def mark_recent_write(user_id: Optional[int]) -> None:
+    """Send the user's reads to the primary until the replica has caught up with their write."""
+    if replica_engine is not None and user_id is not None:
+        _recent_writers.set(user_id, True)
+
+
+def reads_from_primary(user_id: Optional[int]) -> bool:
+    return replica_engine is None or user_id is None or _recent_writers.get(user_id) is not None
+
+
+if replica_engine is not None:
+    @event.listens_for(SessionLocal, "after_flush")
+    def _note_flush(session, flush_context):
+        session.info["wrote"] = True
+
+    @event.listens_for(SessionLocal, "do_orm_execute")
+    def _note_dml(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            orm_execute_state.session.info["wrote"] = True
+
+    @event.listens_for(SessionLocal, "after_commit")
+    def _guard_committed_write(session):
+        if session.info.pop("wrote", False):
+            mark_recent_write(session.info.get("user_id"))
+
+    @event.listens_for(SessionLocal, "after_rollback")
+    def _forget_rolled_back_write(session):
+        session.info.pop("wrote", None)
+
+
+def replica_stats() -> Dict[str, Any]:
+    """Replica pool statistics and, on Postgres, how far its replay lags behind."""
+    if replica_engine is None:
+        return {"enabled": False}
+    stats: Dict[str, Any] = {
+        "enabled": True,
+        "lag_guard_seconds": settings.DB_READ_REPLICA_LAG_GUARD_SECONDS,
+        "pool": pool_stats(replica_engine),
+        "lag_seconds": None,
+    }
+    if replica_engine.dialect.name == "postgresql":
+        # Grows while the primary is idle too; only meaningful under write traffic.
+        with replica_engine.connect() as conn:
+            lag = conn.exec_driver_sql(
+                "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+            ).scalar()
+        stats["lag_seconds"] = round(float(lag), 3) if lag is not None else None
+    return stats
+
+
+def async_database_url(url: str) -> str:
+    """The asyncio-driver form of a sync DATABASE_URL (aiosqlite / asyncpg)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend in ("postgresql", "postgres"):
+        return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    raise ValueError(f"No async driver configured for {backend!r}; set DB_ASYNC_URL or DB_ASYNC_ENABLED=false")
+
+
+def _asyncpg_connect_args() -> Dict[str, Any]:
+    """The Postgres session settings of ``_postgres_connect_args`` in asyncpg's form."""
+    server_settings = dict(parse_session_settings(settings.DB_SESSION_SETTINGS))
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        server_settings["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    if settings.DB_APPLICATION_NAME:
+        server_settings["application_name"] = settings.DB_APPLICATION_NAME
+    connect_args: Dict[str, Any] = {"server_settings": server_settings}
+    if settings.DB_CONNECT_TIMEOUT_SECONDS > 0:
+        connect_args["timeout"] = settings.DB_CONNECT_TIMEOUT_SECONDS
+    return connect_args
+
+
+def _create_async_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    # Same sizing as the sync pool; aiosqlite would otherwise open a connection (and thread) per session.
+    pool_kwargs = {**_pool_kwargs(), "poolclass": AsyncAdaptedQueuePool}
+    if make_url(url).get_backend_name() == "sqlite":
+        async_engine = create_async_engine(url, **pool_kwargs)
+        if settings.SQLITE_TUNING_ENABLED:
+            configure_sqlite_engine(async_engine.sync_engine)
+        return async_engine
+    return create_async_engine(url, connect_args=_asyncpg_connect_args(), **pool_kwargs)
+
+
+# Optional asyncio engines for the read-heavy endpoints (see ReadSession).
+async_engine = None
+AsyncSessionLocal = None
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+if settings.DB_ASYNC_ENABLED:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = _create_async_engine(settings.DB_ASYNC_URL or async_database_url(_db_url))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if replica_engine is not None:
+        async_replica_engine = _create_async_engine(async_database_url(settings.DB_READ_REPLICA_URL))
+        AsyncReplicaSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+    _instrument(async_engine.sync_engine, "primary", engine)
+    if async_replica_engine is not None:
+        _instrument(async_replica_engine.sync_engine, "replica", replica_engine)
+
+
+async def dispose_async_engine() -> None:
+    """Close pooled async connections (aiosqlite keeps a thread per connection)."""
+    for target in (async_engine, async_replica_engine):
+        if target is not None:
+            await target.dispose()
+
+
+def _run_and_close(session: Session, fn: Callable[..., Any], args: tuple) -> Any:
+    try:
+        return fn(session, *args)
+    finally:
+        session.close()
+
+
+class ReadSession:
+    """Read-only database access for ``async def`` endpoints.
+
+    ``await db.run(fn, *args)`` calls ``fn(session, *args)`` with an ordinary
+    sync Session. With ``DB_ASYNC_ENABLED`` the session runs on the asyncio
+    engine, so waiting on the database holds no thread. Otherwise ``fn`` runs
+    in the threadpool on a regular session, as sync endpoints do.
+
+    With ``DB_READ_REPLICA_URL`` the session is opened on the replica, unless
+    the requesting user committed a write within
+    ``DB_READ_REPLICA_LAG_GUARD_SECONDS``; then it stays on the primary so
+    users always see their own changes. The choice is made on the first
+    ``run``, after authentication has identified the user.
+
+    Each call is its own short read transaction. The session is closed when
+    ``fn`` returns, so no pooled connection is held while the endpoint awaits
+    anything else. Returned objects are detached with their loaded attributes
+    and must not lazy-load. Keep CPU-heavy work (payload decoding) out of
+    ``fn`` and run it with ``run_in_threadpool``.
+    """
+
+    def __init__(self, request_session: Optional[Session] = None, use_replica: Optional[bool] = None):
+        self._request_session = request_session
+        self.use_replica = use_replica
+        self._session = None
+        self._owned = True
+
+    def _open(self):
+        if self._session is not None:
+            return self._session
+        if self.use_replica is None:
+            user_id = self._request_session.info.get("user_id") if self._request_session is not None else None
+            self.use_replica = not reads_from_primary(user_id)
+        if self.use_replica:
+            self._session = (AsyncReplicaSessionLocal or ReplicaSessionLocal)()
+        elif AsyncSessionLocal is not None:
+            self._session = AsyncSessionLocal()
+        elif self._request_session is not None:
+            # The session authentication already used, so a request never holds two primary connections.
+            self._session = self._request_session
+            self._owned = False
+        else:
+            self._session = SessionLocal()
+        return self._session
+
+    @property
+    def is_async(self) -> bool:
+        return not isinstance(self._open(), Session)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        session = self._open()
+        if not isinstance(session, Session):
+            try:
+                return await session.run_sync(fn, *args)
+            finally:
+                await session.close()
+        return await run_in_threadpool(_run_and_close, session, fn, args)
+
+    async def close(self) -> None:
+        if self._session is None or not self._owned:
+            return
+        if isinstance(self._session, Session):
+            await run_in_threadpool(self._session.close)
+        else:
+            await self._session.close()
+
+
+def open_read_session(use_replica: bool = False) -> ReadSession:
+    """A read session owned by the caller, e.g. a response stream that outlives the request."""
+    return ReadSession(use_replica=use_replica and replica_engine is not None)
+
+
+async def get_read_db(request_session: Session = Depends(get_db)):
+    """Dependency for read-only async endpoints: a ReadSession on the replica or the primary."""
+    db = ReadSession(request_session)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def begin_write(db: Session) -> None:
+    """Start the session's next transaction as a writer (``BEGIN IMMEDIATE`` on SQLite).
+
+    Call it before the first query of a unit of work that will write. A
+    read-only transaction already open on the session (e.g. from
+    authentication) is ended first. Other databases are left alone.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    if db.in_transaction():
+        db.commit()
+    db.connection(execution_options={"sqlite_begin": "immediate"})
+
+
+def optimize_sqlite() -> None:
+    """Run ``PRAGMA optimize`` so SQLite refreshes statistics for the indexes queries actually use."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+
+
+def _sqlite_maintenance_loop(interval_seconds: int) -> None:
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            optimize_sqlite()
+        except Exception:
+            logger.exception("PRAGMA optimize failed")
+
+
+def start_sqlite_maintenance_thread() -> Optional[threading.Thread]:
+    """Optimize once now, then every ``SQLITE_OPTIMIZE_INTERVAL_SECONDS`` (SQLite only)."""
+    if engine.dialect.name != "sqlite" or settings.SQLITE_OPTIMIZE_INTERVAL_SECONDS <= 0:
+        return None
+    optimize_sqlite()
+    thread = threading.Thread(
+        target=_sqlite_maintenance_loop,
+        args=(settings.SQLITE_OPTIMIZE_INTERVAL_SECONDS,),
+        name="sqlite-optimize",
+        daemon=True,
+    )
+    thread.start()
+    return thread
@@ -1,32 +1,130 @@
+"""Fernet encryption with a process-wide cached key ring.
+
+``ENCRYPTION_KEY`` is the primary key: everything new is encrypted with it.
+``ENCRYPTION_PREVIOUS_KEYS`` lists retired keys that can still decrypt, so a
+key can be rotated without downtime. After a rotation, a re-encryption job
+(see ``app.reencryption``) rewrites the old rows under the primary key.
+
+The ``MultiFernet`` is built once per process. Encrypting or decrypting a row
+therefore costs only the AES/HMAC work, not key parsing and object setup.
+Every key has a short id (``key_id``). Rows record the id they were encrypted
+with, so readers go straight to the right key instead of trying each in turn.
+"""
 import base64
+import hashlib
 import json
-from cryptography.fernet import Fernet
+import logging
+import threading
+from typing import Dict, List, Optional, Union
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from app.config import settings, DEV_ENCRYPTION_KEY
 
+logger = logging.getLogger(__name__)
+
+_cipher_lock = threading.Lock()
+_cipher: Optional[MultiFernet] = None
+_primary_cipher: Optional[Fernet] = None
+_primary_key_id: Optional[str] = None
+_ciphers_by_key_id: Dict[str, Fernet] = {}
+_dev_key: Optional[bytes] = None
+
+
+def _normalize_key(key: str) -> bytes:
+    # Ensure key is properly formatted
+    if len(key) != 44:  # Base64 encoded 32-byte key
+        # Generate from provided key
+        return base64.urlsafe_b64encode(key.encode()[:32].ljust(32, b'0'))
+    return key.encode()
+
 
 def get_encryption_key() -> bytes:
-    """Get or generate encryption key."""
+    """Primary encryption key (generated once per process in development if not set)."""
+    global _dev_key
     key = settings.ENCRYPTION_KEY
     if key == DEV_ENCRYPTION_KEY:
-        # Generate a new key if not set
-        key = Fernet.generate_key()
-        print(f"WARNING: Generated new encryption key. Set ENCRYPTION_KEY={key.decode()} in .env")
-    else:
-        # Ensure key is properly formatted
-        if len(key) != 44:  # Base64 encoded 32-byte key
-            # Generate from provided key
-            key = base64.urlsafe_b64encode(key.encode()[:32].ljust(32, b'0'))
-        else:
-            key = key.encode()
-    return key
+        # Generate a new key if not set; data encrypted with it does not survive a restart
+        if _dev_key is None:
+            _dev_key = Fernet.generate_key()
+            logger.warning("Generated new encryption key. Set ENCRYPTION_KEY=%s in .env", _dev_key.decode())
+        return _dev_key
+    return _normalize_key(key)
+
+
+def get_encryption_keys() -> List[bytes]:
+    """Key ring, primary first, followed by the retired keys still accepted for decryption."""
+    previous = [k.strip() for k in settings.ENCRYPTION_PREVIOUS_KEYS.split(",") if k.strip()]
+    return [get_encryption_key()] + [_normalize_key(k) for k in previous]
+
+
+def key_id(key: bytes) -> str:
+    """Short, non-secret identifier of a key (recorded next to data encrypted with it)."""
+    return hashlib.sha256(b"key-id:" + key).hexdigest()[:12]
+
+
+def get_cipher() -> MultiFernet:
+    """Process-wide cipher: encrypts with the primary key, decrypts with any key in the ring."""
+    global _cipher, _primary_cipher, _primary_key_id, _ciphers_by_key_id
+    cipher = _cipher
+    if cipher is None:
+        with _cipher_lock:
+            if _cipher is None:
+                keys = get_encryption_keys()
+                fernets = [Fernet(key) for key in keys]
+                _primary_cipher = fernets[0]
+                _primary_key_id = key_id(keys[0])
+                _ciphers_by_key_id = {key_id(key): fernet for key, fernet in zip(keys, fernets)}
+                _cipher = MultiFernet(fernets)
+            cipher = _cipher
+    return cipher
+
+
+def get_primary_cipher() -> Fernet:
+    get_cipher()
+    return _primary_cipher
+
+
+def get_primary_key_id() -> str:
+    get_cipher()
+    return _primary_key_id
+
+
+def get_cipher_for(data_key_id: Optional[str]) -> Union[Fernet, MultiFernet]:
+    """The exact key for ``data_key_id``; the whole ring if the id is unknown or missing."""
+    cipher = get_cipher()
+    if data_key_id:
+        return _ciphers_by_key_id.get(data_key_id, cipher)
+    return cipher
+
+
+def reset_cipher() -> None:
+    """Drop the cached key ring, e.g. after changing the key settings at runtime."""
+    global _cipher, _primary_cipher, _primary_key_id, _ciphers_by_key_id
+    with _cipher_lock:
+        _cipher = None
+        _primary_cipher = None
+        _primary_key_id = None
+        _ciphers_by_key_id = {}
+
+
+def reencrypt_token(token: str) -> Optional[str]:
+    """Re-encrypt a Fernet token under the primary key.
+
+    Returns None if the token already uses the primary key. Raises
+    ``InvalidToken`` if no key in the ring can decrypt it.
+    """
+    token_bytes = token.encode() if isinstance(token, str) else token
+    try:
+        get_primary_cipher().decrypt(token_bytes)
+        return None
+    except InvalidToken:
+        pass
+    return get_cipher().rotate(token_bytes).decode()
 
 
 def encrypt_data(data: dict) -> str:
     """Encrypt sensitive data"""
-    key = get_encryption_key()
-    f = Fernet(key)
     data_str = json.dumps(data)
-    encrypted = f.encrypt(data_str.encode())
+    encrypted = get_cipher().encrypt(data_str.encode())
     return encrypted.decode()
 
 
@@ -39,44 +137,16 @@ def decrypt_data(encrypted_data: str) -> dict:
     if not encrypted_data:
         return {}
     
-    # First, try to decrypt as encrypted data (Fernet format)
+    if isinstance(encrypted_data, bytes):
+        encrypted_bytes = encrypted_data
+    else:
+        encrypted_bytes = encrypted_data.encode()
     try:
-        key = get_encryption_key()
-        f = Fernet(key)
-        # Handle both string and bytes input
-        if isinstance(encrypted_data, bytes):
-            encrypted_bytes = encrypted_data
-        else:
-            encrypted_bytes = encrypted_data.encode()
-        decrypted = f.decrypt(encrypted_bytes)
-        return json.loads(decrypted.decode())
-    except Exception as decrypt_error:
-        # If decryption fails, try to parse as plain JSON (for backward compatibility)
-        # This handles cases where:
-        # 1. Data was stored unencrypted (legacy data)
-        # 2. Data was encrypted with a different key
-        try:
-            # Try parsing as plain JSON string
-            if isinstance(encrypted_data, str):
-                parsed = json.loads(encrypted_data)
-                # If it's a dict, return it (might be unencrypted legacy data)
-                if isinstance(parsed, dict):
-                    print(f"Warning: Found unencrypted data (legacy format). Consider re-encrypting.")
-                    return parsed
-                return {}
-            else:
-                parsed = json.loads(encrypted_data.decode())
-                if isinstance(parsed, dict):
-                    return parsed
-                return {}
-        except (json.JSONDecodeError, AttributeError, UnicodeDecodeError) as json_error:
-            # If both fail, log detailed error information
-            error_type = type(decrypt_error).__name__
-            data_preview = str(encrypted_data)[:100] if encrypted_data else "None"
-            print(f"Decryption failed: {error_type} - {str(decrypt_error)[:200]}")
-            print(f"JSON parse also failed: {type(json_error).__name__} - {str(json_error)[:200]}")
-            print(f"Data preview (first 100 chars): {data_preview}")
-            print(f"Data length: {len(str(encrypted_data)) if encrypted_data else 0}")
-            # Return empty dict instead of raising to prevent API errors
-            return {}
-
+        if encrypted_bytes.startswith(b"gAAAAA"):  # Fernet token
+            encrypted_bytes = get_cipher().decrypt(encrypted_bytes)
+        parsed = json.loads(encrypted_bytes.decode())
+    except (InvalidToken, json.JSONDecodeError, UnicodeDecodeError) as exc:
+        # Never log the payload itself; it may contain patient data
+        logger.warning("Could not decode stored data (%s, %d bytes)", type(exc).__name__, len(encrypted_bytes))
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
@@ -0,0 +1,107 @@
+"""In-process cache of parsed form schemas for the hot request paths.
+
+Entries are keyed by ``(form_id, schema_version, schema_hash)``. Callers
+first read the form's version and hash with a narrow query that does not
+touch ``schema_json``. The potentially large schema is only loaded and
+compiled on a miss. The hash is part of the key because the id and version
+alone are not enough: another worker may have replaced the schema, or a
+deleted form's id may have been reused. ``update_form``/``delete_form`` also
+drop a form's entries on this worker right away.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.cache import LRUCache
+from app.config import settings
+from app.form_validation import CompiledFormSchema, FormSchemaError
+from app.models import Form
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedFormSchema:
+    form_id: int
+    version: int
+    schema_json: Dict[str, Any]
+    compiled: Optional[CompiledFormSchema]
+    error: Optional[str] = None  # why the stored schema could not be compiled
+
+
+_schemas = LRUCache("form_schemas", settings.FORM_SCHEMA_CACHE_SIZE)
+
+
+def _build(form_id: int, version: int, schema_json, content_hash: Optional[str]) -> CachedFormSchema:
+    try:
+        compiled, error = CompiledFormSchema(schema_json, content_hash=content_hash), None
+    except FormSchemaError as exc:
+        compiled, error = None, str(exc)
+    entry = CachedFormSchema(
+        form_id=form_id,
+        version=version,
+        schema_json=schema_json if isinstance(schema_json, dict) else {},
+        compiled=compiled,
+        error=error,
+    )
+    _schemas.set((form_id, version, content_hash), entry)
+    return entry
+
+
+def get_form_schema(db: Session, form_id: int) -> Optional[CachedFormSchema]:
+    """Current schema of a form, or None if the form does not exist."""
+    row = db.query(Form.schema_version, Form.schema_hash).filter(Form.id == form_id).first()
+    if row is None:
+        return None
+    version = row.schema_version or 1
+
+    entry = _schemas.get((form_id, version, row.schema_hash))
+    if entry is not None:
+        return entry
+
+    schema_json = db.query(Form.schema_json).filter(Form.id == form_id).scalar()
+    return _build(form_id, version, schema_json, row.schema_hash)
+
+
+def get_form_schemas(db: Session, forms: Iterable[Tuple[int, int, Optional[str]]]) -> Dict[int, CachedFormSchema]:
+    """Schemas for several ``(form_id, version, schema_hash)`` rows; misses are loaded in one query."""
+    result = {}
+    missing: List[Tuple[int, int, Optional[str]]] = []
+    for form_id, version, content_hash in forms:
+        version = version or 1
+        entry = _schemas.get((form_id, version, content_hash))
+        if entry is not None:
+            result[form_id] = entry
+        else:
+            missing.append((form_id, version, content_hash))
+
+    if missing:
+        schemas = dict(
+            db.query(Form.id, Form.schema_json).filter(Form.id.in_([form_id for form_id, _, _ in missing])).all()
+        )
+        for form_id, version, content_hash in missing:
+            if form_id in schemas:
+                result[form_id] = _build(form_id, version, schemas[form_id], content_hash)
+    return result
+
+
+def invalidate_form(form_id: int) -> None:
+    _schemas.pop_where(lambda key: key[0] == form_id)
+
+
+def form_schema_cache_stats() -> Dict[str, Any]:
+    return _schemas.stats()
+
+
+def log_invalid_form_schemas(db: Session) -> int:
+    """Warn about stored forms whose schema does not compile (they reject every submission); returns how many."""
+    invalid = 0
+    for form_id, name, schema_json in db.query(Form.id, Form.name, Form.schema_json).all():
+        try:
+            CompiledFormSchema(schema_json)
+        except FormSchemaError as exc:
+            invalid += 1
+            logger.warning("Form %s (%r) rejects every submission until its schema is fixed: %s", form_id, name, exc)
+    return invalid
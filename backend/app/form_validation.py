@@ -0,0 +1,209 @@
+"""Server-side validation of submission payloads against form schemas.
+
+A form's ``schema_json`` is compiled once into a ``CompiledFormSchema``: one
+small checker per field with regexes, option sets and bounds resolved up front.
+Checking a payload is then a single pass over those checkers instead of a
+re-walk of the raw schema. Compiled schemas are cached per form id, schema
+version and schema hash by ``app.form_cache``, so an edited form is recompiled
+on first use.
+
+The UI's own rules come from ``FormRenderer.validateField`` in the frontend:
+required fields (a required checkbox must be ticked; whitespace-only text is
+empty on both sides), number bounds, and ``validation.pattern`` on ``text``
+fields only. On top of those the server rejects values the UI cannot
+produce: select/radio values outside the options, non-boolean checkboxes
+and dates that do not parse.
+
+Patterns are written for JavaScript ``RegExp``. Named groups and named
+backreferences are translated to Python syntax. A pattern Python still
+cannot compile makes the form invalid: saving it is refused, and stored
+forms with such a pattern are logged at startup (app.form_cache).
+"""
+import hashlib
+import json
+import re
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+OPTION_FIELD_TYPES = {"select", "radio"}
+PATTERN_FIELD_TYPES = {"text"}
+
+_JS_NAMED_GROUP = re.compile(r"(?<!\\)\(\?<(?![=!])")
+_JS_NAMED_BACKREFERENCE = re.compile(r"\\k<(\w+)>")
+
+
+class FormSchemaError(ValueError):
+    """Raised when a form schema cannot be compiled (e.g. an invalid regex pattern)."""
+
+
+def schema_hash(schema_json: Any) -> str:
+    """Stable content hash of a form schema (key order independent)."""
+    canonical = json.dumps(schema_json, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def compile_js_pattern(pattern: str) -> "re.Pattern":
+    """Compile a JavaScript RegExp source with ``re``; raises ``re.error``."""
+    pattern = _JS_NAMED_GROUP.sub("(?P<", pattern)
+    pattern = _JS_NAMED_BACKREFERENCE.sub(r"(?P=\1)", pattern)
+    return re.compile(pattern)
+
+
+def _is_empty(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip() == ""
+    return False
+
+
+def _to_number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _to_date(value) -> Optional[date]:
+    if not isinstance(value, str):
+        return None
+    # Accept plain dates and full ISO timestamps (older clients sent Date.toISOString()).
+    try:
+        return date.fromisoformat(value.strip()[:10])
+    except ValueError:
+        return None
+
+
+def _compile_field_checker(field: dict) -> Callable[[Any], Optional[str]]:
+    """Build a checker returning an error message, or None when the value is valid."""
+    label = field.get("label") or field.get("name")
+    field_type = field.get("type") or "text"
+    validation = field.get("validation") if isinstance(field.get("validation"), dict) else {}
+
+    if field_type == "number":
+        minimum = _to_number(validation.get("min")) if validation.get("min") not in (None, "") else None
+        maximum = _to_number(validation.get("max")) if validation.get("max") not in (None, "") else None
+
+        def check_number(value):
+            number = _to_number(value)
+            if number is None or number != number:
+                return f"{label} must be a number"
+            if minimum is not None and number < minimum:
+                return f"{label} must be at least {validation.get('min')}"
+            if maximum is not None and number > maximum:
+                return f"{label} must be at most {validation.get('max')}"
+            return None
+
+        return check_number
+
+    if field_type == "date":
+        def check_date(value):
+            if _to_date(value) is None:
+                return f"{label} is not a valid date"
+            return None
+
+        return check_date
+
+    if field_type == "checkbox":
+        def check_checkbox(value):
+            if not isinstance(value, bool):
+                return f"{label} must be true or false"
+            return None
+
+        return check_checkbox
+
+    if field_type in OPTION_FIELD_TYPES and field.get("options"):
+        allowed = frozenset(str(option) for option in field["options"])
+        options_text = ", ".join(str(option) for option in field["options"])
+
+        def check_option(value):
+            if isinstance(value, (dict, list)) or str(value) not in allowed:
+                return f"{label} must be one of: {options_text}"
+            return None
+
+        return check_option
+
+    # text, textarea and unknown types: free text; only text fields check a pattern, as in the UI.
+    pattern = validation.get("pattern") if field_type in PATTERN_FIELD_TYPES else None
+    regex = None
+    if pattern:
+        try:
+            regex = compile_js_pattern(str(pattern))
+        except re.error as exc:
+            raise FormSchemaError(f"Field '{label}' has an invalid pattern: {exc}") from exc
+
+    def check_text(value):
+        if isinstance(value, (dict, list)):
+            return f"{label} must be a text value"
+        if regex is not None and not regex.search(str(value)):
+            return f"{label} format is invalid"
+        return None
+
+    return check_text
+
+
+class CompiledFormSchema:
+    """A form schema reduced to the data the submit path needs."""
+
+    __slots__ = ("schema_hash", "fields", "field_types", "required_fields", "unique_key_fields", "_checkers")
+
+    def __init__(self, schema_json: Any, content_hash: Optional[str] = None):
+        raw_fields = schema_json.get("fields", []) if isinstance(schema_json, dict) else []
+        fields = [field for field in raw_fields if isinstance(field, dict) and field.get("name")]
+
+        self.schema_hash = content_hash or schema_hash(schema_json)
+        self.fields = tuple(fields)
+        self.field_types = {field["name"]: field.get("type") or "text" for field in fields}
+        self.required_fields = tuple(field["name"] for field in fields if field.get("required") is True)
+        self.unique_key_fields = tuple(field for field in fields if field.get("unique_key") is True)
+
+        checkers: List[Tuple[str, str, bool, bool, Callable[[Any], Optional[str]]]] = []
+        for field in fields:
+            checkers.append((
+                field["name"],
+                field.get("label") or field["name"],
+                field.get("required") is True,
+                (field.get("type") or "text") == "checkbox",
+                _compile_field_checker(field),
+            ))
+        self._checkers = tuple(checkers)
+
+    def validate(self, data_json: dict) -> List[str]:
+        """Return the list of validation errors for one payload (empty when valid)."""
+        if not isinstance(data_json, dict):
+            return ["Submission data must be an object"]
+
+        errors = []
+        for name, label, required, is_checkbox, check in self._checkers:
+            value = data_json.get(name)
+            if is_checkbox and required and value is not True:
+                errors.append(f"{label} is required")
+                continue
+            if _is_empty(value):
+                if required:
+                    errors.append(f"{label} is required")
+                continue
+            error = check(value)
+            if error is not None:
+                errors.append(error)
+        return errors
+
+    def validate_many(self, payloads: Iterable[dict]) -> Dict[int, List[str]]:
+        """Validate a batch of payloads (e.g. an import); returns errors keyed by position."""
+        failures = {}
+        for index, payload in enumerate(payloads):
+            errors = self.validate(payload)
+            if errors:
+                failures[index] = errors
+        return failures
+
+
+def validate_schema_definition(schema_json: Any) -> None:
+    """Compile a schema eagerly so broken definitions are rejected when the form is saved."""
+    CompiledFormSchema(schema_json)
@@ -1,17 +1,32 @@
 import logging
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from app.database import engine, Base
+from app.database import SessionLocal, engine, dispose_async_engine, start_sqlite_maintenance_thread
+from app.form_cache import log_invalid_form_schemas
+from app.migrations import ensure_schema_current
 from app.config import settings
-from app.api import auth, users, hospitals, studies, forms, submissions, export
+from app.middleware.http_middleware import (
+    MetricsMiddleware,
+    ProfilingMiddleware,
+    QueryBudgetMiddleware,
+    RequestContextMiddleware,
+    SecurityHeadersMiddleware,
+    TracingMiddleware,
+    UnhandledErrorMiddleware,
+)
+from app.tracing import trace_endpoints
+from app.api import auth, users, hospitals, studies, forms, submissions, export, admin, metrics
+from app.unique_keys import queue_stale_unique_key_reindex, start_resume_thread
+from app.reencryption import start_resume_thread as start_reencryption_resume_thread
+from app.payload_normalizer import start_resume_thread as start_normalizer_resume_thread
+from app.backfill import start_resume_thread as start_backfill_resume_thread
+from app.password_hashing import PasswordHashingBusy
+from app.write_queue import WriteQueueBusy
+from app.query_budget import QueryBudgetExceeded
 
 logger = logging.getLogger(__name__)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="Oncology Research Data Collection API",
     description="API for collecting medical research data from multiple hospitals",
@@ -26,70 +41,122 @@ app = FastAPI(
 def startup_validate_secrets():
     """In production, require SECRET_KEY and ENCRYPTION_KEY to be set."""
     settings.validate_production_secrets()
+    settings.validate_encryption_settings()
+
+
+@app.on_event("startup")
+def startup_check_schema_version():
+    """Check the schema version; apply pending migrations if DB_MIGRATE_ON_STARTUP (before jobs resume)."""
+    ensure_schema_current(engine)
+
+
+@app.on_event("startup")
+def startup_check_form_schemas():
+    """Log stored forms whose schema no longer compiles (e.g. a JavaScript-only pattern)."""
+    db = SessionLocal()
+    try:
+        log_invalid_form_schemas(db)
+    finally:
+        db.close()
+
 
+@app.on_event("startup")
+def startup_queue_stale_unique_key_reindex():
+    """Queue re-index jobs for forms whose unique keys predate the current encryption settings."""
+    db = SessionLocal()
+    try:
+        queue_stale_unique_key_reindex(db)
+    finally:
+        db.close()
 
-# Security headers middleware
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        if settings.is_production:
-            # Only set when served over HTTPS (e.g. behind TLS termination)
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        return response
 
+@app.on_event("startup")
+def startup_resume_reindex_jobs():
+    """Resume unique-key re-index jobs interrupted by a restart."""
+    start_resume_thread()
+
+
+@app.on_event("startup")
+def startup_resume_reencryption_jobs():
+    """Resume re-encryption jobs interrupted by a restart."""
+    start_reencryption_resume_thread()
 
-app.add_middleware(SecurityHeadersMiddleware)
 
-# CORS middleware
-cors_origins = settings.cors_origins_list
+@app.on_event("startup")
+def startup_resume_payload_normalization_jobs():
+    """Resume payload normalisation jobs interrupted by a restart."""
+    start_normalizer_resume_thread()
+
+
+@app.on_event("startup")
+def startup_resume_backfill_runs():
+    """Resume named backfill runs interrupted by a restart."""
+    start_backfill_resume_thread()
+
+
+@app.on_event("startup")
+def startup_sqlite_maintenance():
+    """Run PRAGMA optimize now and periodically (SQLite only)."""
+    start_sqlite_maintenance_thread()
+
+
+@app.on_event("shutdown")
+async def shutdown_async_engine():
+    """Close the async engine's pooled connections."""
+    await dispose_async_engine()
+
+
+# Middleware, outermost first: request context, profiling, tracing, query budget, metrics, CORS,
+# security headers, then the generic 500 for unhandled exceptions (inside CORS, so error responses
+# carry CORS headers too).
+app.add_middleware(UnhandledErrorMiddleware)
+app.add_middleware(SecurityHeadersMiddleware, hsts=settings.is_production)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=cors_origins,
+    allow_origins=settings.cors_origins_list,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
     expose_headers=["*"],
     max_age=3600,
 )
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if settings.QUERY_BUDGET_ENABLED:
+    app.add_middleware(QueryBudgetMiddleware)
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    """Shed login/password load quickly instead of queueing behind bcrypt."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication service is busy, please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(WriteQueueBusy)
+async def write_queue_busy_handler(request: Request, exc: WriteQueueBusy):
+    """Tell clients to retry a write that waited too long for the SQLite writer."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The database is busy, please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(QueryBudgetExceeded)
+async def query_budget_exceeded_handler(request: Request, exc: QueryBudgetExceeded):
+    """Fail a request over its SQL statement budget loudly (QUERY_BUDGET_MODE=raise, tests only)."""
+    return JSONResponse(status_code=500, content={"detail": str(exc)})
 
 
-@app.exception_handler(HTTPException)
-async def http_exception_handler(request: Request, exc: HTTPException):
-    """Ensure CORS headers are included in HTTPException responses."""
-    origin = request.headers.get("origin")
-    if origin in cors_origins:
-        response = JSONResponse(
-            status_code=exc.status_code,
-            content={"detail": exc.detail},
-            headers={
-                "Access-Control-Allow-Origin": origin,
-                "Access-Control-Allow-Credentials": "true",
-            },
-        )
-        return response
-    raise exc
-
-
-@app.exception_handler(Exception)
-async def global_exception_handler(request: Request, exc: Exception):
-    """Log exception server-side; return generic message to client."""
-    logger.exception("Unhandled exception: %s", exc)
-    origin = request.headers.get("origin")
-    if origin in cors_origins:
-        response = JSONResponse(
-            status_code=500,
-            content={"detail": "Internal server error"},
-            headers={
-                "Access-Control-Allow-Origin": origin,
-                "Access-Control-Allow-Credentials": "true",
-            },
-        )
-        return response
-    raise exc
-
 # Include routers
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -98,6 +165,9 @@ app.include_router(studies.router)
 app.include_router(forms.router)
 app.include_router(submissions.router)
 app.include_router(export.router)
+app.include_router(admin.router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -110,3 +180,7 @@ def root():
         payload["docs"] = "/docs"
     return payload
 
+
+if settings.TRACING_ENABLED:
+    # After every route is registered, so each endpoint gets a "handler" span.
+    trace_endpoints(app.routes)
@@ -0,0 +1,254 @@
+"""In-process metrics, served in the Prometheus text format at ``/metrics``.
+
+Counters, gauges and histograms are plain Python objects that each hold a
+lock and a dict. Recording a request costs a few dict updates, so once
+enabled (``METRICS_ENABLED``, off by default) the instrumentation can stay
+on in production.
+
+- ``MetricsMiddleware`` (app.middleware.http_middleware) records count,
+  latency, response size and in-flight requests. Requests are labelled by
+  route template (``/api/forms/{form_id}``), never by raw path, so the number
+  of series stays bounded.
+- ``instrument_engine`` times every statement with SQLAlchemy cursor events.
+  It adds them to the current request's ``RequestDbUsage``, reported as
+  per-request statement count and DB time.
+- Collectors registered with ``register_collector`` run at scrape time. They
+  read the existing stats (connection pools, caches, bcrypt pool, write
+  queue, threadpool) without keeping series of their own.
+
+Each worker process keeps its own numbers. With several workers, scrape each
+one, or read the totals as a per-worker sample.
+"""
+import bisect
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# A sample: metric name (with suffix), label pairs, value.
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+# A collector yields (name, type, help, samples) families at scrape time.
+Family = Tuple[str, str, str, List[Sample]]
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Family]]] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _labels(self, values: Tuple[str, ...]) -> Tuple[Tuple[str, str], ...]:
+        return tuple(zip(self.labelnames, values))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(labels), value) for labels, value in values]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._labels(labels), value) for labels, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last = +Inf)], sum
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        samples = []
+        for labels, counts, total in values:
+            label_pairs = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", label_pairs + (("le", _format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", label_pairs, total))
+            samples.append((f"{self.name}_count", label_pairs, cumulative))
+        return samples
+
+
+def percentile_ms(samples: Sequence[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of durations in seconds, in milliseconds (None without samples)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index] * 1000, 2)
+
+
+def register_collector(collector: Callable[[], Iterable[Family]]) -> None:
+    with _registry_lock:
+        _collectors.append(collector)
+
+
+def render() -> str:
+    """All metrics and collector output in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    families: List[Family] = [(m.name, m.kind, m.documentation, m.samples()) for m in metrics]
+    for collector in collectors:
+        families.extend(collector())
+
+    lines = []
+    for name, kind, documentation, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            if labels:
+                rendered = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels)
+                lines.append(f"{sample_name}{{{rendered}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def gauge_family(name: str, documentation: str, values: Iterable[Tuple[Dict[str, str], Optional[float]]],
+                 kind: str = "gauge") -> Family:
+    """A collector family from (labels, value) pairs; None values are skipped."""
+    samples = [(name, tuple(labels.items()), value) for labels, value in values if value is not None]
+    return name, kind, documentation, samples
+
+
+# HTTP
+
+http_requests = Counter("http_requests_total", "HTTP requests by method, route template and status.",
+                        ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency, to the last body byte.",
+                                  ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+http_response_size = Histogram("http_response_size_bytes", "HTTP response body size.",
+                               ("method", "route"), buckets=SIZE_BUCKETS)
+http_request_db_statements = Histogram("http_request_db_statements", "Database statements executed per request.",
+                                       ("method", "route"), buckets=COUNT_BUCKETS)
+http_request_db_seconds = Histogram("http_request_db_seconds", "Time spent in database statements per request.",
+                                    ("method", "route"))
+
+# Database
+
+db_statements = Counter("db_statements_total", "Database statements executed, by engine.", ("engine",))
+db_statement_duration = Histogram("db_statement_duration_seconds", "Database statement latency, by engine.",
+                                  ("engine",))
+
+# Long-running operations
+
+export_duration = Histogram("export_duration_seconds", "Time to stream a complete export.", ("format",),
+                            buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+export_rows = Counter("export_rows_total", "Submissions written by exports.", ("format",))
+study_profile_duration = Histogram("study_profile_duration_seconds",
+                                   "Time to build a study's per-form dataframe profiles.")
+
+
+class RequestDbUsage:
+    """Statements and DB time of one request; shared with the threads that serve it."""
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+request_db_usage: ContextVar[Optional[RequestDbUsage]] = ContextVar("request_db_usage", default=None)
+
+
+def instrument_engine(target, role: str) -> None:
+    """Count and time every statement run on ``target`` (a sync Engine)."""
+    labels = (role,)
+
+    @event.listens_for(target, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        elapsed = time.perf_counter() - started
+        db_statements.inc(labels)
+        db_statement_duration.observe(elapsed, labels)
+        usage = request_db_usage.get()
+        if usage is not None:
+            usage.statements += 1
+            usage.seconds += elapsed
+
+    @event.listens_for(target, "handle_error")
+    def _drop_timer(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_started"):
+            conn.info["metrics_started"].pop()
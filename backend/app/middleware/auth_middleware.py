@@ -2,10 +2,13 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from typing import Optional
-from app.database import get_db
+from app.database import get_db, note_session_user
 from app.models import User
 from app.auth import decode_access_token
+from app.auth_cache import Principal, cache_principal, cache_token, get_cached_principal, get_cached_token
+from app.api_keys import authenticate_api_key, enforce_api_key_scope, get_api_key_from_request
 from app.config import settings
+from app.tracing import traced
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
@@ -21,43 +24,72 @@ def get_token_from_request(request: Request) -> Optional[str]:
     return None
 
 
+@traced("auth")
 def get_current_user(
     request: Request,
     db: Session = Depends(get_db),
 ) -> User:
-    """Get current authenticated user (token from cookie or Bearer header)."""
+    """Get current authenticated user (API key, token from cookie, or Bearer header).
+
+    A service API key authenticates as its owning user, restricted to the key's scopes
+    (see app.api_keys); the key context is left on ``request.state.api_key``.
+
+    Verified tokens and user principals are cached briefly (see app.auth_cache), so
+    repeated calls with the same token do not decode the JWT or query the database.
+    The returned User is a transient object and must not be added to a session.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    token = get_token_from_request(request)
-    if not token:
-        raise credentials_exception
-    payload = decode_access_token(token)
-    if payload is None:
-        raise credentials_exception
-    
-    user_id_str = payload.get("sub")
-    if user_id_str is None:
-        raise credentials_exception
-    
-    try:
-        user_id = int(user_id_str)
-    except (ValueError, TypeError):
-        raise credentials_exception
+    api_key = get_api_key_from_request(request)
+    if api_key:
+        context = authenticate_api_key(db, api_key)
+        if context is None:
+            raise credentials_exception
+        enforce_api_key_scope(request, context)
+        request.state.api_key = context
+        user_id = context.user_id
+    else:
+        token = get_token_from_request(request)
+        if not token:
+            raise credentials_exception
+        payload = get_cached_token(token)
+        if payload is None:
+            payload = decode_access_token(token)
+            if payload is None:
+                raise credentials_exception
+            cache_token(token, payload)
+        
+        user_id_str = payload.get("sub")
+        if user_id_str is None:
+            raise credentials_exception
+        
+        try:
+            user_id = int(user_id_str)
+        except (ValueError, TypeError):
+            raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise credentials_exception
+    principal = get_cached_principal(user_id)
+    if principal is None:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+        cache_principal(principal)
+    if db.in_transaction():
+        # Hand the connection back now rather than holding it for the rest of the request.
+        db.close()
+    note_session_user(db, user_id)
     
-    if not user.is_active:
+    if not principal.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is inactive"
         )
     
-    return user
+    return principal.to_user()
 
 
 def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
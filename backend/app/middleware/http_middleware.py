@@ -0,0 +1,320 @@
+"""Pure ASGI middleware applied to every HTTP response.
+
+- ``RequestContextMiddleware`` makes the request's route known to code that
+  runs for it, such as the slow-query log (see app.request_context).
+- ``MetricsMiddleware`` records the request metrics served at ``/metrics``
+  (see app.metrics). It is outside CORS, so its timings include CORS handling.
+- ``ProfilingMiddleware`` runs an admin's flagged request under a sampling
+  profiler and stores the profile (see app.profiling).
+- ``TracingMiddleware`` records spans (auth, DB, payload decoding, handler,
+  serialisation, streaming) into a trace file and, in development, a
+  ``Server-Timing`` header (see app.tracing).
+- ``QueryBudgetMiddleware`` (development and tests) counts each request's SQL
+  statements against its route's budget (see app.query_budget).
+- ``SecurityHeadersMiddleware`` sets the security headers on every response.
+- ``UnhandledErrorMiddleware`` logs uncaught exceptions and answers with a
+  generic JSON 500, or aborts a response that has already started.
+
+The last two run inside ``CORSMiddleware``, so their responses, including
+the generic 500, get CORS headers the usual way.
+
+The others only wrap ``send``. They look at the ``http.response.start``
+message and pass body chunks through untouched.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.metrics import (
+    RequestDbUsage,
+    http_request_db_seconds,
+    http_request_db_statements,
+    http_request_duration,
+    http_requests,
+    http_requests_in_flight,
+    http_response_size,
+    request_db_usage,
+)
+from app.config import settings
+from app.profiling import (
+    SamplingProfiler,
+    authorize_profiling,
+    finish_profiling,
+    has_credentials,
+    new_profile_id,
+    profile_requested,
+    save_profile,
+    try_start_profiling,
+)
+from app.query_budget import RequestQueries, report_request, request_queries
+from app.request_context import request_scope, route_template
+from app.tracing import Span, Trace, current_span, current_trace, export_trace
+
+logger = logging.getLogger(__name__)
+
+# Other methods are counted as OTHER so a scanner cannot create unbounded series.
+_KNOWN_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+
+class MetricsMiddleware:
+    """Record count, latency, response size and DB usage per route template.
+
+    Latency and DB usage stop at the last body byte, so background tasks run
+    after the response (e.g. starting a job) are not charged to the request.
+    Requests that match no route, CORS preflights included, are labelled
+    ``unmatched``.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        usage = RequestDbUsage()
+        status_code = 500
+        body_bytes = 0
+        finished = None
+        finished_usage = None
+
+        async def send_measuring(message: Message) -> None:
+            nonlocal status_code, body_bytes, finished, finished_usage
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    finished = time.perf_counter()
+                    finished_usage = (usage.statements, usage.seconds)
+            await send(message)
+
+        token = request_db_usage.set(usage)
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_measuring)
+        finally:
+            request_db_usage.reset(token)
+            http_requests_in_flight.dec()
+            elapsed = (finished or time.perf_counter()) - started
+            statements, db_seconds = finished_usage or (usage.statements, usage.seconds)
+            method = scope["method"] if scope["method"] in _KNOWN_METHODS else "OTHER"
+            labels = (method, route_template(scope))
+            http_requests.inc(labels + (str(status_code),))
+            http_request_duration.observe(elapsed, labels)
+            http_response_size.observe(body_bytes, labels)
+            http_request_db_statements.observe(statements, labels)
+            http_request_db_seconds.observe(db_seconds, labels)
+
+
+class RequestContextMiddleware:
+    """Expose the request's scope to code running for it (see app.request_context)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_scope.reset(token)
+
+
+class QueryBudgetMiddleware:
+    """Count each request's SQL statements into X-DB-Queries and flag N+1s (see app.query_budget)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope)
+
+        async def send_with_count(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *queries.headers()]
+            await send(message)
+
+        token = request_queries.set(queries)
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            request_queries.reset(token)
+            report_request(queries)
+
+
+class ProfilingMiddleware:
+    """Profile an admin's request flagged with X-Profile or _profile=1 (see app.profiling)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profile_requested(scope) or not has_credentials(scope):
+            await self.app(scope, receive, send)
+            return
+        admin = await run_in_threadpool(authorize_profiling, scope)
+        if admin is None or not try_start_profiling():
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id()
+        status_code = None
+
+        async def send_with_profile_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(settings.PROFILING_SAMPLE_INTERVAL_MS / 1000, threading.get_ident())
+        started = time.perf_counter()
+        try:
+            profiler.start()
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            try:
+                profiler.stop()
+            finally:
+                finish_profiling()
+            meta = {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route_template(scope),
+                "status_code": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "requested_by": admin.id,
+            }
+            try:
+                await run_in_threadpool(save_profile, profile_id, profiler, meta)
+            except OSError:
+                logger.exception("Could not save profile %s", profile_id)
+
+
+class TracingMiddleware:
+    """Trace each request into TRACE_FILE and, with TRACE_SERVER_TIMING, a Server-Timing header (see app.tracing)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope)
+        response_started = None
+
+        async def send_traced(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = time.perf_counter_ns()
+                trace.status_code = message["status"]
+                handler_end = trace.last_span_end("handler")
+                if handler_end is not None:
+                    serialize = Span("serialize", trace.root.span_id, handler_end)
+                    serialize.end = response_started
+                    trace.add(serialize)
+                if settings.TRACE_SERVER_TIMING:
+                    message["headers"] = [
+                        *message.get("headers", ()),
+                        (b"server-timing", trace.server_timing(response_started)),
+                    ]
+            await send(message)
+
+        trace_token = current_trace.set(trace)
+        span_token = current_span.set(trace.root)
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            current_span.reset(span_token)
+            current_trace.reset(trace_token)
+            end = time.perf_counter_ns()
+            if response_started is not None:
+                stream = Span("stream", trace.root.span_id, response_started)
+                stream.end = end
+                trace.add(stream)
+            trace.finish(end)
+            export_trace(trace)
+
+
+class SecurityHeadersMiddleware:
+    """Set the security headers on every HTTP response, replacing any the endpoint set."""
+
+    def __init__(self, app: ASGIApp, hsts: bool = False):
+        self.app = app
+        self.headers = [
+            (b"x-content-type-options", b"nosniff"),
+            (b"x-frame-options", b"DENY"),
+            (b"referrer-policy", b"strict-origin-when-cross-origin"),
+        ]
+        if hsts:
+            # Only set when served over HTTPS (e.g. behind TLS termination)
+            self.headers.append((b"strict-transport-security", b"max-age=31536000; includeSubDomains"))
+        self.names = frozenset(name for name, _ in self.headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # A new list: Starlette responses pass their own raw_headers list in the message.
+                message["headers"] = [
+                    *(header for header in message.get("headers", ()) if header[0] not in self.names),
+                    *self.headers,
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class UnhandledErrorMiddleware:
+    """Log exceptions no handler caught and answer with a generic JSON 500.
+
+    If the response has already started (e.g. an export failing part way
+    through its stream), the exception is re-raised so the server aborts the
+    connection instead of appending an error to a half-sent body.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_tracking_start(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_tracking_start)
+        except Exception as exc:
+            if response_started:
+                raise
+            logger.exception("Unhandled exception: %s", exc)
+            response = JSONResponse(status_code=500, content={"detail": "Internal server error"})
+            await response(scope, receive, send)
@@ -0,0 +1,200 @@
+"""Versioned schema migrations.
+
+Each module in ``app/migrations/versions`` named ``v<NNNN>_<name>.py`` is one
+migration. It defines ``upgrade(conn)``, and its docstring describes it.
+Migrations run in version order. Each one runs in its own transaction,
+together with the row that records it in the ``schema_version`` table.
+SQLite and Postgres both have transactional DDL, so a failed migration
+leaves nothing behind.
+
+A fresh database starts at version 0 and runs every migration. ``v0001_baseline``
+creates the whole schema and also absorbs the old ``migrate_*.py`` scripts,
+so a database that predates this runner is brought up to date the same way.
+Later migrations only ever run once, on a database at the previous version.
+They can therefore be plain DDL. When you change ``app/models.py``, add the
+matching migration. Rewrites of existing rows in large tables do not belong in
+a migration, which holds the migration lock for its whole run. Register them
+as a backfill in ``app.backfill`` instead; a backfill runs online in
+throttled, resumable batches.
+
+The app itself only reads the current version at startup (``ensure_schema_current``).
+Pending migrations are applied there when ``DB_MIGRATE_ON_STARTUP`` is set.
+Otherwise the app refuses to start until they are applied with the CLI::
+
+    python -m app.migrations status
+    python -m app.migrations upgrade [--to N]
+    python -m app.migrations stamp N
+
+Concurrent upgrades (several workers starting at once) are serialised. Postgres
+uses an advisory lock. SQLite uses ``BEGIN IMMEDIATE``. The version is
+re-read under the lock, so each migration is applied once.
+"""
+import importlib
+import logging
+import pkgutil
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import ModuleType
+from typing import Iterator, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MODULE_NAME = re.compile(r"^v(\d{4})_(\w+)$")
+# Arbitrary constant identifying the migration lock among Postgres advisory locks.
+_ADVISORY_LOCK_KEY = 73_114_201
+
+_metadata = MetaData()
+schema_version = Table(
+    "schema_version", _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    module: ModuleType
+
+    @property
+    def description(self) -> str:
+        doc = (self.module.__doc__ or "").strip()
+        return doc.splitlines()[0] if doc else ""
+
+
+def load_migrations() -> List[Migration]:
+    """All migrations in version order."""
+    from app.migrations import versions
+
+    migrations = []
+    for info in pkgutil.iter_modules(versions.__path__):
+        match = _MODULE_NAME.match(info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{versions.__name__}.{info.name}")
+        migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda migration: migration.version)
+    seen = set()
+    for migration in migrations:
+        if migration.version in seen:
+            raise RuntimeError(f"Duplicate migration version {migration.version}")
+        seen.add(migration.version)
+    return migrations
+
+
+def head_version() -> int:
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+def create_migration_engine(url: Optional[str] = None) -> Engine:
+    """A pool-less engine for running migrations, with explicit BEGIN on SQLite."""
+    url = url or settings.DATABASE_URL
+    if url.startswith("sqlite"):
+        from app.database import configure_sqlite_engine, configure_sqlite_transactions
+
+        migration_engine = create_engine(url, poolclass=NullPool)
+        if settings.SQLITE_TUNING_ENABLED:
+            configure_sqlite_engine(migration_engine)
+        else:
+            configure_sqlite_transactions(migration_engine)
+        return migration_engine
+    connect_args = {"application_name": f"{settings.DB_APPLICATION_NAME}-migrate"} if settings.DB_APPLICATION_NAME else {}
+    return create_engine(url, poolclass=NullPool, connect_args=connect_args)
+
+
+def current_version(target: Engine) -> int:
+    """The highest applied version; 0 for a new or pre-versioning database."""
+    try:
+        with target.connect() as conn:
+            return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except DBAPIError:
+        if inspect(target).has_table(schema_version.name):
+            raise
+        return 0
+
+
+@contextmanager
+def _locked_transaction(target: Engine) -> Iterator[Connection]:
+    """A write transaction that holds the migration lock until it ends."""
+    with target.connect() as conn:
+        conn = conn.execution_options(sqlite_begin="immediate")
+        with conn.begin():
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+            schema_version.create(conn, checkfirst=True)
+            yield conn
+
+
+def _applied_version(conn: Connection) -> int:
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def _record(conn: Connection, migration: Migration) -> None:
+    conn.execute(schema_version.insert().values(
+        version=migration.version, name=migration.name, applied_at=datetime.now(timezone.utc),
+    ))
+
+
+def upgrade(url: Optional[str] = None, target_version: Optional[int] = None) -> int:
+    """Apply pending migrations up to ``target_version`` (default: all); returns the new version."""
+    migration_engine = create_migration_engine(url)
+    try:
+        version = current_version(migration_engine)
+        for migration in load_migrations():
+            if migration.version <= version:
+                continue
+            if target_version is not None and migration.version > target_version:
+                break
+            with _locked_transaction(migration_engine) as conn:
+                # Another process may have applied it while this one waited for the lock.
+                if _applied_version(conn) >= migration.version:
+                    continue
+                logger.info("Applying migration %04d_%s", migration.version, migration.name)
+                migration.module.upgrade(conn)
+                _record(conn, migration)
+            version = migration.version
+        return current_version(migration_engine)
+    finally:
+        migration_engine.dispose()
+
+
+def stamp(version: int, url: Optional[str] = None) -> None:
+    """Record migrations up to ``version`` as applied without running them."""
+    migration_engine = create_migration_engine(url)
+    try:
+        with _locked_transaction(migration_engine) as conn:
+            applied = _applied_version(conn)
+            for migration in load_migrations():
+                if applied < migration.version <= version:
+                    _record(conn, migration)
+    finally:
+        migration_engine.dispose()
+
+
+def ensure_schema_current(target: Engine) -> None:
+    """Startup check: one version query, plus an upgrade if allowed and needed."""
+    version = current_version(target)
+    head = head_version()
+    if version == head:
+        return
+    if version > head:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code (head {head}); deploy the newer code."
+        )
+    if not settings.DB_MIGRATE_ON_STARTUP:
+        raise RuntimeError(
+            f"Database schema is at version {version}, code expects {head}. "
+            "Run 'python -m app.migrations upgrade' (or set DB_MIGRATE_ON_STARTUP=true)."
+        )
+    logger.info("Upgrading database schema from version %s to %s", version, head)
+    upgrade(target.url.render_as_string(hide_password=False))
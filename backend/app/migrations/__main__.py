@@ -0,0 +1,53 @@
+"""Command line for the schema migrations (run from backend/).
+
+    python -m app.migrations status
+    python -m app.migrations upgrade [--to N]
+    python -m app.migrations stamp N
+
+``--database-url`` overrides DATABASE_URL.
+"""
+import argparse
+import logging
+import sys
+
+from app.config import settings
+from app.migrations import create_migration_engine, current_version, load_migrations, stamp, upgrade
+
+
+def _status(url: str) -> int:
+    migration_engine = create_migration_engine(url)
+    try:
+        version = current_version(migration_engine)
+    finally:
+        migration_engine.dispose()
+    for migration in load_migrations():
+        state = "applied" if migration.version <= version else "pending"
+        print(f"{migration.version:04d}  {state:8}  {migration.name}: {migration.description}")
+    print(f"Current version: {version}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description="Database schema migrations")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="list migrations and the current version")
+    upgrade_parser = commands.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--to", type=int, default=None, help="stop at this version")
+    stamp_parser = commands.add_parser("stamp", help="mark migrations up to a version as applied without running them")
+    stamp_parser.add_argument("version", type=int)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "status":
+        return _status(args.database_url)
+    if args.command == "upgrade":
+        print(f"Database schema is at version {upgrade(args.database_url, args.to)}")
+        return 0
+    stamp(args.version, args.database_url)
+    print(f"Stamped version {args.version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
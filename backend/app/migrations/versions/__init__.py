@@ -0,0 +1 @@
+# Migration modules: v<NNNN>_<name>.py, applied in version order (see app.migrations)
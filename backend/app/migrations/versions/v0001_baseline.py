@@ -0,0 +1,440 @@
+"""Baseline schema; brings databases from before versioned migrations up to date.
+
+On a new database this only creates the tables below, a frozen copy of the
+models at the time versioning was introduced. On an existing database it
+creates whichever of those tables are missing. It then repeats what the old
+``migrate_*.py`` scripts did, each step only if still needed:
+
+- studies: ``is_archived``, the metadata columns and ``status`` (mapped from
+  ``is_archived``) are added, and the legacy ``data_submission_deadline`` column
+  is dropped (SQLite 3.35 or later);
+- forms: every unversioned form without a unique key field gets one, chosen as
+  the old script did; ``schema_version`` / ``schema_hash`` are added and each
+  form's first ``form_versions`` row is recorded;
+- submissions: ``schema_version``, ``data_format`` and ``data_key_id`` are
+  added; ``updated_at`` is backfilled from ``created_at``;
+- submission_unique_keys: forms whose key rows are missing or use another key
+  name (e.g. per-field rows for a composed key) get a unique-key re-index job.
+  The app runs it in the background after startup and reports duplicates
+  instead of aborting. The submissions of all other forms get
+  ``schema_version`` 1. Submissions tagged with a job's version count as
+  already keyed, so the re-indexed ones stay untagged.
+
+Untagged payloads stay readable. Tag them with the payload normaliser
+(``POST /api/admin/payload-normalization-jobs``).
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    JSON, Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    UniqueConstraint, case, func, inspect, or_, select, type_coerce,
+)
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True, nullable=False),
+    Column("password_hash", String, nullable=False),
+    Column("full_name", String, nullable=False),
+    Column("role", String),
+    Column("hospital_id", Integer, ForeignKey("hospitals.id"), nullable=True),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+refresh_tokens = Table(
+    "refresh_tokens", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("token_hash", String, nullable=False, unique=True, index=True),
+    Column("family_id", String, nullable=False, index=True),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    Column("revoked_at", DateTime(timezone=True), nullable=True),
+    Column("replaced_by_id", Integer, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+api_keys = Table(
+    "api_keys", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False),
+    Column("prefix", String, nullable=False, unique=True, index=True),
+    Column("key_hash", String, nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("scopes", JSON, nullable=False),
+    Column("study_id", Integer, ForeignKey("studies.id"), nullable=True),
+    Column("created_by", Integer, ForeignKey("users.id"), nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("expires_at", DateTime(timezone=True), nullable=True),
+    Column("revoked_at", DateTime(timezone=True), nullable=True),
+    Column("last_used_at", DateTime(timezone=True), nullable=True),
+)
+
+hospitals = Table(
+    "hospitals", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False, index=True),
+    Column("address", Text, nullable=True),
+    Column("contact_info", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+studies = Table(
+    "studies", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False, index=True),
+    Column("description", Text, nullable=True),
+    Column("title", String, nullable=True),
+    Column("summary", Text, nullable=True),
+    Column("primary_coordinating_center", String, nullable=True),
+    Column("principal_investigator_name", String, nullable=True),
+    Column("principal_investigator_email", String, nullable=True),
+    Column("sub_investigator_name", String, nullable=True),
+    Column("sub_investigator_email", String, nullable=True),
+    Column("general_objective", Text, nullable=True),
+    Column("specific_objectives", Text, nullable=True),
+    Column("inclusion_exclusion_criteria", Text, nullable=True),
+    Column("data_collection_deadline", Date, nullable=True),
+    Column("status", String, nullable=False, index=True),
+    Column("created_by", Integer, ForeignKey("users.id"), nullable=False),
+    Column("is_active", Boolean),
+    Column("is_archived", Boolean, index=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+forms = Table(
+    "forms", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False, index=True),
+    Column("description", Text, nullable=True),
+    Column("schema_json", JSON, nullable=False),
+    Column("schema_version", Integer, nullable=False),
+    Column("schema_hash", String, nullable=True),
+    Column("created_by", Integer, ForeignKey("users.id"), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+form_versions = Table(
+    "form_versions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("form_id", Integer, ForeignKey("forms.id"), nullable=False, index=True),
+    Column("version", Integer, nullable=False),
+    Column("schema_json", JSON, nullable=False),
+    Column("schema_hash", String, nullable=False, index=True),
+    Column("created_by", Integer, ForeignKey("users.id"), nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    UniqueConstraint("form_id", "version", name="uq_form_version"),
+)
+
+study_forms = Table(
+    "study_forms", metadata,
+    Column("study_id", Integer, ForeignKey("studies.id"), primary_key=True),
+    Column("form_id", Integer, ForeignKey("forms.id"), primary_key=True),
+)
+
+submissions = Table(
+    "submissions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("form_id", Integer, ForeignKey("forms.id"), nullable=False),
+    Column("study_id", Integer, ForeignKey("studies.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("data_json", Text, nullable=False),
+    Column("data_format", String, nullable=True),
+    Column("data_key_id", String, nullable=True),
+    Column("schema_version", Integer, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+submission_unique_keys = Table(
+    "submission_unique_keys", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("submission_id", Integer, ForeignKey("submissions.id"), nullable=False, index=True),
+    Column("form_id", Integer, ForeignKey("forms.id"), nullable=False, index=True),
+    Column("key_name", String, nullable=False, index=True),
+    Column("key_value", String, nullable=False, index=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    UniqueConstraint("form_id", "key_name", "key_value", name="uq_submission_unique_key"),
+)
+
+unique_key_reindex_jobs = Table(
+    "unique_key_reindex_jobs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("form_id", Integer, ForeignKey("forms.id"), nullable=False, index=True),
+    Column("schema_version", Integer, nullable=False),
+    Column("status", String, nullable=False, index=True),
+    Column("last_submission_id", Integer, nullable=False),
+    Column("processed_count", Integer, nullable=False),
+    Column("missing_count", Integer, nullable=False),
+    Column("duplicate_count", Integer, nullable=False),
+    Column("duplicates_json", Text, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("requested_by", Integer, ForeignKey("users.id"), nullable=True),
+    Column("lease_expires_at", DateTime(timezone=True), nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("started_at", DateTime(timezone=True), nullable=True),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+)
+
+submission_unique_key_staging = Table(
+    "submission_unique_key_staging", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("job_id", Integer, ForeignKey("unique_key_reindex_jobs.id"), nullable=False, index=True),
+    Column("submission_id", Integer, nullable=False),
+    Column("form_id", Integer, nullable=False),
+    Column("key_name", String, nullable=False),
+    Column("key_value", String, nullable=False),
+    Index("ix_submission_unique_key_staging_lookup", "job_id", "key_name", "key_value"),
+)
+
+reencryption_jobs = Table(
+    "reencryption_jobs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("status", String, nullable=False, index=True),
+    Column("last_submission_id", Integer, nullable=False),
+    Column("processed_count", Integer, nullable=False),
+    Column("reencrypted_count", Integer, nullable=False),
+    Column("failed_count", Integer, nullable=False),
+    Column("error", Text, nullable=True),
+    Column("requested_by", Integer, ForeignKey("users.id"), nullable=True),
+    Column("lease_expires_at", DateTime(timezone=True), nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("started_at", DateTime(timezone=True), nullable=True),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+)
+
+payload_normalization_jobs = Table(
+    "payload_normalization_jobs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("status", String, nullable=False, index=True),
+    Column("last_submission_id", Integer, nullable=False),
+    Column("processed_count", Integer, nullable=False),
+    Column("normalized_count", Integer, nullable=False),
+    Column("failed_count", Integer, nullable=False),
+    Column("remaining_count", Integer, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("requested_by", Integer, ForeignKey("users.id"), nullable=True),
+    Column("lease_expires_at", DateTime(timezone=True), nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("started_at", DateTime(timezone=True), nullable=True),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+)
+
+STUDY_COLUMNS = [
+    ("is_archived", "BOOLEAN"),
+    ("title", "VARCHAR"),
+    ("summary", "TEXT"),
+    ("primary_coordinating_center", "VARCHAR"),
+    ("principal_investigator_name", "VARCHAR"),
+    ("principal_investigator_email", "VARCHAR"),
+    ("sub_investigator_name", "VARCHAR"),
+    ("sub_investigator_email", "VARCHAR"),
+    ("general_objective", "TEXT"),
+    ("specific_objectives", "TEXT"),
+    ("inclusion_exclusion_criteria", "TEXT"),
+    ("data_collection_deadline", "DATE"),
+    ("status", "VARCHAR"),
+]
+FORM_COLUMNS = [
+    ("schema_version", "INTEGER NOT NULL DEFAULT 1"),
+    ("schema_hash", "VARCHAR"),
+]
+SUBMISSION_COLUMNS = [
+    ("schema_version", "INTEGER"),
+    ("data_format", "VARCHAR"),
+    ("data_key_id", "VARCHAR"),
+]
+
+# Field name/label hints the old unique-key picker preferred.
+KEYWORD_HINTS = ("id", "identifier", "code", "record", "folio", "document", "patient", "subject", "mrn")
+
+
+# Frozen copies of app.form_validation.schema_hash and app.unique_keys.unique_field_names
+# as of this version, so later changes to those cannot change what this migration does.
+def schema_hash(schema_json) -> str:
+    canonical = json.dumps(schema_json, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def unique_field_names(schema_json) -> Tuple[str, ...]:
+    fields = schema_json.get("fields", []) if isinstance(schema_json, dict) else []
+    return tuple(
+        field.get("name")
+        for field in fields
+        if isinstance(field, dict) and field.get("unique_key") is True and field.get("name")
+    )
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _add_missing_columns(conn: Connection, table: str, columns: List[Tuple[str, str]]) -> None:
+    present = _columns(conn, table)
+    for name, ddl in columns:
+        if name not in present:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+
+def _load_json(value, default):
+    if isinstance(value, (dict, list)):
+        return value
+    try:
+        return json.loads(value or "null") or default
+    except (TypeError, ValueError):
+        return default
+
+
+def _upgrade_studies(conn: Connection) -> None:
+    _add_missing_columns(conn, "studies", STUDY_COLUMNS)
+    conn.execute(studies.update().where(studies.c.is_archived.is_(None)).values(is_archived=False))
+    conn.execute(
+        studies.update()
+        .where(or_(studies.c.status.is_(None), func.trim(studies.c.status) == ""))
+        .values(status=case((studies.c.is_archived.is_(True), "Canceled"), else_="Data Collection"))
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_studies_is_archived ON studies (is_archived)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_studies_status ON studies (status)")
+    if "data_submission_deadline" in _columns(conn, "studies"):
+        conn.exec_driver_sql("ALTER TABLE studies DROP COLUMN data_submission_deadline")
+
+
+def _pick_unique_field(fields: List[dict], payloads: List[dict]) -> Optional[int]:
+    """Index of the field to mark as unique key, scored as the old migrate script did."""
+    best_index, best_score = 0, (-1, -1, -1, -1)
+    for index, field in enumerate(fields):
+        name = field.get("name", "")
+        seen, duplicates, non_empty = set(), 0, 0
+        for payload in payloads:
+            value = payload.get(name)
+            value = "" if value is None else str(value).strip()
+            if value == "":
+                continue
+            non_empty += 1
+            if value in seen:
+                duplicates += 1
+            seen.add(value)
+        hint_text = f"{name} {field.get('label', '')}".lower()
+        # Prefer no duplicates, then more values, then an id-like name, then required.
+        score = (
+            int(duplicates == 0),
+            non_empty,
+            int(any(hint in hint_text for hint in KEYWORD_HINTS)),
+            int(bool(field.get("required"))),
+        )
+        if score > best_score:
+            best_index, best_score = index, score
+    if best_score[1] == 0:
+        for index, field in enumerate(fields):
+            if field.get("required"):
+                return index
+    return best_index
+
+
+def _upgrade_forms(conn: Connection) -> None:
+    _add_missing_columns(conn, "forms", FORM_COLUMNS)
+    rows = conn.execute(
+        select(forms.c.id, type_coerce(forms.c.schema_json, Text), forms.c.schema_version, forms.c.created_by)
+        .where(forms.c.schema_hash.is_(None))
+        .order_by(forms.c.id)
+    ).all()
+    for form_id, raw_schema, version, created_by in rows:
+        schema = _load_json(raw_schema, {})
+        fields = schema.get("fields") if isinstance(schema, dict) else None
+        if isinstance(fields, list) and fields and all(isinstance(field, dict) for field in fields):
+            if not unique_field_names(schema):
+                payloads = [
+                    payload if isinstance(payload, dict) else {}
+                    for payload in (
+                        _load_json(raw, {})
+                        for raw in conn.execute(
+                            select(submissions.c.data_json).where(submissions.c.form_id == form_id)
+                        ).scalars()
+                    )
+                ]
+                fields[_pick_unique_field(fields, payloads)]["unique_key"] = True
+        content_hash = schema_hash(schema)
+        version = version or 1
+        conn.execute(
+            forms.update().where(forms.c.id == form_id).values(schema_json=schema, schema_hash=content_hash)
+        )
+        recorded = conn.execute(
+            select(form_versions.c.id).where(form_versions.c.form_id == form_id, form_versions.c.version == version)
+        ).first()
+        if recorded is None:
+            conn.execute(form_versions.insert().values(
+                form_id=form_id, version=version, schema_json=schema, schema_hash=content_hash, created_by=created_by,
+            ))
+
+
+def _upgrade_submissions(conn: Connection) -> None:
+    _add_missing_columns(conn, "submissions", SUBMISSION_COLUMNS)
+    conn.execute(
+        submissions.update().where(submissions.c.updated_at.is_(None)).values(updated_at=submissions.c.created_at)
+    )
+
+
+def _expected_key_name(schema) -> Optional[str]:
+    names = unique_field_names(schema)
+    if not names:
+        return None
+    return names[0] if len(names) == 1 else "__composite__:" + "|".join(names)
+
+
+def _queue_unique_key_reindex(conn: Connection) -> set:
+    """Queue re-index jobs for forms whose key rows are stale; returns those form ids."""
+    key_names: Dict[int, set] = {}
+    for form_id, key_name in conn.execute(
+        select(submission_unique_keys.c.form_id, submission_unique_keys.c.key_name).distinct()
+    ):
+        key_names.setdefault(form_id, set()).add(key_name)
+    forms_with_submissions = set(conn.execute(select(submissions.c.form_id).distinct()).scalars())
+    forms_with_jobs = set(conn.execute(
+        select(unique_key_reindex_jobs.c.form_id).where(unique_key_reindex_jobs.c.status.in_(("pending", "running")))
+    ).scalars())
+
+    queued = set()
+    for form_id, raw_schema, version in conn.execute(
+        select(forms.c.id, type_coerce(forms.c.schema_json, Text), forms.c.schema_version).order_by(forms.c.id)
+    ).all():
+        expected = _expected_key_name(_load_json(raw_schema, {}))
+        if expected is None or form_id in forms_with_jobs:
+            continue
+        present = key_names.get(form_id, set())
+        stale = bool(present - {expected})
+        missing = not present and form_id in forms_with_submissions
+        if stale or missing:
+            queued.add(form_id)
+            conn.execute(unique_key_reindex_jobs.insert().values(
+                form_id=form_id,
+                schema_version=version or 1,
+                status="pending",
+                last_submission_id=0,
+                processed_count=0,
+                missing_count=0,
+                duplicate_count=0,
+                created_at=datetime.now(timezone.utc),
+            ))
+    return queued
+
+
+def upgrade(conn: Connection) -> None:
+    existing = set(inspect(conn).get_table_names()) - {"schema_version"}
+    metadata.create_all(conn, checkfirst=True)
+    if not existing:
+        return
+    _upgrade_studies(conn)
+    _upgrade_forms(conn)
+    _upgrade_submissions(conn)
+    reindexed = _queue_unique_key_reindex(conn)
+    conn.execute(
+        submissions.update()
+        .where(submissions.c.schema_version.is_(None), submissions.c.form_id.not_in(reindexed))
+        .values(schema_version=1)
+    )
@@ -0,0 +1,37 @@
+"""Batch job throughput and named backfill runs.
+
+Adds ``rows_per_second`` to the three background job tables and creates
+``backfill_runs`` for the named backfills in ``app.backfill``.
+"""
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, func
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+# Only referenced by the foreign key below; never created here.
+Table("users", metadata, Column("id", Integer, primary_key=True))
+
+backfill_runs = Table(
+    "backfill_runs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False, index=True),
+    Column("status", String, nullable=False, index=True),
+    Column("last_key", Integer, nullable=False),
+    Column("processed_count", Integer, nullable=False),
+    Column("changed_count", Integer, nullable=False),
+    Column("max_rows_per_second", Integer, nullable=True),
+    Column("rows_per_second", Float, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("requested_by", Integer, ForeignKey("users.id"), nullable=True),
+    Column("lease_expires_at", DateTime(timezone=True), nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("started_at", DateTime(timezone=True), nullable=True),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+)
+
+JOB_TABLES = ("unique_key_reindex_jobs", "reencryption_jobs", "payload_normalization_jobs")
+
+
+def upgrade(conn: Connection) -> None:
+    for table in JOB_TABLES:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN rows_per_second FLOAT")
+    backfill_runs.create(conn)
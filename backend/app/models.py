@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text, JSON, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Float, ForeignKey, Text, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -22,6 +22,38 @@ class User(Base):
     submissions = relationship("Submission", back_populates="user")
 
 
+class RefreshToken(Base):
+    """Server-side record of a rotating refresh token; only an HMAC of the token is stored."""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String, nullable=False, unique=True, index=True)
+    family_id = Column(String, nullable=False, index=True)  # shared by all rotations of one login
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    replaced_by_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ApiKey(Base):
+    """Admin-issued credential for ETL/integration clients; only an HMAC of the secret is stored."""
+    __tablename__ = "api_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    prefix = Column(String, nullable=False, unique=True, index=True)  # public lookup part of the key
+    key_hash = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # acts as this user
+    scopes = Column(JSON, nullable=False)  # e.g. ["read"], ["export"]
+    study_id = Column(Integer, ForeignKey("studies.id"), nullable=True)  # limit the key to one study
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    last_used_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class Hospital(Base):
     __tablename__ = "hospitals"
 
@@ -68,13 +100,35 @@ class Form(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
     description = Column(Text, nullable=True)
-    schema_json = Column(JSON, nullable=False)  # Form field definitions
+    schema_json = Column(JSON, nullable=False)  # Form field definitions (current version)
+    schema_version = Column(Integer, nullable=False, default=1)
+    schema_hash = Column(String, nullable=True)  # sha256 of the current schema_json
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     creator = relationship("User", back_populates="created_forms")
     studies = relationship("StudyForm", back_populates="form", cascade="all, delete-orphan")
     submissions = relationship("Submission", back_populates="form")
+    versions = relationship("FormVersion", back_populates="form", cascade="all, delete-orphan")
+    reindex_jobs = relationship("UniqueKeyReindexJob", back_populates="form", cascade="all, delete-orphan")
+
+
+class FormVersion(Base):
+    """Immutable snapshot of a form schema; a new row is written whenever the schema changes."""
+    __tablename__ = "form_versions"
+    __table_args__ = (
+        UniqueConstraint("form_id", "version", name="uq_form_version"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    form_id = Column(Integer, ForeignKey("forms.id"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    schema_json = Column(JSON, nullable=False)
+    schema_hash = Column(String, nullable=False, index=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    form = relationship("Form", back_populates="versions")
 
 
 class StudyForm(Base):
@@ -95,6 +149,9 @@ class Submission(Base):
     study_id = Column(Integer, ForeignKey("studies.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     data_json = Column(Text, nullable=False)  # JSON form data
+    data_format = Column(String, nullable=True)  # json | json+zlib | fernet | fernet+zlib; NULL = legacy, untagged
+    data_key_id = Column(String, nullable=True)  # encryption key id for the fernet formats
+    schema_version = Column(Integer, nullable=True)  # form_versions.version the data was validated against
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -116,3 +173,102 @@ class SubmissionUniqueKey(Base):
     key_value = Column(String, nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+
+
+class UniqueKeyReindexJob(Base):
+    """Online rebuild of one form's submission_unique_keys after a unique-key schema change."""
+    __tablename__ = "unique_key_reindex_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    form_id = Column(Integer, ForeignKey("forms.id"), nullable=False, index=True)
+    schema_version = Column(Integer, nullable=False)  # form version the keys are rebuilt for
+    status = Column(String, nullable=False, default="pending", index=True)  # pending | running | completed | failed | superseded
+    last_submission_id = Column(Integer, nullable=False, default=0)  # resume cursor
+    processed_count = Column(Integer, nullable=False, default=0)
+    missing_count = Column(Integer, nullable=False, default=0)  # submissions without a complete key
+    duplicate_count = Column(Integer, nullable=False, default=0)
+    duplicates_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    rows_per_second = Column(Float, nullable=True)  # throughput of the current or last run
+
+    form = relationship("Form", back_populates="reindex_jobs")
+    staged_keys = relationship("SubmissionUniqueKeyStaging", cascade="all, delete-orphan")
+
+
+class SubmissionUniqueKeyStaging(Base):
+    """Keys built by a re-index job, swapped into submission_unique_keys when the job completes."""
+    __tablename__ = "submission_unique_key_staging"
+    __table_args__ = (
+        Index("ix_submission_unique_key_staging_lookup", "job_id", "key_name", "key_value"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("unique_key_reindex_jobs.id"), nullable=False, index=True)
+    submission_id = Column(Integer, nullable=False)
+    form_id = Column(Integer, nullable=False)
+    key_name = Column(String, nullable=False)
+    key_value = Column(String, nullable=False)
+
+
+class ReencryptionJob(Base):
+    """Batched rewrite of encrypted submission payloads under the primary encryption key."""
+    __tablename__ = "reencryption_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending | running | completed | failed | superseded
+    last_submission_id = Column(Integer, nullable=False, default=0)  # resume cursor
+    processed_count = Column(Integer, nullable=False, default=0)
+    reencrypted_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)  # rows no key in the ring could decrypt
+    error = Column(Text, nullable=True)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    rows_per_second = Column(Float, nullable=True)  # throughput of the current or last run
+
+
+class PayloadNormalizationJob(Base):
+    """Batched rewrite of untagged or outdated submission payloads into the configured storage format."""
+    __tablename__ = "payload_normalization_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending | running | completed | failed | superseded
+    last_submission_id = Column(Integer, nullable=False, default=0)  # resume cursor
+    processed_count = Column(Integer, nullable=False, default=0)
+    normalized_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)  # rows that could not be decoded
+    remaining_count = Column(Integer, nullable=True)  # rows still needing normalisation, refreshed per batch
+    error = Column(Text, nullable=True)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    rows_per_second = Column(Float, nullable=True)  # throughput of the current or last run
+
+
+class BackfillRun(Base):
+    """One run of a named backfill registered in app.backfill."""
+    __tablename__ = "backfill_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending | running | completed | failed | superseded
+    last_key = Column(Integer, nullable=False, default=0)  # resume cursor (primary key of the last row read)
+    processed_count = Column(Integer, nullable=False, default=0)
+    changed_count = Column(Integer, nullable=False, default=0)
+    max_rows_per_second = Column(Integer, nullable=True)  # NULL = BACKFILL_MAX_ROWS_PER_SECOND
+    rows_per_second = Column(Float, nullable=True)
+    error = Column(Text, nullable=True)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,112 @@
+"""Bounded executor for bcrypt hashing and verification.
+
+bcrypt is deliberately slow (tens of milliseconds of CPU per call). Run inline
+in sync endpoints, a burst of logins at shift change occupies every threadpool
+thread and stalls unrelated API calls. All hashing therefore goes through one
+dedicated pool:
+
+- at most ``PASSWORD_HASH_WORKERS`` hashes run at once (bcrypt releases the
+  GIL, so threads use all cores);
+- at most ``PASSWORD_HASH_MAX_QUEUE`` more wait for a worker;
+- anything beyond that fails fast with ``PasswordHashingBusy``, which the app
+  turns into ``503`` with ``Retry-After``.
+
+Callers await the result without holding a request thread.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.auth import get_password_hash, verify_password
+from app.config import settings
+from app.metrics import percentile_ms
+
+# Latency samples kept for percentile reporting.
+LATENCY_WINDOW = 1000
+
+
+class PasswordHashingBusy(Exception):
+    """The hashing pool and its queue are full; the caller should retry later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing capacity exhausted")
+        self.retry_after = retry_after
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(workers, 1)
+        self.max_queue = max(max_queue, 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self._hash_seconds = deque(maxlen=LATENCY_WINDOW)
+        self._wait_seconds = deque(maxlen=LATENCY_WINDOW)
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._outstanding >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHashingBusy(settings.PASSWORD_HASH_RETRY_AFTER_SECONDS)
+            self._outstanding += 1
+
+    def _timed(self, fn: Callable[..., Any], args: tuple, submitted_at: float) -> Any:
+        started = time.perf_counter()
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self._running -= 1
+                self.completed += 1
+                self._wait_seconds.append(started - submitted_at)
+                self._hash_seconds.append(finished - started)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, fn, args, time.perf_counter())
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hash_samples = list(self._hash_seconds)
+            wait_samples = list(self._wait_seconds)
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": max(self._outstanding - self._running, 0),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "hash_ms_p50": percentile_ms(hash_samples, 0.5),
+                "hash_ms_p95": percentile_ms(hash_samples, 0.95),
+                "queue_wait_ms_p50": percentile_ms(wait_samples, 0.5),
+                "queue_wait_ms_p95": percentile_ms(wait_samples, 0.95),
+            }
+
+
+password_pool = PasswordHashPool(
+    workers=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 2,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_pool.run(get_password_hash, password)
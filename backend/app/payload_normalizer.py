@@ -0,0 +1,168 @@
+"""Background normaliser for submission payload storage formats.
+
+Some rows do not match the current storage settings (see
+``app.submission_storage``):
+
+- untagged legacy rows (``data_format`` NULL);
+- plain rows once encryption is enabled;
+- encrypted rows once it is disabled;
+- rows encrypted under a retired key.
+
+Readers still handle all of them, but untagged rows cost a content sniff,
+and the other cases defeat the point of the setting. The normaliser rewrites
+such rows in id-ordered batches of ``PAYLOAD_NORMALIZER_BATCH_SIZE``. It
+commits its cursor and an estimate of the rows still to do after every batch.
+The estimate is recounted exactly when the job finishes.
+
+Jobs run on the shared batch runner (``app.backfill``). It lease-claims them,
+resumes them at startup, and throttles them. A concurrent edit always wins, and
+is itself stored in the current format. Rows that cannot be decoded are left
+untouched and counted as failed.
+"""
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, not_, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.backfill import JOB_ACTIVE_STATUSES, active_job_ids, run_job, utcnow
+from app.config import settings
+from app.database import begin_write
+from app.encryption import get_primary_key_id
+from app.models import PayloadNormalizationJob, Submission
+from app.submission_storage import ENCRYPTED_FORMATS, PayloadDecodeError, decode_payload_strict, encode_payload
+
+logger = logging.getLogger(__name__)
+
+
+def needs_normalization():
+    """SQL condition matching rows whose storage format differs from the current settings."""
+    encrypted = Submission.data_format.in_(ENCRYPTED_FORMATS)
+    if settings.SUBMISSION_ENCRYPTION_ENABLED:
+        outdated = or_(
+            not_(encrypted),
+            Submission.data_key_id.is_(None),
+            Submission.data_key_id != get_primary_key_id(),
+        )
+    else:
+        outdated = encrypted
+    return or_(Submission.data_format.is_(None), outdated)
+
+
+def count_remaining(db: Session) -> int:
+    return db.execute(select(func.count()).select_from(Submission).where(needs_normalization())).scalar_one()
+
+
+def storage_format_summary(db: Session) -> Dict[str, Any]:
+    """Row counts per (format, key id) and how many rows the normaliser still has to rewrite."""
+    rows = db.execute(
+        select(Submission.data_format, Submission.data_key_id, func.count())
+        .group_by(Submission.data_format, Submission.data_key_id)
+    ).all()
+    formats: List[Dict[str, Any]] = [
+        {"data_format": data_format or "untagged", "data_key_id": data_key_id, "count": count}
+        for data_format, data_key_id, count in rows
+    ]
+    return {
+        "encryption_enabled": settings.SUBMISSION_ENCRYPTION_ENABLED,
+        "primary_key_id": get_primary_key_id() if settings.SUBMISSION_ENCRYPTION_ENABLED else None,
+        "formats": formats,
+        "remaining": count_remaining(db),
+    }
+
+
+def start_normalization_job(db: Session, requested_by: Optional[int] = None) -> PayloadNormalizationJob:
+    """Queue a normalisation pass; supersedes any job still in flight. The caller commits."""
+    db.query(PayloadNormalizationJob).filter(
+        PayloadNormalizationJob.status.in_(JOB_ACTIVE_STATUSES),
+    ).update({"status": "superseded", "finished_at": utcnow()}, synchronize_session=False)
+
+    job = PayloadNormalizationJob(
+        status="pending",
+        last_submission_id=0,
+        processed_count=0,
+        normalized_count=0,
+        failed_count=0,
+        remaining_count=count_remaining(db),
+        requested_by=requested_by,
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def _normalize_batch(db: Session, job: PayloadNormalizationJob, batch_size: int) -> int:
+    """Rewrite the next batch of outdated rows; returns the number of rows read."""
+    begin_write(db)
+    rows = db.execute(
+        select(Submission.id, Submission.data_json, Submission.data_format, Submission.data_key_id)
+        .where(Submission.id > job.last_submission_id, needs_normalization())
+        .order_by(Submission.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    normalized = 0
+    failed = 0
+    for submission_id, raw_payload, data_format, data_key_id in rows:
+        try:
+            payload = decode_payload_strict(raw_payload, data_format, data_key_id)
+        except PayloadDecodeError:
+            failed += 1
+            continue
+        encoded = encode_payload(payload)
+        result = db.execute(
+            update(Submission)
+            .where(Submission.id == submission_id, Submission.data_json == raw_payload)
+            .values(
+                data_json=encoded.data_json,
+                data_format=encoded.data_format,
+                data_key_id=encoded.data_key_id,
+                updated_at=Submission.updated_at,
+            )
+        )
+        normalized += result.rowcount
+
+    job.last_submission_id = rows[-1][0]
+    job.processed_count = (job.processed_count or 0) + len(rows)
+    job.normalized_count = (job.normalized_count or 0) + normalized
+    job.failed_count = (job.failed_count or 0) + failed
+    # Estimate between batches (a full count per batch would rescan the table); exact at the end.
+    job.remaining_count = max((job.remaining_count or 0) - normalized, 0)
+    return len(rows)
+
+
+def _finish(db: Session, job: PayloadNormalizationJob) -> None:
+    job.remaining_count = count_remaining(db)
+    logger.info(
+        "Payload normalisation job %s completed: %s rows read, %s rewritten, %s undecodable, %s remaining, %s rows/s",
+        job.id, job.processed_count, job.normalized_count, job.failed_count, job.remaining_count, job.rows_per_second,
+    )
+
+
+def run_normalization_job(job_id: int, batch_size: Optional[int] = None) -> Optional[str]:
+    """Run (or resume) a normalisation job to completion; returns the final status.
+
+    Returns None when another worker holds the job's lease.
+    """
+    return run_job(
+        PayloadNormalizationJob, job_id, _normalize_batch,
+        batch_size=batch_size or settings.PAYLOAD_NORMALIZER_BATCH_SIZE,
+        lease_seconds=settings.PAYLOAD_NORMALIZER_LEASE_SECONDS,
+        label="Payload normalisation job",
+        finish=_finish,
+    )
+
+
+def resume_pending_normalization_jobs() -> None:
+    """Resume jobs interrupted by a restart; run in a background thread at startup."""
+    for job_id in active_job_ids(PayloadNormalizationJob):
+        run_normalization_job(job_id)
+
+
+def start_resume_thread() -> threading.Thread:
+    thread = threading.Thread(target=resume_pending_normalization_jobs, name="payload-normalizer", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,242 @@
+"""Opt-in (PROFILING_ENABLED) on-demand profiling of single requests, for admins.
+
+An admin adds an ``X-Profile: 1`` header or a ``_profile=1`` query flag to a
+request. ``ProfilingMiddleware`` (app.middleware.http_middleware) ignores the
+flag on requests without credentials, so anonymous flagged requests cost no
+database lookup. Otherwise it checks the caller the way ``get_current_user``
+does; for anyone but an admin the flag is ignored. The request then runs
+under a wall-clock sampling profiler. The profile is stored in PROFILING_DIR
+as speedscope JSON (https://www.speedscope.app), and its id is returned in
+an ``X-Profile-Id`` response header. ``GET /api/admin/profiles`` lists the
+stored profiles and ``GET /api/admin/profiles/{id}`` downloads one.
+
+Every PROFILING_SAMPLE_INTERVAL_MS the sampler reads the stacks of the event
+loop thread and of the threadpool and payload-decode threads. That way it
+covers work the request hands to the threadpool (sync endpoints,
+``run_in_threadpool``), which cProfile would miss because it only sees the
+thread that started it. Samples of threads that are only waiting (idle pool
+workers, the event loop in ``select``) are left out. Background jobs are not
+sampled. Other requests running on the same worker at the same time appear
+in the profile too, so profile on a quiet worker where possible. One request
+is profiled at a time per worker; a second flagged request runs without
+profiling.
+"""
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.types import Scope
+
+from app.config import settings
+from app.database import SessionLocal
+from app.api_keys import get_api_key_from_request
+from app.middleware.auth_middleware import get_current_user, get_token_from_request
+from app.models import User
+
+MAX_STACK_DEPTH = 200
+PROFILE_SUFFIX = ".speedscope.json"
+META_SUFFIX = ".meta.json"
+_PROFILE_ID = re.compile(r"^\d{8}T\d{6}Z-[0-9a-f]{8}$")
+_TRUE_VALUES = ("1", "true", "yes")
+
+# (file name, function) of leaf frames that mean the thread is waiting, not working.
+_IDLE_LEAVES = frozenset((
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+))
+
+# Threads that do request work besides the event loop: the threadpool and the payload decoders.
+_REQUEST_THREAD_PREFIXES = ("AnyIO worker thread", "payload-decode")
+
+_profiling = threading.Lock()
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler over the event loop thread and the threads that serve requests."""
+
+    def __init__(self, interval_seconds: float, loop_thread_id: int):
+        self.interval_seconds = interval_seconds
+        self.loop_thread_id = loop_thread_id
+        self.thread_names: Dict[int, str] = {}
+        self.frames: Dict[Tuple[str, str, int], int] = {}
+        self.samples: Dict[int, List[List[int]]] = {}
+        self.weights: Dict[int, List[float]] = {}
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._switch_interval = sys.getswitchinterval()
+
+    def start(self) -> None:
+        # Busy request threads hold the GIL for up to the switch interval (5 ms by default);
+        # shorten it while profiling so the sampler gets to run on time.
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval_seconds))
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and restore the switch interval; safe after a failed ``start``."""
+        self._stop.set()
+        if self._thread.ident is not None:
+            self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _stack(self, frame) -> Optional[List[int]]:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+            return None
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            index = self.frames.get(key)
+            if index is None:
+                index = self.frames[key] = len(self.frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _sampled(self, thread_id: int) -> bool:
+        if thread_id == self.loop_thread_id:
+            return True
+        name = self.thread_names.get(thread_id)
+        if name is None:
+            self.thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self.thread_names.get(thread_id, "")
+        return name.startswith(_REQUEST_THREAD_PREFIXES)
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval_seconds):
+            now = time.perf_counter()
+            weight_ms = (now - last) * 1000
+            last = now
+            self.sample_count += 1
+            for thread_id, frame in sys._current_frames().items():
+                if not self._sampled(thread_id):
+                    continue
+                stack = self._stack(frame)
+                if stack is not None:
+                    self.samples.setdefault(thread_id, []).append(stack)
+                    self.weights.setdefault(thread_id, []).append(weight_ms)
+
+    def to_speedscope(self, name: str) -> Dict[str, Any]:
+        frames = [None] * len(self.frames)
+        for (function, filename, line), index in self.frames.items():
+            frames[index] = {"name": function, "file": filename, "line": line}
+        profiles = []
+        for thread_id, stacks in self.samples.items():
+            weights = [round(weight, 3) for weight in self.weights[thread_id]]
+            if thread_id == self.loop_thread_id:
+                thread_name = "event loop"
+            else:
+                thread_name = self.thread_names.get(thread_id, str(thread_id))
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": stacks,
+                "weights": weights,
+            })
+        # Busiest thread first: speedscope opens the first profile.
+        profiles.sort(key=lambda profile: profile["endValue"], reverse=True)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "app.profiling",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+def profile_requested(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.decode("latin-1").strip().lower() in _TRUE_VALUES
+    query = scope.get("query_string", b"").decode("latin-1")
+    return any(part in ("_profile=1", "_profile=true") for part in query.split("&"))
+
+
+def has_credentials(scope: Scope) -> bool:
+    """Whether the request carries an API key or token at all; no validation, no database."""
+    request = Request(scope)
+    return bool(get_api_key_from_request(request) or get_token_from_request(request))
+
+
+def authorize_profiling(scope: Scope) -> Optional[User]:
+    """The admin making this request, or None; runs the same checks as get_current_user."""
+    db = SessionLocal()
+    try:
+        user = get_current_user(Request(scope), db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+    return user if user.role == "admin" else None
+
+
+def try_start_profiling() -> bool:
+    """Claim this worker's single profiling slot."""
+    return settings.PROFILING_ENABLED and _profiling.acquire(blocking=False)
+
+
+def finish_profiling() -> None:
+    _profiling.release()
+
+
+def new_profile_id() -> str:
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{secrets.token_hex(4)}"
+
+
+def save_profile(profile_id: str, profiler: SamplingProfiler, meta: Dict[str, Any]) -> None:
+    """Write the profile and its metadata, then drop the oldest beyond PROFILING_MAX_FILES."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    name = f"{meta['method']} {meta['path']} ({meta['status_code']}, {meta['duration_ms']} ms)"
+    with open(os.path.join(settings.PROFILING_DIR, profile_id + PROFILE_SUFFIX), "w") as f:
+        json.dump(profiler.to_speedscope(name), f, separators=(",", ":"))
+    meta = {"id": profile_id, **meta, "samples": profiler.sample_count, "format": "speedscope"}
+    with open(os.path.join(settings.PROFILING_DIR, profile_id + META_SUFFIX), "w") as f:
+        json.dump(meta, f)
+    for old_id in [profile["id"] for profile in list_profiles()][settings.PROFILING_MAX_FILES:]:
+        for suffix in (PROFILE_SUFFIX, META_SUFFIX):
+            try:
+                os.remove(os.path.join(settings.PROFILING_DIR, old_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Stored profiles' metadata, newest first."""
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+    profiles = []
+    for filename in os.listdir(settings.PROFILING_DIR):
+        if not filename.endswith(META_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(settings.PROFILING_DIR, filename)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda profile: profile["id"], reverse=True)
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Path of a stored profile, or None; ids are validated so they cannot name other files."""
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, profile_id + PROFILE_SUFFIX)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,125 @@
+"""Per-request query budget and N+1 detector, for development and tests.
+
+With QUERY_BUDGET_ENABLED, ``QueryBudgetMiddleware``
+(app.middleware.http_middleware) counts the SQL statements each request
+runs and returns the count in an ``X-DB-Queries`` response header.
+Statements are grouped by shape (app.slow_queries.statement_shape), so the
+same query with different parameters counts as a repeat. A shape run
+QUERY_BUDGET_REPEAT_THRESHOLD times or more in one request usually means an
+N+1 loop: one query per row where a join or an IN list would do. It is
+logged, and the highest repeat count goes in ``X-DB-Repeated-Queries``.
+
+Each route has a budget. It is QUERY_BUDGET_DEFAULT statements unless
+QUERY_BUDGET_ROUTES overrides it, e.g.
+``"GET /api/studies/{study_id}=15,POST /api/export/csv=0"`` (0 = unlimited).
+Going over the budget logs a warning. With QUERY_BUDGET_MODE=raise, the
+statement that crosses it fails with ``QueryBudgetExceeded`` instead, which
+a test client sees as a 500.
+
+The headers are set when the response starts. Statements a streaming
+response (an export) runs while sending its body are still counted and
+logged, but are not in the headers.
+"""
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.types import Scope
+
+from app.config import settings
+from app.request_context import route_template
+from app.slow_queries import statement_shape
+
+logger = logging.getLogger(__name__)
+
+# Transaction control repeats in every request; it is counted but never flagged as N+1.
+_TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more SQL statements than its route's budget (QUERY_BUDGET_MODE=raise)."""
+
+    def __init__(self, route: str, budget: int):
+        super().__init__(f"{route} ran more than its budget of {budget} SQL statements")
+        self.route = route
+        self.budget = budget
+
+
+def _parse_route_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        if item.strip():
+            route, _, budget = item.rpartition("=")
+            budgets[route.strip()] = int(budget)
+    return budgets
+
+
+_route_budgets = _parse_route_budgets(settings.QUERY_BUDGET_ROUTES)
+
+
+def budget_for(route: str) -> int:
+    return _route_budgets.get(route, settings.QUERY_BUDGET_DEFAULT)
+
+
+class RequestQueries:
+    """SQL statements run for one request, by shape."""
+    __slots__ = ("scope", "statements", "shapes", "over_budget")
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self.statements = 0
+        self.shapes: Counter = Counter()
+        self.over_budget = False
+
+    @property
+    def route(self) -> str:
+        return f"{self.scope['method']} {route_template(self.scope)}"
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        """Shapes run at least QUERY_BUDGET_REPEAT_THRESHOLD times, most repeated first."""
+        threshold = settings.QUERY_BUDGET_REPEAT_THRESHOLD
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def headers(self) -> List[Tuple[bytes, bytes]]:
+        headers = [(b"x-db-queries", str(self.statements).encode())]
+        repeated = self.repeated()
+        if repeated:
+            headers.append((b"x-db-repeated-queries", str(repeated[0][1]).encode()))
+        return headers
+
+
+request_queries: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def install_query_budget(target) -> None:
+    """Count statements run on ``target`` (a sync Engine) against the current request's budget."""
+
+    @event.listens_for(target, "before_cursor_execute")
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        queries = request_queries.get()
+        if queries is None:
+            return
+        queries.statements += 1
+        if not statement.lstrip().upper().startswith(_TRANSACTION_CONTROL):
+            queries.shapes[statement_shape(statement)] += 1
+        if queries.over_budget:
+            return
+        budget = budget_for(queries.route)
+        if budget and queries.statements > budget:
+            queries.over_budget = True
+            if settings.QUERY_BUDGET_MODE == "raise":
+                raise QueryBudgetExceeded(queries.route, budget)
+
+
+def report_request(queries: RequestQueries) -> None:
+    """Log a finished request's budget overrun and repeated statement shapes."""
+    if queries.statements == 0:
+        return
+    route = queries.route
+    if queries.over_budget:
+        logger.warning("%s ran %d SQL statements, over its budget of %d", route, queries.statements,
+                       budget_for(route))
+    for shape, count in queries.repeated():
+        logger.warning("%s ran the same statement %d times (possible N+1): %s", route, count, shape)
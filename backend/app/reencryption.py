@@ -0,0 +1,134 @@
+"""Re-encryption of stored submission payloads after an encryption key rotation.
+
+Rotation steps:
+
+1. Put the new key in ``ENCRYPTION_KEY``. Move the old one to
+   ``ENCRYPTION_PREVIOUS_KEYS`` and restart; both keys now decrypt.
+2. Start a job (``POST /api/admin/reencryption-jobs``). It walks the
+   encrypted payloads in id order, in batches of ``REENCRYPTION_BATCH_SIZE``,
+   and rewrites every token that is not yet under the primary key.
+3. Once the job completes with ``failed_count == 0``, drop the old key.
+
+The job runs on the shared batch runner (``app.backfill``). It commits the
+cursor after every batch, so an interrupted job resumes where it stopped, and
+it throttles the job and records its rows/sec. Rows tagged with the primary
+key id are skipped without decrypting anything. A submission edited during the
+walk is not overwritten (see ``app.backfill``); the edit is encrypted with the
+primary key anyway.
+"""
+import logging
+import threading
+from typing import Optional
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.backfill import JOB_ACTIVE_STATUSES, active_job_ids, run_job, utcnow
+from app.config import settings
+from app.database import begin_write
+from app.encryption import get_primary_key_id, reencrypt_token
+from app.models import ReencryptionJob, Submission
+from app.submission_storage import ENCRYPTED_FORMATS, FERNET_TOKEN_PREFIX, FORMAT_FERNET
+
+logger = logging.getLogger(__name__)
+
+
+def start_reencryption_job(db: Session, requested_by: Optional[int] = None) -> ReencryptionJob:
+    """Queue a re-encryption pass; supersedes any job still in flight. The caller commits."""
+    db.query(ReencryptionJob).filter(
+        ReencryptionJob.status.in_(JOB_ACTIVE_STATUSES),
+    ).update({"status": "superseded", "finished_at": utcnow()}, synchronize_session=False)
+
+    job = ReencryptionJob(
+        status="pending",
+        last_submission_id=0,
+        processed_count=0,
+        reencrypted_count=0,
+        failed_count=0,
+        requested_by=requested_by,
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def _reencrypt_batch(db: Session, job: ReencryptionJob, batch_size: int) -> int:
+    """Rewrite the next batch of encrypted payloads; returns the number of rows read."""
+    begin_write(db)
+    primary_key_id = get_primary_key_id()
+    rows = db.execute(
+        select(Submission.id, Submission.data_json)
+        .where(
+            Submission.id > job.last_submission_id,
+            or_(
+                Submission.data_format.in_(ENCRYPTED_FORMATS),
+                and_(Submission.data_format.is_(None), Submission.data_json.like(FERNET_TOKEN_PREFIX + "%")),
+            ),
+            or_(Submission.data_key_id.is_(None), Submission.data_key_id != primary_key_id),
+        )
+        .order_by(Submission.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    reencrypted = 0
+    failed = 0
+    for submission_id, token in rows:
+        try:
+            new_token = reencrypt_token(token)
+        except InvalidToken:
+            failed += 1
+            continue
+        result = db.execute(
+            update(Submission)
+            .where(Submission.id == submission_id, Submission.data_json == token)
+            .values(
+                data_json=new_token if new_token is not None else token,
+                data_format=func.coalesce(Submission.data_format, FORMAT_FERNET),
+                data_key_id=primary_key_id,
+                updated_at=Submission.updated_at,
+            )
+        )
+        if new_token is not None:
+            reencrypted += result.rowcount
+
+    job.last_submission_id = rows[-1][0]
+    job.processed_count = (job.processed_count or 0) + len(rows)
+    job.reencrypted_count = (job.reencrypted_count or 0) + reencrypted
+    job.failed_count = (job.failed_count or 0) + failed
+    return len(rows)
+
+
+def _log_completed(db: Session, job: ReencryptionJob) -> None:
+    logger.info(
+        "Re-encryption job %s completed: %s encrypted rows, %s re-encrypted, %s undecryptable, %s rows/s",
+        job.id, job.processed_count, job.reencrypted_count, job.failed_count, job.rows_per_second,
+    )
+
+
+def run_reencryption_job(job_id: int, batch_size: Optional[int] = None) -> Optional[str]:
+    """Run (or resume) a re-encryption job to completion; returns the final status.
+
+    Returns None when another worker holds the job's lease.
+    """
+    return run_job(
+        ReencryptionJob, job_id, _reencrypt_batch,
+        batch_size=batch_size or settings.REENCRYPTION_BATCH_SIZE,
+        lease_seconds=settings.REENCRYPTION_LEASE_SECONDS,
+        label="Re-encryption job",
+        finish=_log_completed,
+    )
+
+
+def resume_pending_reencryption_jobs() -> None:
+    """Resume jobs interrupted by a restart; run in a background thread at startup."""
+    for job_id in active_job_ids(ReencryptionJob):
+        run_reencryption_job(job_id)
+
+
+def start_resume_thread() -> threading.Thread:
+    thread = threading.Thread(target=resume_pending_reencryption_jobs, name="reencryption", daemon=True)
+    thread.start()
+    return thread
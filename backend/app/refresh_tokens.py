@@ -0,0 +1,141 @@
+"""Rotating refresh tokens for long-lived sessions.
+
+A refresh token is 256 random bits handed to the browser in an httpOnly
+cookie scoped to ``/api/auth``. The server stores only an HMAC-SHA256 of the
+token (keyed with ``SECRET_KEY``), so a lookup is one indexed equality query
+and a leaked table cannot be replayed. Checking one costs microseconds, where
+bcrypt costs tens of milliseconds.
+
+Every refresh rotates the token. All tokens descending from one login share a
+``family_id``. Presenting an already-rotated token outside a short grace
+window is treated as theft, and the whole family is revoked.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.auth_cache import Principal
+from app.config import settings
+from app.models import RefreshToken, User
+
+
+def hash_refresh_token(token: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), token.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_aware(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite returns naive datetimes for timezone-aware columns.
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def issue_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None) -> Tuple[str, RefreshToken]:
+    """Create a refresh token row (caller commits); returns the raw token and the row."""
+    raw_token = secrets.token_urlsafe(32)
+    row = RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(raw_token),
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=_utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    db.add(row)
+    db.flush()
+    return raw_token, row
+
+
+def prune_expired_refresh_tokens(db: Session, user_id: int) -> None:
+    """Drop a user's expired tokens so the table does not grow without bound; caller commits."""
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id,
+        RefreshToken.expires_at < _utcnow(),
+    ).delete(synchronize_session=False)
+
+
+def revoke_family(db: Session, family_id: str) -> None:
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None),
+    ).update({"revoked_at": _utcnow()}, synchronize_session=False)
+
+
+def revoke_user_refresh_tokens(db: Session, user_id: int) -> None:
+    """Log a user out everywhere (password change, deactivation); caller commits."""
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id,
+        RefreshToken.revoked_at.is_(None),
+    ).update({"revoked_at": _utcnow()}, synchronize_session=False)
+
+
+def revoke_refresh_token(db: Session, raw_token: str) -> None:
+    """Revoke the session a token belongs to (logout); call ``begin_write`` first, caller commits."""
+    row = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(raw_token)).first()
+    if row is not None:
+        revoke_family(db, row.family_id)
+
+
+def rotate_refresh_token(db: Session, raw_token: str) -> Optional[Tuple[Principal, str]]:
+    """Exchange a refresh token for a new one; returns (principal, new raw token) or None.
+
+    Call ``begin_write`` first: the row is read and then written in one transaction.
+    Commits on success and when a reused token causes its family to be revoked.
+    """
+    row = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(raw_token)).first()
+    if row is None:
+        return None
+
+    now = _utcnow()
+    if _as_aware(row.expires_at) <= now:
+        return None
+
+    if row.revoked_at is None:
+        # Only one concurrent caller wins the rotation of a live token; a loser
+        # falls through to the grace-period path below.
+        claimed = db.query(RefreshToken).filter(
+            RefreshToken.id == row.id,
+            RefreshToken.revoked_at.is_(None),
+        ).update({"revoked_at": now}, synchronize_session=False)
+        reused = claimed != 1
+    else:
+        reused = True
+
+    if reused:
+        # Parallel tabs may refresh with the same token; tolerate that briefly,
+        # but only while the session it was rotated into is still live.
+        db.expire(row)
+        grace = timedelta(seconds=settings.REFRESH_TOKEN_REUSE_GRACE_SECONDS)
+        replacement = (
+            db.query(RefreshToken).filter(RefreshToken.id == row.replaced_by_id).first()
+            if row.replaced_by_id is not None else None
+        )
+        if (
+            replacement is None
+            or (replacement.revoked_at is not None and replacement.replaced_by_id is None)
+            or _as_aware(row.revoked_at) + grace < now
+        ):
+            revoke_family(db, row.family_id)
+            db.commit()
+            return None
+
+    user = db.query(User).filter(User.id == row.user_id).first()
+    if user is None or not user.is_active:
+        revoke_family(db, row.family_id)
+        db.commit()
+        return None
+
+    principal = Principal.from_user(user)
+    new_token, new_row = issue_refresh_token(db, user.id, family_id=row.family_id)
+    if row.replaced_by_id is None:
+        db.query(RefreshToken).filter(RefreshToken.id == row.id).update(
+            {"replaced_by_id": new_row.id}, synchronize_session=False
+        )
+    db.commit()
+    return principal, new_token
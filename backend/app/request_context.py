@@ -0,0 +1,46 @@
+"""The HTTP request the current code runs for.
+
+``RequestContextMiddleware`` (app.middleware.http_middleware) puts each
+request's ASGI scope in ``request_scope``. The threadpool and SQLAlchemy's
+async greenlets copy context variables, so engine event listeners can see
+which request issued a statement. The router adds ``scope["endpoint"]``
+once a route matches. ``route_template`` uses it to name the route by its
+template, never by its raw path.
+"""
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from starlette.types import Scope
+
+UNMATCHED = "unmatched"
+
+request_scope: ContextVar[Optional[Scope]] = ContextVar("request_scope", default=None)
+
+_templates: Dict[Any, str] = {}
+
+
+def route_template(scope: Scope) -> str:
+    """The matched route's path template, e.g. ``/api/forms/{form_id}``."""
+    global _templates
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED
+    template = _templates.get(endpoint)
+    if template is None:
+        # Reversed, so an endpoint registered under two paths ("" and "/") keeps the first.
+        _templates = {
+            route.endpoint: route.path
+            for route in reversed(scope["app"].routes)
+            if getattr(route, "endpoint", None) is not None
+        }
+        template = _templates.get(endpoint, UNMATCHED)
+    return template
+
+
+def current_route() -> str:
+    """``METHOD /route/{template}`` of the current request, or the thread name outside one."""
+    scope = request_scope.get()
+    if scope is None:
+        return f"thread:{threading.current_thread().name}"
+    return f"{scope['method']} {route_template(scope)}"
@@ -165,6 +165,8 @@ class FormUpdate(BaseModel):
 
 class FormResponse(FormBase):
     id: int
+    schema_version: int = 1
+    schema_hash: Optional[str] = None
     created_by: int
     created_at: datetime
 
@@ -172,6 +174,85 @@ class FormResponse(FormBase):
         from_attributes = True
 
 
+class FormVersionResponse(BaseModel):
+    form_id: int
+    version: int
+    schema_json: Dict[str, Any]
+    schema_hash: str
+    created_by: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class UniqueKeyReindexJobResponse(BaseModel):
+    id: int
+    form_id: int
+    schema_version: int
+    status: str
+    processed_count: int
+    missing_count: int
+    duplicate_count: int
+    duplicates: List[Dict[str, Any]] = []
+    rows_per_second: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class ReencryptionJobResponse(BaseModel):
+    id: int
+    status: str
+    processed_count: int
+    reencrypted_count: int
+    failed_count: int
+    rows_per_second: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PayloadNormalizationJobResponse(BaseModel):
+    id: int
+    status: str
+    processed_count: int
+    normalized_count: int
+    failed_count: int
+    remaining_count: Optional[int] = None
+    rows_per_second: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class BackfillRunResponse(BaseModel):
+    id: int
+    name: str
+    status: str
+    last_key: int
+    processed_count: int
+    changed_count: int
+    max_rows_per_second: Optional[int] = None
+    rows_per_second: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # Submission Schemas
 class SubmissionBase(BaseModel):
     form_id: int
@@ -193,6 +274,7 @@ class SubmissionResponse(BaseModel):
     study_id: int
     user_id: int
     data_json: Dict[str, Any]
+    schema_version: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -201,6 +283,35 @@ class SubmissionResponse(BaseModel):
 
 
 # Auth Schemas
+# API Key Schemas
+class ApiKeyCreate(BaseModel):
+    name: str
+    scopes: List[str]
+    study_id: Optional[int] = None
+    user_id: Optional[int] = None  # account the key acts as; defaults to the creating admin
+    expires_in_days: Optional[int] = None
+
+
+class ApiKeyResponse(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    user_id: int
+    scopes: List[str]
+    study_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    revoked_at: Optional[datetime] = None
+    last_used_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ApiKeyCreatedResponse(ApiKeyResponse):
+    key: str  # shown once; only its hash is stored
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
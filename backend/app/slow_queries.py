@@ -0,0 +1,250 @@
+"""Opt-in (SLOW_QUERY_LOG_ENABLED) log of statements slower than SLOW_QUERY_THRESHOLD_MS.
+
+``install_slow_query_log`` times every statement with SQLAlchemy's
+before/after_cursor_execute events. A slow statement is:
+
+- added to a table of offenders. Entries are keyed by statement shape, so an
+  ``IN (...)`` list of any length counts as one query. ``GET
+  /api/admin/slow-queries`` lists the offenders by total time for this worker;
+- queued for a background thread. The thread appends one JSON line per
+  statement to SLOW_QUERY_LOG_FILE, rotated at SLOW_QUERY_LOG_MAX_BYTES. The
+  file and the thread are only created by the first slow statement. With
+  SLOW_QUERY_EXPLAIN it first asks the database for the plan, on a separate
+  connection: ``EXPLAIN`` on Postgres, ``EXPLAIN QUERY PLAN`` on SQLite. Plain
+  EXPLAIN only plans the statement; it never runs it again.
+
+Parameter values are never written or returned. Only the parameterised SQL
+and each parameter's type are kept. The issuing route comes from
+app.request_context. Background jobs are reported by thread name instead.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.request_context import current_route
+
+logger = logging.getLogger(__name__)
+
+MAX_OFFENDERS = 500
+MAX_ROUTES_PER_OFFENDER = 20
+QUEUE_SIZE = 1000
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace normalised and placeholder lists collapsed to ``(...)``."""
+    return _PLACEHOLDER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def redacted_parameters(parameters: Any, executemany: bool) -> Any:
+    """Parameter types in place of their values."""
+    if executemany:
+        return f"{len(parameters)} parameter sets"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_seconds: float, explain: bool, log_file: str, max_bytes: int, backups: int):
+        self.threshold_seconds = threshold_seconds
+        self.explain = explain
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._offenders: Dict[str, Dict[str, Any]] = {}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._file_logger: Optional[logging.Logger] = None
+        self._thread: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+
+    def _start_writer(self) -> None:
+        """Open the log file and start the writer thread, once."""
+        with self._writer_lock:
+            if self._thread is not None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_file)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_file, maxBytes=self.max_bytes, backupCount=self.backups
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            file_logger = logging.getLogger(f"{__name__}.file")
+            file_logger.handlers = [handler]
+            file_logger.setLevel(logging.INFO)
+            file_logger.propagate = False
+            self._file_logger = file_logger
+            self._thread = threading.Thread(target=self._run, name="slow-query-log", daemon=True)
+            self._thread.start()
+
+    def record(self, role: str, statement: str, parameters: Any, executemany: bool, elapsed: float,
+               explain_engine) -> None:
+        if self._thread is None:
+            self._start_writer()
+        elif threading.current_thread() is self._thread:
+            return  # the EXPLAIN statements themselves
+        shape = statement_shape(statement)
+        route = current_route()
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            offender = self._offenders.get(shape)
+            if offender is None:
+                if len(self._offenders) >= MAX_OFFENDERS:
+                    # Make room by forgetting the offender with the least total time.
+                    del self._offenders[min(self._offenders, key=lambda k: self._offenders[k]["total_seconds"])]
+                offender = self._offenders[shape] = {
+                    "statement": shape, "engine": role, "count": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                    "routes": {}, "last_seen": None, "plan": None,
+                }
+            offender["count"] += 1
+            offender["total_seconds"] += elapsed
+            offender["max_seconds"] = max(offender["max_seconds"], elapsed)
+            offender["last_seen"] = now
+            if route in offender["routes"] or len(offender["routes"]) < MAX_ROUTES_PER_OFFENDER:
+                offender["routes"][route] = offender["routes"].get(route, 0) + 1
+        entry = {
+            "time": now.isoformat(),
+            "engine": role,
+            "duration_ms": round(elapsed * 1000, 2),
+            "route": route,
+            "statement": statement,
+            "parameters": redacted_parameters(parameters, executemany),
+        }
+        # Values are only handed to the thread for EXPLAIN; they are not written.
+        explain_with = None
+        if self.explain and explain_engine is not None and not executemany:
+            explain_with = (explain_engine, parameters)
+        try:
+            self._queue.put_nowait((shape, entry, explain_with))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _plan(self, explain_engine, statement: str, parameters: Any) -> Optional[List[str]]:
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        prefix = "EXPLAIN QUERY PLAN " if explain_engine.dialect.name == "sqlite" else "EXPLAIN "
+        if isinstance(parameters, list):
+            parameters = tuple(parameters)  # a list would be read as executemany
+        try:
+            with explain_engine.connect() as conn:
+                rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        except Exception as exc:
+            return [f"EXPLAIN failed: {type(exc).__name__}"]
+        # Postgres returns one "QUERY PLAN" column; SQLite's plan text is the last column.
+        return [str(row[-1]) for row in rows]
+
+    def _run(self) -> None:
+        while True:
+            shape, entry, explain_with = self._queue.get()
+            try:
+                if explain_with is not None:
+                    entry["plan"] = self._plan(explain_with[0], entry["statement"], explain_with[1])
+                    with self._lock:
+                        if shape in self._offenders:
+                            self._offenders[shape]["plan"] = entry["plan"]
+                self._file_logger.info(json.dumps(entry, default=str))
+            except Exception:
+                logger.exception("Could not write a slow-query log entry")
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            offenders = sorted(self._offenders.values(), key=lambda o: o["total_seconds"], reverse=True)[:limit]
+            return [
+                {
+                    "statement": offender["statement"],
+                    "engine": offender["engine"],
+                    "count": offender["count"],
+                    "total_ms": round(offender["total_seconds"] * 1000, 2),
+                    "avg_ms": round(offender["total_seconds"] * 1000 / offender["count"], 2),
+                    "max_ms": round(offender["max_seconds"] * 1000, 2),
+                    "routes": dict(offender["routes"]),
+                    "last_seen": offender["last_seen"],
+                    "plan": offender["plan"],
+                }
+                for offender in offenders
+            ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._offenders.clear()
+            self.dropped = 0
+
+
+_log: Optional[SlowQueryLog] = None
+_log_lock = threading.Lock()
+
+
+def _get_log() -> SlowQueryLog:
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = SlowQueryLog(
+                    threshold_seconds=settings.SLOW_QUERY_THRESHOLD_MS / 1000,
+                    explain=settings.SLOW_QUERY_EXPLAIN,
+                    log_file=settings.SLOW_QUERY_LOG_FILE,
+                    max_bytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                    backups=settings.SLOW_QUERY_LOG_BACKUPS,
+                )
+    return _log
+
+
+def install_slow_query_log(target, role: str, explain_engine=None) -> None:
+    """Log slow statements run on ``target`` (a sync Engine).
+
+    EXPLAIN runs on ``explain_engine``, a sync engine that must accept the
+    same parameter style as ``target``; None skips the plan.
+    """
+    slow_log = _get_log()
+    threshold = slow_log.threshold_seconds
+
+    @event.listens_for(target, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _check_duration(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["slow_query_started"].pop()
+        if elapsed >= threshold:
+            slow_log.record(role, statement, parameters, executemany, elapsed, explain_engine)
+
+    @event.listens_for(target, "handle_error")
+    def _drop_timer(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("slow_query_started"):
+            conn.info["slow_query_started"].pop()
+
+
+def slow_query_stats(limit: int = 20) -> Dict[str, Any]:
+    """Top offenders by total time in this worker, plus the log's settings."""
+    if not settings.SLOW_QUERY_LOG_ENABLED or _log is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+        "explain": _log.explain,
+        "log_file": os.path.abspath(_log.log_file),
+        "dropped": _log.dropped,
+        "offenders": _log.top(limit),
+    }
+
+
+def reset_slow_query_stats() -> None:
+    if _log is not None:
+        _log.reset()
@@ -0,0 +1,250 @@
+"""Encoding of submission payloads and unique keys at rest.
+
+Every payload row is tagged with how it is stored:
+
+- ``submissions.data_format``: ``json``, ``json+zlib``, ``fernet`` or
+  ``fernet+zlib``;
+- ``submissions.data_key_id``: for the Fernet formats, the id of the key
+  used (see ``app.encryption.key_id``).
+
+Readers dispatch on the tag to exactly one decoder and, for encrypted rows,
+to exactly one key. Rows written before tagging have ``data_format`` NULL.
+They are recognised by their content until the payload normaliser
+(``app.payload_normalizer``) has rewritten them.
+
+With ``SUBMISSION_ENCRYPTION_ENABLED`` off (the default), payloads are stored
+as JSON and unique keys as their normalized values. With it on:
+
+- payloads are stored as Fernet tokens;
+- ``submission_unique_keys.key_value`` holds a keyed HMAC "blind index" of
+  the normalized value. Equal values give equal indexes, so duplicate checks
+  stay single index seeks and never decrypt anything. The MRNs behind them
+  cannot be read back from the table.
+
+Blind indexes are made with ``BLIND_INDEX_KEY``, which encryption requires
+and which is independent of ``SECRET_KEY``. Each index starts with a
+fingerprint of that key (``blind_index_prefix``). Turning encryption on or
+off, or changing the key, leaves existing keys in the old format. At startup
+such forms are found and re-indexed
+(``app.unique_keys.queue_stale_unique_key_reindex``). Until a form's job
+finishes, duplicates against its older submissions are not detected.
+
+Payloads of at least ``SUBMISSION_COMPRESSION_MIN_BYTES`` are zlib-compressed
+before any encryption.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from cryptography.fernet import InvalidToken
+
+from app.config import settings
+from app.encryption import get_cipher_for, get_primary_cipher, get_primary_key_id
+from app.tracing import traced
+
+FORMAT_JSON = "json"
+FORMAT_JSON_ZLIB = "json+zlib"
+FORMAT_FERNET = "fernet"
+FORMAT_FERNET_ZLIB = "fernet+zlib"
+ENCRYPTED_FORMATS = (FORMAT_FERNET, FORMAT_FERNET_ZLIB)
+
+# Every Fernet token starts with the version byte 0x80, i.e. "gAAAAA" in base64.
+FERNET_TOKEN_PREFIX = "gAAAAA"
+BLIND_INDEX_PREFIX = "bi1:"
+
+# Marker for "return a fresh {} for unreadable rows" (the default for readers).
+_EMPTY = object()
+
+_blind_index_key: Optional[bytes] = None
+_blind_index_prefix: Optional[str] = None
+_decrypt_pool: Optional[ThreadPoolExecutor] = None
+_decrypt_pool_lock = threading.Lock()
+
+
+class EncodedPayload(NamedTuple):
+    data_json: str
+    data_format: str
+    data_key_id: Optional[str]
+
+
+class PayloadDecodeError(ValueError):
+    """A stored payload could not be decoded with its recorded format and key."""
+
+
+def _get_blind_index_key() -> bytes:
+    global _blind_index_key
+    if _blind_index_key is None:
+        if not settings.BLIND_INDEX_KEY:
+            raise RuntimeError("SUBMISSION_ENCRYPTION_ENABLED requires BLIND_INDEX_KEY to be set")
+        _blind_index_key = settings.BLIND_INDEX_KEY.encode("utf-8")
+    return _blind_index_key
+
+
+def blind_index_prefix() -> str:
+    """``bi1:<key fingerprint>:``, the start of every blind index made with the current key."""
+    global _blind_index_prefix
+    if _blind_index_prefix is None:
+        fingerprint = hmac.new(_get_blind_index_key(), b"blind-index-key-fingerprint", hashlib.sha256).hexdigest()
+        _blind_index_prefix = f"{BLIND_INDEX_PREFIX}{fingerprint[:8]}:"
+    return _blind_index_prefix
+
+
+def unique_key_storage_value(key_name: str, key_value: str) -> str:
+    """Value stored in ``submission_unique_keys.key_value`` for a normalized key."""
+    if not settings.SUBMISSION_ENCRYPTION_ENABLED:
+        return key_value
+    digest = hmac.new(
+        _get_blind_index_key(), f"{key_name}\x00{key_value}".encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    return blind_index_prefix() + digest
+
+
+def encode_payload(data: Dict[str, Any]) -> EncodedPayload:
+    """Serialize a payload for storage in the currently configured format."""
+    raw = json.dumps(data).encode("utf-8")
+    min_bytes = settings.SUBMISSION_COMPRESSION_MIN_BYTES
+    compressed = min_bytes > 0 and len(raw) >= min_bytes
+    if compressed:
+        raw = zlib.compress(raw)
+    if settings.SUBMISSION_ENCRYPTION_ENABLED:
+        return EncodedPayload(
+            data_json=get_primary_cipher().encrypt(raw).decode(),
+            data_format=FORMAT_FERNET_ZLIB if compressed else FORMAT_FERNET,
+            data_key_id=get_primary_key_id(),
+        )
+    if compressed:
+        return EncodedPayload(base64.b64encode(raw).decode(), FORMAT_JSON_ZLIB, None)
+    return EncodedPayload(raw.decode("utf-8"), FORMAT_JSON, None)
+
+
+def store_payload(submission, data: Dict[str, Any]) -> None:
+    """Encode ``data`` onto a Submission (payload plus its format tag)."""
+    encoded = encode_payload(data)
+    submission.data_json = encoded.data_json
+    submission.data_format = encoded.data_format
+    submission.data_key_id = encoded.data_key_id
+
+
+def is_current_format(data_format: Optional[str], data_key_id: Optional[str]) -> bool:
+    """Whether a row already matches the configured encryption (compression is not forced)."""
+    if data_format is None:
+        return False
+    if settings.SUBMISSION_ENCRYPTION_ENABLED:
+        return data_format in ENCRYPTED_FORMATS and data_key_id == get_primary_key_id()
+    return data_format not in ENCRYPTED_FORMATS
+
+
+def _decode_json(raw: str, data_key_id: Optional[str]) -> Any:
+    return json.loads(raw)
+
+
+def _decode_json_zlib(raw: str, data_key_id: Optional[str]) -> Any:
+    return json.loads(zlib.decompress(base64.b64decode(raw)))
+
+
+def _decode_fernet(raw: str, data_key_id: Optional[str]) -> Any:
+    return json.loads(get_cipher_for(data_key_id).decrypt(raw.encode()))
+
+
+def _decode_fernet_zlib(raw: str, data_key_id: Optional[str]) -> Any:
+    return json.loads(zlib.decompress(get_cipher_for(data_key_id).decrypt(raw.encode())))
+
+
+_DECODERS: Dict[str, Callable[[str, Optional[str]], Any]] = {
+    FORMAT_JSON: _decode_json,
+    FORMAT_JSON_ZLIB: _decode_json_zlib,
+    FORMAT_FERNET: _decode_fernet,
+    FORMAT_FERNET_ZLIB: _decode_fernet_zlib,
+}
+
+
+def _legacy_format(raw: str) -> str:
+    return FORMAT_FERNET if raw.startswith(FERNET_TOKEN_PREFIX) else FORMAT_JSON
+
+
+def decode_payload_strict(raw_payload, data_format: Optional[str] = None, data_key_id: Optional[str] = None) -> Dict[str, Any]:
+    """Decode a stored payload, raising ``PayloadDecodeError`` if it is unreadable."""
+    if isinstance(raw_payload, dict):
+        return raw_payload
+    if not raw_payload:
+        return {}
+    decoder = _DECODERS.get(data_format or _legacy_format(raw_payload))
+    if decoder is None:
+        raise PayloadDecodeError(f"Unknown payload format: {data_format}")
+    try:
+        parsed = decoder(raw_payload, data_key_id)
+    except (InvalidToken, json.JSONDecodeError, zlib.error, ValueError, TypeError) as exc:
+        raise PayloadDecodeError(f"{type(exc).__name__} decoding {data_format or 'untagged'} payload") from exc
+    if not isinstance(parsed, dict):
+        raise PayloadDecodeError("Payload is not a JSON object")
+    return parsed
+
+
+def decode_payload(
+    raw_payload,
+    data_format: Optional[str] = None,
+    data_key_id: Optional[str] = None,
+    invalid: Any = _EMPTY,
+) -> Dict[str, Any]:
+    """Decode a stored payload; unreadable rows give ``{}``, or ``invalid`` when given."""
+    try:
+        return decode_payload_strict(raw_payload, data_format, data_key_id)
+    except PayloadDecodeError:
+        return {} if invalid is _EMPTY else invalid
+
+
+@traced("decode")
+def decode_submission_payload(submission, invalid: Any = _EMPTY) -> Dict[str, Any]:
+    return decode_payload(submission.data_json, submission.data_format, submission.data_key_id, invalid)
+
+
+def _get_decrypt_pool() -> ThreadPoolExecutor:
+    global _decrypt_pool
+    if _decrypt_pool is None:
+        with _decrypt_pool_lock:
+            if _decrypt_pool is None:
+                _decrypt_pool = ThreadPoolExecutor(
+                    max_workers=settings.PAYLOAD_DECODE_WORKERS, thread_name_prefix="payload-decode"
+                )
+    return _decrypt_pool
+
+
+def _decode_batch(submissions: Sequence, invalid: Any = _EMPTY) -> List[Dict[str, Any]]:
+    # decode_payload directly: the whole bulk decode is one span, not one per submission.
+    return [
+        decode_payload(submission.data_json, submission.data_format, submission.data_key_id, invalid)
+        for submission in submissions
+    ]
+
+
+def _is_encrypted(submission) -> bool:
+    if submission.data_format is not None:
+        return submission.data_format in ENCRYPTED_FORMATS
+    return isinstance(submission.data_json, str) and submission.data_json.startswith(FERNET_TOKEN_PREFIX)
+
+
+@traced("decode")
+def decode_submission_payloads(submissions: Sequence, invalid: Any = _EMPTY) -> List[Dict[str, Any]]:
+    """Decode the payloads of many submissions, in order.
+
+    Encrypted bulk reads are split into batches across a small thread pool.
+    """
+    submissions = list(submissions)
+    batch_size = max(settings.PAYLOAD_DECODE_BATCH_SIZE, 1)
+    if (
+        settings.PAYLOAD_DECODE_WORKERS <= 1
+        or len(submissions) <= batch_size
+        or not any(_is_encrypted(submission) for submission in submissions)
+    ):
+        return _decode_batch(submissions, invalid)
+
+    batches = [submissions[i:i + batch_size] for i in range(0, len(submissions), batch_size)]
+    result: List[Dict[str, Any]] = []
+    for decoded in _get_decrypt_pool().map(_decode_batch, batches, [invalid] * len(batches)):
+        result.extend(decoded)
+    return result
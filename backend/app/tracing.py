@@ -0,0 +1,303 @@
+"""Opt-in request tracing (TRACING_ENABLED) into a trace file and/or a Server-Timing header.
+
+``TracingMiddleware`` (app.middleware.http_middleware) starts a trace for
+each request. Spans are recorded for:
+
+- ``auth``: ``get_current_user`` (API key or token check, principal lookup);
+- ``db``: each SQL statement, from engine cursor events (``trace_engine``);
+- ``decode``: decoding submission payloads (decrypt, decompress, JSON);
+- ``handler``: the endpoint function (``trace_endpoints``);
+- ``serialize``: from the endpoint's return to the response start. This is
+  pydantic validation of the response model and JSON rendering;
+- ``stream``: from the response start to its last body byte. It only
+  matters for streaming responses such as exports.
+
+With TRACE_SERVER_TIMING set, every response started after routing gets a
+``Server-Timing`` header with the total time per span name up to that point
+(browsers show it in the network panel's Timing tab). Spans nest, so ``db``
+time is also part of ``auth`` and ``handler``. The header goes to any
+client, authenticated or not, so it is meant for development.
+
+With TRACE_FILE set, a sampled share of traces (TRACE_SAMPLE_RATE) is
+appended as OpenTelemetry (OTLP/JSON) lines. Each line is one
+``{"resourceSpans": [...]}`` document, the format the OpenTelemetry
+collector's file exporter writes. The lines can be loaded into any OTLP
+viewer for flame graphs. Statements are recorded by shape, without parameter
+values.
+"""
+import asyncio
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.types import Scope
+
+from app.config import settings
+from app.request_context import route_template
+from app.slow_queries import statement_shape
+
+logger = logging.getLogger(__name__)
+
+# Spans kept per trace for the file; Server-Timing totals count every span.
+MAX_SPANS = 1000
+MAX_STATEMENT_LENGTH = 500
+EXPORT_QUEUE_SIZE = 1000
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_ERROR = 2
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start", "end", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], start: int, kind: int = SPAN_KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = start
+        self.end: Optional[int] = None
+        self.attributes = attributes or {}
+
+
+class Trace:
+    """Spans of one request. Times are ``perf_counter_ns`` values, anchored to the wall clock at start."""
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self.trace_id = _new_id(128)
+        self.wall_start = time.time_ns()
+        self.root = Span("request", None, time.perf_counter_ns(), kind=SPAN_KIND_SERVER)
+        self.spans: List[Span] = [self.root]
+        self.dropped = 0
+        self.status_code: Optional[int] = None
+        self._totals: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        """Record a finished span."""
+        with self._lock:
+            totals = self._totals.setdefault(span.name, [0, 0])
+            totals[0] += 1
+            totals[1] += span.end - span.start
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def last_span_end(self, name: str) -> Optional[int]:
+        with self._lock:
+            ends = [span.end for span in self.spans if span.name == name and span.end is not None]
+        return max(ends) if ends else None
+
+    def server_timing(self, now: int) -> bytes:
+        with self._lock:
+            totals = list(self._totals.items())
+        entries = []
+        for name, (count, duration) in totals:
+            entry = f"{name};dur={duration / 1e6:.2f}"
+            if name == "db":
+                entry += f';desc="{count} queries"'
+            entries.append(entry)
+        entries.append(f"total;dur={(now - self.root.start) / 1e6:.2f}")
+        return ", ".join(entries).encode()
+
+    def finish(self, end: int) -> None:
+        self.root.end = end
+        self.root.attributes.update({
+            "http.request.method": self.scope["method"],
+            "http.route": route_template(self.scope),
+            "url.path": self.scope["path"],
+        })
+        if self.status_code is not None:
+            self.root.attributes["http.response.status_code"] = self.status_code
+        if self.dropped:
+            self.root.attributes["trace.dropped_spans"] = self.dropped
+
+    def to_otlp(self) -> Dict[str, Any]:
+        def nanos(perf_ns: int) -> str:
+            return str(self.wall_start + perf_ns - self.root.start)
+
+        spans = []
+        for span in self.spans:
+            if span.end is None:
+                continue
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": nanos(span.start),
+                "endTimeUnixNano": nanos(span.end),
+                "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = span.parent_id
+            if span is self.root and (self.status_code or 500) >= 500:
+                otlp_span["status"] = {"code": STATUS_CODE_ERROR}
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", settings.DB_APPLICATION_NAME)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record the enclosed block as a span of the current request's trace, if there is one."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    parent = current_span.get()
+    current = Span(name, parent.span_id if parent is not None else None, time.perf_counter_ns(),
+                   attributes=attributes)
+    token = current_span.set(current)
+    try:
+        yield
+    finally:
+        current_span.reset(token)
+        current.end = time.perf_counter_ns()
+        trace.add(current)
+
+
+def traced(name: str):
+    """Decorator form of ``span`` for sync and async functions; the signature is kept for FastAPI."""
+    def decorator(fn):
+        if getattr(fn, "_traced_as", None) is not None:
+            return fn
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return fn(*args, **kwargs)
+        wrapper._traced_as = name
+        return wrapper
+    return decorator
+
+
+def trace_endpoints(routes) -> None:
+    """Record each API endpoint function as a ``handler`` span.
+
+    FastAPI calls ``route.dependant.call`` after resolving dependencies and
+    before serialising the result, so wrapping it separates the handler from
+    ``auth`` and ``serialize``.
+    """
+    for route in routes:
+        if isinstance(route, APIRoute) and route.dependant.call is not None:
+            route.dependant.call = traced("handler")(route.dependant.call)
+
+
+def trace_engine(target) -> None:
+    """Record every statement run on ``target`` (a sync Engine) as a ``db`` span."""
+    system = target.dialect.name
+
+    @event.listens_for(target, "before_cursor_execute")
+    def _start_span(conn, cursor, statement, parameters, context, executemany):
+        if current_trace.get() is not None:
+            conn.info.setdefault("trace_started", []).append(time.perf_counter_ns())
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _end_span(conn, cursor, statement, parameters, context, executemany):
+        trace = current_trace.get()
+        if trace is None or not conn.info.get("trace_started"):
+            return
+        parent = current_span.get()
+        db_span = Span("db", parent.span_id if parent is not None else None, conn.info["trace_started"].pop(),
+                       kind=SPAN_KIND_CLIENT,
+                       attributes={"db.system": system,
+                                   "db.statement": statement_shape(statement)[:MAX_STATEMENT_LENGTH]})
+        db_span.end = time.perf_counter_ns()
+        trace.add(db_span)
+
+    @event.listens_for(target, "handle_error")
+    def _drop_span(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("trace_started"):
+            conn.info["trace_started"].pop()
+
+
+class _TraceFileExporter:
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._file_logger = logging.getLogger(f"{__name__}.file")
+        self._file_logger.handlers = [handler]
+        self._file_logger.setLevel(logging.INFO)
+        self._file_logger.propagate = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def export(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            pass  # tracing never holds up requests
+
+    def _run(self) -> None:
+        while True:
+            trace = self._queue.get()
+            try:
+                self._file_logger.info(json.dumps(trace.to_otlp(), separators=(",", ":")))
+            except Exception:
+                logger.exception("Could not write a trace")
+
+
+_exporter: Optional[_TraceFileExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def export_trace(trace: Trace) -> None:
+    """Queue a finished trace for TRACE_FILE, subject to TRACE_SAMPLE_RATE."""
+    global _exporter
+    if not settings.TRACE_FILE or random.random() >= settings.TRACE_SAMPLE_RATE:
+        return
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = _TraceFileExporter(
+                    settings.TRACE_FILE, settings.TRACE_FILE_MAX_BYTES, settings.TRACE_FILE_BACKUPS
+                )
+    _exporter.export(trace)
@@ -0,0 +1,352 @@
+"""Unique-key derivation and online re-indexing of submission_unique_keys.
+
+Keys are derived from the fields marked ``unique_key`` in a form schema:
+one field keeps one-field semantics, two or more fields are enforced as a
+composed combination (``__composite__:<a>|<b>``).
+
+When an admin changes which fields are unique keys, the existing rows in
+``submission_unique_keys`` for that form go stale. ``update_form`` then starts
+a ``UniqueKeyReindexJob`` that rebuilds the keys for that form only:
+
+1. Submissions are walked in id order in batches. Their new keys go into
+   ``submission_unique_key_staging`` and the cursor is committed after every
+   batch, so an interrupted job resumes where it stopped.
+2. When the walk finishes, one transaction swaps the staged keys in. Rows
+   written by submissions already saved against the new schema version are
+   kept, all other rows for the form are replaced, and colliding values are
+   reported as duplicates instead of aborting the swap.
+
+The same job rebuilds keys whose storage format no longer matches the
+settings (plain values vs. blind indexes, see app.submission_storage). At
+startup ``queue_stale_unique_key_reindex`` queues one for every such form.
+
+Jobs run on the shared batch runner (``app.backfill``). It claims them with a
+lease, so several API workers can try to resume pending jobs at startup
+without running the same job twice. It also throttles them.
+"""
+import json
+import logging
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.backfill import JOB_ACTIVE_STATUSES, active_job_ids, run_job, utcnow
+from app.config import settings
+from app.database import begin_write
+from app.submission_storage import (
+    BLIND_INDEX_PREFIX,
+    blind_index_prefix,
+    decode_payload,
+    unique_key_storage_value,
+)
+from app.models import (
+    Form,
+    Submission,
+    SubmissionUniqueKey,
+    SubmissionUniqueKeyStaging,
+    UniqueKeyReindexJob,
+)
+
+logger = logging.getLogger(__name__)
+
+# How many duplicate groups a job keeps in its report.
+MAX_REPORTED_DUPLICATES = 100
+
+
+class UniqueKeyError(ValueError):
+    """Raised when a payload cannot produce its unique key (missing value, no key fields)."""
+
+
+def normalize_unique_value(value) -> str:
+    """Normalize values so uniqueness checks are consistent."""
+    if isinstance(value, str):
+        return value.strip()
+    return str(value).strip()
+
+
+def unique_field_names(schema_json) -> Tuple[str, ...]:
+    """Names of the fields marked as unique keys, in schema order."""
+    fields = schema_json.get("fields", []) if isinstance(schema_json, dict) else []
+    return tuple(
+        field.get("name")
+        for field in fields
+        if isinstance(field, dict) and field.get("unique_key") is True and field.get("name")
+    )
+
+
+def build_unique_key_entries(unique_fields: Iterable[dict], data_json: dict) -> List[dict]:
+    """Derive the unique-key rows for one payload from the form's unique-key fields."""
+    unique_fields = list(unique_fields)
+    if len(unique_fields) == 0:
+        raise UniqueKeyError("This form is invalid: no unique key field is configured. Please contact an administrator.")
+
+    normalized_parts = []
+    labels = []
+    field_names = []
+
+    for field in unique_fields:
+        field_name = field.get("name")
+        label = field.get("label") or field_name
+        raw_value = data_json.get(field_name)
+
+        if raw_value is None or normalize_unique_value(raw_value) == "":
+            raise UniqueKeyError(f"Unique key field '{label}' is required and cannot be empty.")
+
+        normalized_parts.append(normalize_unique_value(raw_value))
+        labels.append(label)
+        field_names.append(field_name)
+
+    # Single unique key field: keep one-field behavior.
+    # key_value is what gets stored: the normalized value, or its blind index when
+    # payload encryption is enabled (see app.submission_storage).
+    if len(unique_fields) == 1:
+        return [{
+            "key_name": field_names[0],
+            "key_value": unique_key_storage_value(field_names[0], normalized_parts[0]),
+            "label": labels[0],
+            "display_value": normalized_parts[0],
+        }]
+
+    # Multiple unique key fields: enforce uniqueness on composed key combination.
+    key_name = f"__composite__:{'|'.join(field_names)}"
+    return [{
+        "key_name": key_name,
+        "key_value": unique_key_storage_value(
+            key_name, json.dumps(normalized_parts, ensure_ascii=False, separators=(",", ":"))
+        ),
+        "label": " + ".join(labels),
+        "display_value": " + ".join(normalized_parts),
+    }]
+
+
+def _stale_key_format(key_value_column):
+    """SQL condition: the stored key is not in the format ``unique_key_storage_value`` writes now."""
+    if settings.SUBMISSION_ENCRYPTION_ENABLED:
+        return ~key_value_column.startswith(blind_index_prefix(), autoescape=True)
+    return key_value_column.startswith(BLIND_INDEX_PREFIX, autoescape=True)
+
+
+def _unique_fields(schema_json) -> List[dict]:
+    fields = schema_json.get("fields", []) if isinstance(schema_json, dict) else []
+    return [field for field in fields if isinstance(field, dict) and field.get("unique_key") is True]
+
+
+def start_reindex_job(db: Session, form: Form, requested_by: Optional[int] = None) -> UniqueKeyReindexJob:
+    """Queue a re-index of one form's unique keys; supersedes any job still in flight.
+
+    The caller commits, so the job becomes visible together with the schema change.
+    """
+    db.query(UniqueKeyReindexJob).filter(
+        UniqueKeyReindexJob.form_id == form.id,
+        UniqueKeyReindexJob.status.in_(JOB_ACTIVE_STATUSES),
+    ).update({"status": "superseded", "finished_at": utcnow()}, synchronize_session=False)
+
+    job = UniqueKeyReindexJob(
+        form_id=form.id,
+        schema_version=form.schema_version,
+        status="pending",
+        last_submission_id=0,
+        processed_count=0,
+        missing_count=0,
+        duplicate_count=0,
+        requested_by=requested_by,
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def _stage_batch(db: Session, job: UniqueKeyReindexJob, batch_size: int) -> Optional[int]:
+    """Stage keys for the next batch of submissions; returns the number of submissions read.
+
+    Supersedes the job instead (returning None) once the form's schema has moved past it.
+    """
+    form = db.query(Form).filter(Form.id == job.form_id).first()
+    if form is None or form.schema_version != job.schema_version:
+        # A newer schema change queued its own job.
+        job.status = "superseded"
+        job.finished_at = utcnow()
+        return None
+
+    unique_fields = _unique_fields(form.schema_json)
+    begin_write(db)
+    rows = db.execute(
+        select(Submission.id, Submission.data_json, Submission.data_format, Submission.data_key_id)
+        .where(Submission.form_id == job.form_id, Submission.id > job.last_submission_id)
+        .order_by(Submission.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    staged = []
+    missing = 0
+    for submission_id, raw_payload, data_format, data_key_id in rows:
+        try:
+            entries = build_unique_key_entries(unique_fields, decode_payload(raw_payload, data_format, data_key_id))
+        except UniqueKeyError:
+            missing += 1
+            continue
+        for entry in entries:
+            staged.append({
+                "job_id": job.id,
+                "submission_id": submission_id,
+                "form_id": job.form_id,
+                "key_name": entry["key_name"],
+                "key_value": entry["key_value"],
+            })
+
+    if staged:
+        db.execute(insert(SubmissionUniqueKeyStaging), staged)
+    job.last_submission_id = rows[-1][0]
+    job.processed_count = (job.processed_count or 0) + len(rows)
+    job.missing_count = (job.missing_count or 0) + missing
+    return len(rows)
+
+
+def _swap_in_staged_keys(db: Session, job: UniqueKeyReindexJob) -> None:
+    """Replace the form's live keys with the staged ones, in the transaction that completes the job."""
+    staging = SubmissionUniqueKeyStaging.__table__
+    live = SubmissionUniqueKey.__table__
+
+    # Submissions saved against this schema version (or newer) already wrote correct keys.
+    fresh_ids = select(Submission.id).where(
+        Submission.form_id == job.form_id,
+        Submission.schema_version >= job.schema_version,
+    )
+    existing_ids = select(Submission.id).where(Submission.form_id == job.form_id)
+
+    duplicate_groups = db.execute(
+        select(staging.c.key_name, staging.c.key_value, func.count().label("occurrences"))
+        .where(staging.c.job_id == job.id)
+        .group_by(staging.c.key_name, staging.c.key_value)
+        .having(func.count() > 1)
+        .limit(MAX_REPORTED_DUPLICATES)
+    ).all()
+    duplicates = []
+    for key_name, key_value, occurrences in duplicate_groups:
+        submission_ids = db.execute(
+            select(staging.c.submission_id)
+            .where(staging.c.job_id == job.id, staging.c.key_name == key_name, staging.c.key_value == key_value)
+            .order_by(staging.c.submission_id)
+        ).scalars().all()
+        duplicates.append({"key_name": key_name, "key_value": key_value, "submission_ids": submission_ids})
+
+    db.execute(
+        delete(live).where(
+            live.c.form_id == job.form_id,
+            live.c.submission_id.not_in(fresh_ids) | _stale_key_format(live.c.key_value),
+        )
+    )
+    kept_ids = select(live.c.submission_id).where(live.c.form_id == job.form_id)
+
+    # Lowest submission id wins a duplicate group, matching the offline rebuild script.
+    winner = staging.alias("winner")
+    first_submission = (
+        select(func.min(winner.c.submission_id))
+        .where(
+            winner.c.job_id == staging.c.job_id,
+            winner.c.key_name == staging.c.key_name,
+            winner.c.key_value == staging.c.key_value,
+        )
+        .scalar_subquery()
+    )
+    already_taken = (
+        select(live.c.id)
+        .where(
+            live.c.form_id == staging.c.form_id,
+            live.c.key_name == staging.c.key_name,
+            live.c.key_value == staging.c.key_value,
+        )
+        .exists()
+    )
+    candidates = select(
+        staging.c.submission_id, staging.c.form_id, staging.c.key_name, staging.c.key_value
+    ).where(
+        staging.c.job_id == job.id,
+        staging.c.submission_id == first_submission,
+        staging.c.submission_id.not_in(kept_ids),
+        staging.c.submission_id.in_(existing_ids),
+    )
+    collisions = db.execute(
+        select(func.count()).select_from(candidates.where(already_taken).subquery())
+    ).scalar_one()
+    db.execute(
+        insert(live).from_select(
+            ["submission_id", "form_id", "key_name", "key_value"],
+            candidates.where(~already_taken),
+        )
+    )
+    db.execute(delete(staging).where(staging.c.job_id == job.id))
+
+    job.duplicate_count = sum(len(group["submission_ids"]) - 1 for group in duplicates) + collisions
+    job.duplicates_json = json.dumps(duplicates, ensure_ascii=False)
+    logger.info(
+        "Unique key re-index job %s for form %s completed: %s submissions, %s duplicates, %s missing keys, %s rows/s",
+        job.id, job.form_id, job.processed_count, job.duplicate_count, job.missing_count, job.rows_per_second,
+    )
+
+
+def _discard_staged_keys(db: Session, job: UniqueKeyReindexJob) -> None:
+    db.query(SubmissionUniqueKeyStaging).filter(
+        SubmissionUniqueKeyStaging.job_id == job.id
+    ).delete(synchronize_session=False)
+
+
+def run_reindex_job(job_id: int, batch_size: Optional[int] = None) -> Optional[str]:
+    """Run (or resume) a re-index job to completion; returns the final status.
+
+    Returns None when another worker holds the job's lease.
+    """
+    return run_job(
+        UniqueKeyReindexJob, job_id, _stage_batch,
+        batch_size=batch_size or settings.UNIQUE_KEY_REINDEX_BATCH_SIZE,
+        lease_seconds=settings.UNIQUE_KEY_REINDEX_LEASE_SECONDS,
+        label="Unique key re-index job",
+        finish=_swap_in_staged_keys,
+        abandon=_discard_staged_keys,
+    )
+
+
+def resume_pending_reindex_jobs() -> None:
+    """Resume jobs interrupted by a restart; run in a background thread at startup."""
+    for job_id in active_job_ids(UniqueKeyReindexJob):
+        run_reindex_job(job_id)
+
+
+def queue_stale_unique_key_reindex(db: Session) -> List[int]:
+    """Queue a re-index for each form with keys in another storage format; returns the form ids.
+
+    Forms that already have a job in flight are left to it.
+    """
+    begin_write(db)
+    stale_form_ids = {
+        form_id for (form_id,) in db.query(SubmissionUniqueKey.form_id)
+        .filter(_stale_key_format(SubmissionUniqueKey.key_value))
+        .distinct()
+    }
+    active_form_ids = {
+        form_id for (form_id,) in db.query(UniqueKeyReindexJob.form_id)
+        .filter(UniqueKeyReindexJob.status.in_(JOB_ACTIVE_STATUSES))
+    }
+    queued = []
+    for form in db.query(Form).filter(Form.id.in_(stale_form_ids - active_form_ids)).order_by(Form.id):
+        start_reindex_job(db, form)
+        queued.append(form.id)
+    db.commit()
+    if queued:
+        logger.warning(
+            "Unique keys of forms %s are stored in another format (SUBMISSION_ENCRYPTION_ENABLED or "
+            "BLIND_INDEX_KEY changed); re-indexing them. Duplicates against their older submissions are "
+            "not detected until the jobs finish.",
+            queued,
+        )
+    return queued
+
+
+def start_resume_thread() -> threading.Thread:
+    thread = threading.Thread(target=resume_pending_reindex_jobs, name="unique-key-reindex", daemon=True)
+    thread.start()
+    return thread
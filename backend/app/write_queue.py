@@ -0,0 +1,235 @@
+"""Single-writer group commit for SQLite.
+
+SQLite runs one write transaction at a time. Submission writes from many
+threadpool workers otherwise queue on the database lock, one commit each. With
+``SQLITE_WRITE_QUEUE_ENABLED`` they are handed to one writer thread per
+process instead:
+
+- the request thread does all reads, validation and payload encoding, then
+  submits a small write function and waits for its result;
+- the writer takes up to ``SQLITE_WRITE_QUEUE_MAX_BATCH`` queued writes, waiting
+  at most ``SQLITE_WRITE_QUEUE_MAX_WAIT_MS`` for more after the first one;
+- it runs the whole batch in one ``BEGIN IMMEDIATE`` transaction and commits
+  it once.
+
+Errors stay per request. If any write in a batch raises (e.g.
+``IntegrityError`` on a duplicate unique key), the batch is rolled back and
+replayed with one SAVEPOINT per write. Only the failing writes are rolled back
+and get the exception in their request threads; the rest still commit.
+Savepoints cost a round trip each, so they are only paid on this rare path.
+Write functions must therefore be safe to run twice after a rollback. If the
+commit itself fails, every write in the batch gets that error. A request that
+waits longer than ``SQLITE_WRITE_QUEUE_TIMEOUT_SECONDS`` is withdrawn, if its
+write has not started yet, and gets ``WriteQueueBusy`` (``503``).
+
+The queue needs the SQLite tuning layer (``SQLITE_TUNING_ENABLED``), which makes
+savepoints work. Other databases and untuned SQLite write inline as before.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import settings
+from app.database import begin_write, engine
+
+logger = logging.getLogger(__name__)
+
+# Batch size and commit latency samples kept for reporting.
+BATCH_WINDOW = 1000
+
+
+class WriteQueueBusy(Exception):
+    """A queued write did not start within the timeout; the caller should retry later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Database write queue is saturated")
+        self.retry_after = retry_after
+
+
+class _QueuedWrite(NamedTuple):
+    work: Callable[[Session], Any]
+    future: Future
+
+
+class WriteCoordinator:
+    """Runs write functions on one thread, several per transaction."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_batch: int,
+        max_wait_seconds: float,
+        timeout_seconds: Optional[float] = None,
+    ):
+        self.max_batch = max(max_batch, 1)
+        self.max_wait_seconds = max(max_wait_seconds, 0.0)
+        self.timeout_seconds = timeout_seconds
+        self._session_factory = session_factory
+        self._queue: "queue.Queue[_QueuedWrite]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.write_errors = 0
+        self.replays = 0
+        self.commit_errors = 0
+        self.timeouts = 0
+        self._batch_sizes = deque(maxlen=BATCH_WINDOW)
+        self._commit_seconds = deque(maxlen=BATCH_WINDOW)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, work: Callable[[Session], Any]) -> Any:
+        """Run ``work(session)`` on the writer thread and return its result once committed.
+
+        ``work`` must not commit or roll back, and may be replayed once after a rollback.
+        """
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put(_QueuedWrite(work, future))
+        try:
+            return future.result(self.timeout_seconds)
+        except FutureTimeoutError:
+            if future.cancel():
+                with self._lock:
+                    self.timeouts += 1
+                raise WriteQueueBusy(settings.SQLITE_WRITE_QUEUE_RETRY_AFTER_SECONDS)
+            # Already running: its outcome is decided within one batch.
+            return future.result()
+
+    def _next_batch(self) -> List[_QueuedWrite]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return [item for item in batch if item.future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._commit_batch(batch)
+
+    def _execute(self, session: Session, batch: List[_QueuedWrite], isolated: bool) -> List[tuple]:
+        """Run and commit a batch; returns (item, error, result) per write."""
+        begin_write(session)
+        outcomes = []
+        for item in batch:
+            if not isolated:
+                outcomes.append((item, None, item.work(session)))
+                continue
+            try:
+                with session.begin_nested():
+                    outcomes.append((item, None, item.work(session)))
+            except Exception as exc:
+                outcomes.append((item, exc, None))
+        session.commit()
+        return outcomes
+
+    def _commit_batch(self, batch: List[_QueuedWrite]) -> None:
+        started = time.perf_counter()
+        session = self._session_factory()
+        replayed = False
+        commit_failed = False
+        try:
+            try:
+                outcomes = self._execute(session, batch, isolated=False)
+            except Exception as exc:
+                session.rollback()
+                if len(batch) == 1:
+                    outcomes = [(batch[0], exc, None)]
+                else:
+                    # Replay with one savepoint per write, so only the failing writes fail.
+                    replayed = True
+                    outcomes = self._execute(session, batch, isolated=True)
+        except Exception as exc:
+            session.rollback()
+            logger.exception("Group commit of %s queued writes failed", len(batch))
+            commit_failed = True
+            outcomes = [(item, exc, None) for item in batch]
+        finally:
+            session.close()
+
+        for item, error, result in outcomes:
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(result)
+        with self._lock:
+            self.batches += 1
+            self.writes += len(batch)
+            self.write_errors += sum(1 for _, error, _ in outcomes if error is not None)
+            self.replays += int(replayed)
+            self.commit_errors += int(commit_failed)
+            self._batch_sizes.append(len(batch))
+            self._commit_seconds.append(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            commit_seconds = sorted(self._commit_seconds)
+            return {
+                "enabled": True,
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "writes": self.writes,
+                "write_errors": self.write_errors,
+                "replays": self.replays,
+                "commit_errors": self.commit_errors,
+                "timeouts": self.timeouts,
+                "batch_size_avg": round(sum(sizes) / len(sizes), 2) if sizes else None,
+                "batch_size_max": max(sizes) if sizes else None,
+                "batch_ms_p50": round(commit_seconds[len(commit_seconds) // 2] * 1000, 2) if commit_seconds else None,
+            }
+
+
+_coordinator: Optional[WriteCoordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def write_queue_enabled() -> bool:
+    return (
+        settings.SQLITE_WRITE_QUEUE_ENABLED
+        and settings.SQLITE_TUNING_ENABLED
+        and engine.dialect.name == "sqlite"
+    )
+
+
+def get_write_coordinator() -> Optional[WriteCoordinator]:
+    """The process-wide writer, or None when writes should run inline."""
+    global _coordinator
+    if not write_queue_enabled():
+        return None
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                _coordinator = WriteCoordinator(
+                    sessionmaker(bind=engine, autoflush=False, expire_on_commit=False),
+                    max_batch=settings.SQLITE_WRITE_QUEUE_MAX_BATCH,
+                    max_wait_seconds=settings.SQLITE_WRITE_QUEUE_MAX_WAIT_MS / 1000,
+                    timeout_seconds=settings.SQLITE_WRITE_QUEUE_TIMEOUT_SECONDS,
+                )
+    return _coordinator
+
+
+def write_queue_stats() -> Dict[str, Any]:
+    coordinator = _coordinator if write_queue_enabled() else None
+    if coordinator is None:
+        return {"enabled": write_queue_enabled()}
+    return coordinator.stats()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of the HTTP middleware stack: BaseHTTPMiddleware vs pure ASGI.
+
+Two small FastAPI apps share the same routes and the same CORSMiddleware:
+
+- legacy: the security headers as a ``BaseHTTPMiddleware`` subclass plus the
+  CORS-aware HTTPException handler, as ``main.py`` had them;
+- asgi: ``SecurityHeadersMiddleware`` and ``UnhandledErrorMiddleware`` from
+  ``app.middleware.http_middleware``, as ``main.py`` installs them now;
+- bare: CORSMiddleware only, for reference.
+
+Requests are driven straight through the ASGI interface (no sockets), so the
+difference between modes is the middleware itself. The streaming check sends
+a response of ``--chunks`` chunks produced ``--chunk-delay-ms`` apart. It then
+reports how late each chunk reached the server compared with when the
+endpoint yielded it, and the time to the first byte.
+
+Usage (from backend/):
+    python -m benchmarks.asgi_middleware --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.middleware.http_middleware import SecurityHeadersMiddleware, UnhandledErrorMiddleware
+
+MODES = ("bare", "legacy", "asgi")
+ORIGIN = "http://localhost:3000"
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        return response
+
+
+def build_app(mode: str, chunks: int, chunk_delay: float, yielded: list) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    @app.get("/missing")
+    def missing():
+        raise HTTPException(status_code=404, detail="Not found")
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            for index in range(chunks):
+                await asyncio.sleep(chunk_delay)
+                yielded.append(time.perf_counter())
+                yield f"row {index}\n".encode()
+        return StreamingResponse(body(), media_type="text/csv")
+
+    if mode == "asgi":
+        app.add_middleware(UnhandledErrorMiddleware)
+        app.add_middleware(SecurityHeadersMiddleware)
+    elif mode == "legacy":
+        app.add_middleware(LegacySecurityHeadersMiddleware)
+
+        @app.exception_handler(HTTPException)
+        async def http_exception_handler(request: Request, exc: HTTPException):
+            origin = request.headers.get("origin")
+            if origin == ORIGIN:
+                return JSONResponse(
+                    status_code=exc.status_code,
+                    content={"detail": exc.detail},
+                    headers={"Access-Control-Allow-Origin": origin, "Access-Control-Allow-Credentials": "true"},
+                )
+            raise exc
+
+    app.add_middleware(
+        CORSMiddleware, allow_origins=[ORIGIN], allow_credentials=True,
+        allow_methods=["*"], allow_headers=["*"], expose_headers=["*"], max_age=3600,
+    )
+    return app
+
+
+async def request(app, path: str, origin: bool = True, on_body=None) -> int:
+    headers = [(b"host", b"testserver")]
+    if origin:
+        headers.append((b"origin", ORIGIN.encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": headers, "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    status = {"code": None}
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client never disconnects; streaming responses cancel this wait when they finish.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body") and on_body is not None:
+            on_body(time.perf_counter())
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # ServerErrorMiddleware answers 500 and then re-raises for the server to log.
+        pass
+    return status["code"]
+
+
+async def measure(mode: str, requests: int, chunks: int, chunk_delay: float) -> dict:
+    yielded = []
+    app = build_app(mode, chunks, chunk_delay, yielded)
+    for _ in range(200):
+        await request(app, "/ping")
+
+    timings = {}
+    for path in ("/ping", "/missing"):
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            await request(app, path)
+            samples.append(time.perf_counter() - started)
+        timings[path] = round(statistics.mean(samples) * 1e6, 1)
+
+    received = []
+    started = time.perf_counter()
+    await request(app, "/stream", on_body=received.append)
+    lags = [(arrived - produced) * 1000 for produced, arrived in zip(yielded, received)]
+    return {
+        "mode": mode,
+        "ping_us": timings["/ping"],
+        "http_404_us": timings["/missing"],
+        "404_without_origin_status": await request(app, "/missing", origin=False),
+        "stream_chunks_received": len(received),
+        "stream_first_byte_ms": round((received[0] - started) * 1000, 2) if received else None,
+        "stream_chunk_lag_ms_max": round(max(lags), 3) if lags else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--chunk-delay-ms", type=float, default=5.0)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(measure(mode, args.requests, args.chunks, args.chunk_delay_ms / 1000))
+        for mode in args.modes
+    ]
+    for result in results:
+        print(json.dumps(result))
+    by_mode = {result["mode"]: result for result in results}
+    if {"bare", "legacy", "asgi"} <= by_mode.keys():
+        bare = by_mode["bare"]["ping_us"]
+        print(json.dumps({
+            "middleware_overhead_us": {
+                "legacy": round(by_mode["legacy"]["ping_us"] - bare, 1),
+                "asgi": round(by_mode["asgi"]["ping_us"] - bare, 1),
+            }
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput of the main API endpoints on a synthetic dataset.
+
+The dataset comes from ``benchmarks.synthetic_dataset``. Pass ``--database``
+to keep it: an existing file is reused when its manifest matches the dataset
+options. Without ``--database`` a temporary one is built and then removed.
+The app (``app.main``) runs in this process against that database, with its
+startup handlers and the middleware and settings from the environment or
+``.env``. Requests go straight through the ASGI interface, without sockets.
+
+Scenarios:
+
+- login: ``POST /api/auth/login`` as the sampled users (bcrypt);
+- list_submissions_user: ``GET /api/submissions`` as a user (own submissions);
+- list_submissions_form: ``GET /api/submissions?study_id=&form_id=`` as the
+  admin, over the forms of the largest study;
+- get_study: ``GET /api/studies/{id}`` as the admin, over all studies;
+- create_submission: ``POST /api/submissions`` as a user. This adds rows, so
+  a reused database grows a little with every run;
+- export_csv, export_json: ``POST /api/export/csv|json`` for the largest study
+  as the admin. The whole streamed body is read; time to first byte and size
+  are reported too.
+
+Each scenario sends ``--warmup`` untimed requests, then its timed requests
+from ``--concurrency`` concurrent clients. A result has the latency
+percentiles, the throughput, and the count of non-2xx answers. The JSON
+report (``--output``) also records the git commit, the dataset and the
+settings that change performance. ``--compare`` prints the change from an
+earlier report.
+
+Usage (from backend/):
+    python -m benchmarks.endpoints --database ./benchmarks/data/bench.db --submissions 100000
+    python -m benchmarks.endpoints --database ./benchmarks/data/bench.db --submissions 100000 \\
+        --compare benchmarks/results/<earlier report>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from app.metrics import percentile_ms
+
+SCENARIOS = (
+    "login",
+    "list_submissions_user",
+    "list_submissions_form",
+    "get_study",
+    "create_submission",
+    "export_csv",
+    "export_json",
+)
+EXPORT_SCENARIOS = ("export_csv", "export_json")
+# Settings recorded with the results: the ones that change how these endpoints perform.
+RECORDED_SETTINGS = (
+    "ENVIRONMENT", "PASSWORD_HASH_WORKERS", "AUTH_CACHE_TTL_SECONDS", "SUBMISSION_ENCRYPTION_ENABLED",
+    "SUBMISSION_COMPRESSION_MIN_BYTES", "PAYLOAD_DECODE_WORKERS", "PAYLOAD_DECODE_BATCH_SIZE",
+    "EXPORT_CHUNK_SIZE", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_ASYNC_ENABLED", "SQLITE_TUNING_ENABLED",
+    "SQLITE_JOURNAL_MODE", "SQLITE_SYNCHRONOUS", "SQLITE_WRITE_QUEUE_ENABLED", "FORM_SCHEMA_CACHE_SIZE",
+    "METRICS_ENABLED", "SLOW_QUERY_LOG_ENABLED", "QUERY_BUDGET_ENABLED", "TRACING_ENABLED", "TRACE_FILE",
+    "PROFILING_ENABLED",
+)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ORIGIN = "http://localhost:3000"
+CREATED_MRN_PREFIX = "ZZ"  # no synthetic hospital uses this code
+
+
+async def request(app, method: str, path: str, body=None, token=None, query: str = "") -> dict:
+    """One request through the ASGI interface; the response body is kept only when it is JSON."""
+    headers = [(b"host", b"testserver"), (b"origin", ORIGIN.encode())]
+    payload = b""
+    if body is not None:
+        payload = json.dumps(body).encode()
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    if token is not None:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": headers, "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    response = {"status": None, "bytes": 0, "first_byte": None, "json": False, "chunks": []}
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # The client never disconnects; streaming responses cancel this wait when they finish.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["json"] = any(
+                name == b"content-type" and value.startswith(b"application/json") for name, value in message["headers"]
+            )
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if response["first_byte"] is None:
+                response["first_byte"] = time.perf_counter()
+            response["bytes"] += len(message["body"])
+            if response["json"]:
+                response["chunks"].append(message["body"])
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # ServerErrorMiddleware answers 500 and then re-raises for the server to log.
+        pass
+    return response
+
+
+def response_json(response: dict):
+    return json.loads(b"".join(response["chunks"]))
+
+
+async def login(app, email: str, password: str) -> str:
+    response = await request(app, "POST", "/api/auth/login", {"email": email, "password": password})
+    if response["status"] != 200:
+        raise RuntimeError(f"Login as {email} failed with HTTP {response['status']}")
+    return response_json(response)["access_token"]
+
+
+def summarize(name: str, concurrency: int, latencies, statuses, elapsed: float, sizes, first_bytes) -> dict:
+    result = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(1 for code in statuses if code is None or code >= 300),
+        "status_codes": {str(code): statuses.count(code) for code in sorted(set(statuses), key=str)},
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": percentile_ms(latencies, 0.50),
+            "p95": percentile_ms(latencies, 0.95),
+            "p99": percentile_ms(latencies, 0.99),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "response_bytes_mean": round(statistics.mean(sizes)),
+    }
+    if first_bytes:
+        result["first_byte_ms_p50"] = percentile_ms(first_bytes, 0.50)
+    return result
+
+
+async def run_scenario(name: str, make_request, requests: int, concurrency: int, warmup: int) -> dict:
+    """Send ``requests`` timed requests from ``concurrency`` workers; ``make_request(i)`` sends request i."""
+    for index in range(warmup):
+        await make_request(-1 - index)
+
+    latencies, statuses, sizes, first_bytes = [], [], [], []
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            response = await make_request(index)
+            finished = time.perf_counter()
+            latencies.append(finished - started)
+            statuses.append(response["status"])
+            sizes.append(response["bytes"])
+            if name in EXPORT_SCENARIOS and response["first_byte"] is not None:
+                first_bytes.append(response["first_byte"] - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, concurrency, latencies, statuses, time.perf_counter() - started, sizes, first_bytes)
+
+
+async def measure(manifest: dict, args) -> list:
+    from app.database import engine
+    from app.main import app
+    from benchmarks.synthetic_dataset import make_payload
+
+    await app.router.startup()
+    try:
+        password = manifest["password"]
+        admin_token = await login(app, manifest["admin_email"], password)
+        # Users with submissions, busiest first, so the list scenario has rows to return.
+        users = sorted(manifest["users"], key=lambda user: user["submissions"], reverse=True)
+        users = [user for user in users if user["submissions"]][:args.sampled_users] or users[:1]
+        user_tokens = [await login(app, user["email"], password) for user in users]
+        largest_study = max(manifest["studies"], key=lambda study: study["submissions"])
+        study_ids = [study["id"] for study in manifest["studies"]]
+        templates = {form["id"]: form["template"] for form in manifest["forms"]}
+        with engine.connect() as conn:
+            # Created record numbers continue after any an earlier run added to a reused database.
+            created_base = conn.exec_driver_sql("SELECT COUNT(*) FROM submissions").scalar()
+
+        def list_user(index):
+            return request(app, "GET", "/api/submissions", token=user_tokens[index % len(user_tokens)])
+
+        def list_form(index):
+            form_id = largest_study["form_ids"][index % len(largest_study["form_ids"])]
+            return request(app, "GET", "/api/submissions", token=admin_token,
+                           query=f"study_id={largest_study['id']}&form_id={form_id}")
+
+        def get_study(index):
+            return request(app, "GET", f"/api/studies/{study_ids[index % len(study_ids)]}", token=admin_token)
+
+        def login_user(index):
+            return request(app, "POST", "/api/auth/login",
+                           {"email": users[index % len(users)]["email"], "password": password})
+
+        created = 0
+
+        def create(index):
+            nonlocal created
+            created += 1
+            form_id = largest_study["form_ids"][index % len(largest_study["form_ids"])]
+            data = make_payload(templates[form_id], rng, CREATED_MRN_PREFIX, created_base + created)
+            return request(app, "POST", "/api/submissions",
+                           {"form_id": form_id, "study_id": largest_study["id"], "data_json": data},
+                           token=user_tokens[index % len(user_tokens)])
+
+        def export(kind):
+            def send(index):
+                return request(app, "POST", f"/api/export/{kind}", {"study_id": largest_study["id"]},
+                               token=admin_token)
+            return send
+
+        rng = random.Random(args.seed)
+        scenarios = {
+            "login": (login_user, args.login_requests),
+            "list_submissions_user": (list_user, args.requests),
+            "list_submissions_form": (list_form, args.requests),
+            "get_study": (get_study, args.requests),
+            "create_submission": (create, args.requests),
+            "export_csv": (export("csv"), args.export_requests),
+            "export_json": (export("json"), args.export_requests),
+        }
+        results = []
+        for name in args.scenarios:
+            make_request, requests = scenarios[name]
+            for concurrency in args.concurrency:
+                warmup = min(args.warmup, requests)
+                result = await run_scenario(name, make_request, requests, concurrency, warmup)
+                print(json.dumps(result), flush=True)
+                results.append(result)
+        return results
+    finally:
+        await app.router.shutdown()
+
+
+def git_revision() -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def compare(report: dict, baseline_path: str) -> list:
+    """Change of each scenario's p50, p95 and throughput from the report at ``baseline_path``, in %."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    changes = []
+    for section in ("dataset", "settings"):
+        if baseline.get(section) != report[section]:
+            changes.append({"warning": f"{baseline_path} was run with different {section}"})
+    before = {(result["scenario"], result["concurrency"]): result for result in baseline["results"]}
+    for result in report["results"]:
+        old = before.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+
+        def change(new_value, old_value):
+            return round((new_value - old_value) / old_value * 100, 1) if old_value else None
+
+        changes.append({
+            "scenario": result["scenario"],
+            "concurrency": result["concurrency"],
+            "p50_change_pct": change(result["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+            "p95_change_pct": change(result["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+            "throughput_change_pct": change(result["throughput_rps"], old["throughput_rps"]),
+        })
+    return changes
+
+
+def main():
+    # app.config reads DATABASE_URL when it is first imported, so the database is known before any app import.
+    database_parser = argparse.ArgumentParser(add_help=False)
+    database_parser.add_argument("--database", help="SQLite file to build or reuse (default: a temporary one)")
+    database = database_parser.parse_known_args()[0].database
+    temp_dir = None
+    if database is None:
+        temp_dir = tempfile.mkdtemp(prefix="endpoint-bench-")
+        database = os.path.join(temp_dir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(database)}"
+    try:
+        from benchmarks.synthetic_dataset import add_dataset_arguments, build_dataset, dataset_spec, load_manifest
+
+        parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0], parents=[database_parser])
+        add_dataset_arguments(parser)
+        parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--login-requests", type=int, default=20)
+        parser.add_argument("--export-requests", type=int, default=5)
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--sampled-users", type=int, default=10, help="users to log in and act as")
+        parser.add_argument("--output", help="report path (default: benchmarks/results/endpoints-<commit>-<time>.json)")
+        parser.add_argument("--compare", help="earlier report to compare with")
+        args = parser.parse_args()
+
+        spec = dataset_spec(args)
+        manifest = load_manifest(database)
+        if manifest is None:
+            print(json.dumps({"building_dataset": database, **spec}), flush=True)
+            manifest = build_dataset(database, **spec)
+        elif manifest["spec"] != spec:
+            parser.error(f"{database} was built with {manifest['spec']}; use the same options or another path")
+
+        started_at = datetime.now(timezone.utc)
+        results = asyncio.run(measure(manifest, args))
+
+        from app.config import settings
+        report = {
+            "benchmark": "endpoints",
+            "started_at": started_at.isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": {**manifest["spec"], "storage": manifest["storage"]},
+            "settings": {name: getattr(settings, name) for name in RECORDED_SETTINGS},
+            "options": {
+                "requests": args.requests, "login_requests": args.login_requests,
+                "export_requests": args.export_requests, "concurrency": args.concurrency,
+                "warmup": args.warmup, "sampled_users": args.sampled_users,
+            },
+            "results": results,
+        }
+        output = args.output
+        if output is None:
+            commit = (report["git"]["commit"] or "unknown")[:10]
+            output = os.path.join(RESULTS_DIR, f"endpoints-{commit}-{started_at:%Y%m%dT%H%M%SZ}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(json.dumps({"report": output}))
+        if args.compare:
+            for change in compare(report, args.compare):
+                print(json.dumps(change))
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Concurrent-write throughput of SQLite: baseline, tuned, and with the write queue.
+
+Several threads each run the submission write path in a loop: look up a
+unique key, insert a submission row and its key, then commit. The workload
+runs in three modes, each on a fresh database file:
+
+- baseline: the old engine (rollback journal, default PRAGMAs, deferred
+  transactions);
+- tuned: ``configure_sqlite_engine`` with the current SQLITE_* settings, and
+  write transactions begun with ``BEGIN IMMEDIATE`` as ``begin_write`` does;
+- queued: the tuned engine, with the lookup done by each thread and the
+  inserts group-committed by a ``WriteCoordinator`` (SQLITE_WRITE_QUEUE_*).
+
+Usage (from backend/):
+    python -m benchmarks.sqlite_concurrent_writes --threads 8 --seconds 5
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, UniqueConstraint, create_engine, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.database import configure_sqlite_engine, sqlite_pragmas
+from app.write_queue import WriteCoordinator
+
+MODES = ("baseline", "tuned", "queued")
+
+metadata = MetaData()
+submissions = Table(
+    "submissions", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("form_id", Integer, nullable=False, index=True),
+    Column("data_json", Text, nullable=False),
+)
+unique_keys = Table(
+    "submission_unique_keys", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("submission_id", Integer, nullable=False, index=True),
+    Column("form_id", Integer, nullable=False),
+    Column("key_value", String, nullable=False),
+    UniqueConstraint("form_id", "key_value"),
+)
+
+
+def _make_engine(path: str, tuned: bool):
+    engine = create_engine(
+        f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=32, max_overflow=0
+    )
+    if tuned:
+        configure_sqlite_engine(engine)
+    metadata.create_all(engine)
+    return engine
+
+
+def _insert_write(payload: str, key: str):
+    """The write step, run on a Connection (inline) or a Session (queued)."""
+    def write(session):
+        submission_id = session.execute(
+            submissions.insert().values(form_id=1, data_json=payload)
+        ).inserted_primary_key[0]
+        session.execute(unique_keys.insert().values(submission_id=submission_id, form_id=1, key_value=key))
+        return submission_id
+    return write
+
+
+def _worker(engine, mode: str, coordinator, payload: str, deadline: float, results: dict, lock: threading.Lock):
+    latencies = []
+    errors = 0
+    options = {"sqlite_begin": "immediate"} if mode == "tuned" else {}
+    while time.perf_counter() < deadline:
+        key = uuid.uuid4().hex
+        started = time.perf_counter()
+        try:
+            if coordinator is not None:
+                with engine.connect() as conn:
+                    exists = conn.execute(
+                        select(unique_keys.c.id).where(unique_keys.c.form_id == 1, unique_keys.c.key_value == key)
+                    ).first()
+                if exists is None:
+                    coordinator.submit(_insert_write(payload, key))
+            else:
+                with engine.connect() as conn:
+                    conn = conn.execution_options(**options)
+                    with conn.begin():
+                        exists = conn.execute(
+                            select(unique_keys.c.id).where(unique_keys.c.form_id == 1, unique_keys.c.key_value == key)
+                        ).first()
+                        if exists is None:
+                            _insert_write(payload, key)(conn)
+        except (IntegrityError, OperationalError):
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    with lock:
+        results["latencies"].extend(latencies)
+        results["errors"] += errors
+
+
+def run(mode: str, threads: int, seconds: float, payload_bytes: int) -> dict:
+    payload = json.dumps({"notes": "x" * payload_bytes})
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(os.path.join(tmp, "bench.db"), tuned=mode != "baseline")
+        coordinator = None
+        if mode == "queued":
+            coordinator = WriteCoordinator(
+                sessionmaker(bind=engine, expire_on_commit=False),
+                max_batch=settings.SQLITE_WRITE_QUEUE_MAX_BATCH,
+                max_wait_seconds=settings.SQLITE_WRITE_QUEUE_MAX_WAIT_MS / 1000,
+            )
+        results = {"latencies": [], "errors": 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+        workers = [
+            threading.Thread(target=_worker, args=(engine, mode, coordinator, payload, deadline, results, lock))
+            for _ in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        engine.dispose()
+        queue_stats = coordinator.stats() if coordinator is not None else None
+
+    latencies = sorted(results["latencies"])
+    committed = len(latencies)
+    return {
+        "mode": mode,
+        "threads": threads,
+        "committed": committed,
+        "errors": results["errors"],
+        "tx_per_second": round(committed / seconds, 1),
+        "latency_ms_p50": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "latency_ms_p95": round(latencies[int(0.95 * (committed - 1))] * 1000, 2) if latencies else None,
+        "write_queue": queue_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--payload-bytes", type=int, default=1024)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    print("Tuned PRAGMAs: " + "; ".join(sqlite_pragmas()))
+    for mode in args.modes:
+        print(json.dumps(run(mode, args.threads, args.seconds, args.payload_bytes)))
+
+
+if __name__ == "__main__":
+    main()
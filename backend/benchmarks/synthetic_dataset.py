@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Synthetic research dataset for benchmarks: hospitals, users, studies, forms and submissions.
+
+The database is created with the app's migrations and filled with bulk
+inserts, so a million submissions take minutes rather than the hours the API
+would need:
+
+- hospitals, each with a two-letter code used in its patients' record numbers;
+- one admin and ``--users`` users spread over the hospitals. They all share
+  one password, hashed once;
+- ``--forms`` forms cycling through four oncology templates (registration,
+  diagnosis, treatment cycle, follow-up visit). They use every field type,
+  single and composite unique keys, and free-text reports of a few hundred
+  bytes;
+- ``--studies`` studies in Data Collection, each with ``--forms-per-study``
+  forms;
+- ``--submissions`` submissions, created over the last three years. A few
+  hospitals enter most of the data. Payloads are encoded the way the API
+  stores them (``encode_payload``, so SUBMISSION_ENCRYPTION_ENABLED and
+  SUBMISSION_COMPRESSION_MIN_BYTES apply), with their unique-key rows.
+
+The same ``--seed`` builds the same data. A manifest with the parameters,
+the ids and the credentials is written next to the database as
+``<database>.dataset.json``. ``benchmarks.endpoints`` reads it to reuse the
+database.
+
+Usage (from backend/):
+    python -m benchmarks.synthetic_dataset --database ./benchmarks/data/bench.db --submissions 100000
+"""
+import argparse
+import json
+import os
+import random
+import string
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import MetaData, create_engine
+
+from app.auth import get_password_hash
+from app.form_validation import schema_hash, validate_schema_definition
+from app.migrations import upgrade
+from app.submission_storage import encode_payload
+from app.unique_keys import build_unique_key_entries
+
+PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "admin@benchmark.example.org"
+MANIFEST_SUFFIX = ".dataset.json"
+SAMPLED_USERS = 50
+HISTORY_DAYS = 3 * 365
+MRN_PATTERN = r"^[A-Z]{2}\d{7}$"
+
+WORDS = (
+    "patient tolerated treatment well no new complaints mild fatigue nausea grade one resolved with "
+    "antiemetics imaging shows stable disease partial response lesion measured previously reduced "
+    "margin clear invasive ductal carcinoma lymph nodes negative biopsy confirmed adenocarcinoma "
+    "moderately differentiated follow up scheduled blood counts within normal limits dose adjusted "
+    "for renal function performance status unchanged weight stable appetite improved"
+).split()
+
+REGIMENS = ["AC-T", "FOLFOX", "FOLFIRINOX", "Carboplatin/Paclitaxel", "Cisplatin/Etoposide",
+            "Pembrolizumab", "Trastuzumab", "Capecitabine", "Gemcitabine/Nab-paclitaxel"]
+SITES = ["Breast", "Lung", "Colorectal", "Prostate", "Pancreas", "Ovary", "Melanoma"]
+ICD10 = {"Breast": "C50", "Lung": "C34", "Colorectal": "C18", "Prostate": "C61", "Pancreas": "C25",
+         "Ovary": "C56", "Melanoma": "C43"}
+
+
+def _field(name, label, field_type, required=False, unique_key=False, options=None, validation=None):
+    field = {"name": name, "label": label, "type": field_type, "required": required, "unique_key": unique_key}
+    if options is not None:
+        field["options"] = options
+    if validation is not None:
+        field["validation"] = validation
+    return field
+
+
+def _mrn_field():
+    return _field("mrn", "Medical record number", "text", required=True, unique_key=True,
+                  validation={"pattern": MRN_PATTERN})
+
+
+# name -> form schema; payloads come from the matching _*_payload function.
+TEMPLATES = {
+    "registration": {"fields": [
+        _mrn_field(),
+        _field("date_of_birth", "Date of birth", "date", required=True),
+        _field("sex", "Sex", "select", required=True, options=["Female", "Male", "Other"]),
+        _field("enrollment_date", "Enrollment date", "date", required=True),
+        _field("ecog_status", "ECOG performance status", "radio", options=["0", "1", "2", "3", "4"]),
+        _field("smoking_status", "Smoking status", "select", options=["Never", "Former", "Current"]),
+        _field("consent_signed", "Informed consent signed", "checkbox", required=True),
+        _field("notes", "Notes", "textarea"),
+    ]},
+    "diagnosis": {"fields": [
+        _mrn_field(),
+        _field("diagnosis_date", "Diagnosis date", "date", required=True, unique_key=True),
+        _field("primary_site", "Primary site", "select", required=True, options=SITES),
+        _field("icd10_code", "ICD-10 code", "text", validation={"pattern": r"^C\d{2}(\.\d)?$"}),
+        _field("histology", "Histology", "text"),
+        _field("t_stage", "T stage", "select", options=["TX", "T0", "T1", "T2", "T3", "T4"]),
+        _field("n_stage", "N stage", "select", options=["NX", "N0", "N1", "N2", "N3"]),
+        _field("m_stage", "M stage", "select", options=["MX", "M0", "M1"]),
+        _field("tumour_size_mm", "Tumour size (mm)", "number", validation={"min": 0, "max": 300}),
+        _field("grade", "Grade", "radio", options=["1", "2", "3"]),
+        _field("er_positive", "ER positive", "checkbox"),
+        _field("pr_positive", "PR positive", "checkbox"),
+        _field("her2_positive", "HER2 positive", "checkbox"),
+        _field("pathology_report", "Pathology report", "textarea"),
+    ]},
+    "treatment": {"fields": [
+        _mrn_field(),
+        _field("cycle_number", "Cycle number", "number", required=True, unique_key=True,
+               validation={"min": 1, "max": 40}),
+        _field("start_date", "Cycle start date", "date", required=True),
+        _field("regimen", "Regimen", "select", required=True, options=REGIMENS),
+        _field("dose_mg_m2", "Dose (mg/m2)", "number", validation={"min": 0, "max": 5000}),
+        _field("weight_kg", "Weight (kg)", "number", validation={"min": 20, "max": 250}),
+        _field("dose_reduced", "Dose reduced", "checkbox"),
+        _field("ctcae_grade", "Worst CTCAE grade", "radio", options=["0", "1", "2", "3", "4", "5"]),
+        _field("adverse_events", "Adverse events", "textarea"),
+    ]},
+    "follow_up": {"fields": [
+        _mrn_field(),
+        _field("visit_date", "Visit date", "date", required=True, unique_key=True),
+        _field("disease_status", "Disease status", "select", required=True,
+               options=["No evidence of disease", "Stable", "Partial response", "Progression"]),
+        _field("ecog_status", "ECOG performance status", "radio", options=["0", "1", "2", "3", "4"]),
+        _field("weight_kg", "Weight (kg)", "number", validation={"min": 20, "max": 250}),
+        _field("cea_ng_ml", "CEA (ng/mL)", "number", validation={"min": 0, "max": 1000}),
+        _field("new_metastasis", "New metastasis", "checkbox"),
+        _field("next_visit", "Next visit", "date"),
+        _field("comments", "Comments", "textarea"),
+    ]},
+}
+TEMPLATE_NAMES = {
+    "registration": "Patient registration",
+    "diagnosis": "Tumour diagnosis",
+    "treatment": "Treatment cycle",
+    "follow_up": "Follow-up visit",
+}
+
+
+def _text(rng: random.Random, min_words: int, max_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + "."
+
+
+def _day(rng: random.Random, start: date, days: int) -> str:
+    return (start + timedelta(days=rng.randrange(days))).isoformat()
+
+
+def _registration_payload(rng, mrn, sequence):
+    return {
+        "mrn": mrn,
+        "date_of_birth": _day(rng, date(1935, 1, 1), 60 * 365),
+        "sex": rng.choice(["Female", "Male", "Female", "Male", "Other"]),
+        "enrollment_date": _day(rng, date(2022, 1, 1), HISTORY_DAYS),
+        "ecog_status": rng.choice(["0", "0", "1", "1", "2", "3"]),
+        "smoking_status": rng.choice(["Never", "Former", "Current"]),
+        "consent_signed": True,
+        "notes": _text(rng, 3, 25),
+    }
+
+
+def _diagnosis_payload(rng, mrn, sequence):
+    site = rng.choice(SITES)
+    return {
+        "mrn": mrn,
+        "diagnosis_date": _day(rng, date(2020, 1, 1), 5 * 365),
+        "primary_site": site,
+        "icd10_code": f"{ICD10[site]}.{rng.randrange(10)}",
+        "histology": rng.choice(["Adenocarcinoma", "Invasive ductal carcinoma", "Squamous cell carcinoma",
+                                 "Small cell carcinoma", "Melanoma"]),
+        "t_stage": rng.choice(["T1", "T2", "T2", "T3", "T4", "TX"]),
+        "n_stage": rng.choice(["N0", "N0", "N1", "N2", "N3", "NX"]),
+        "m_stage": rng.choice(["M0", "M0", "M0", "M1", "MX"]),
+        "tumour_size_mm": round(rng.lognormvariate(3.0, 0.6), 1),
+        "grade": rng.choice(["1", "2", "3"]),
+        "er_positive": rng.random() < 0.7,
+        "pr_positive": rng.random() < 0.6,
+        "her2_positive": rng.random() < 0.2,
+        "pathology_report": _text(rng, 40, 120),
+    }
+
+
+def _treatment_payload(rng, mrn, sequence):
+    return {
+        "mrn": mrn,
+        "cycle_number": sequence % 40 + 1,
+        "start_date": _day(rng, date(2022, 1, 1), HISTORY_DAYS),
+        "regimen": rng.choice(REGIMENS),
+        "dose_mg_m2": rng.choice([75, 85, 100, 175, 600, 1000, 1250]),
+        "weight_kg": round(rng.gauss(72, 14), 1),
+        "dose_reduced": rng.random() < 0.15,
+        "ctcae_grade": rng.choice(["0", "1", "1", "2", "2", "3", "4"]),
+        "adverse_events": _text(rng, 5, 40),
+    }
+
+
+def _follow_up_payload(rng, mrn, sequence):
+    return {
+        "mrn": mrn,
+        "visit_date": _day(rng, date(2022, 1, 1), HISTORY_DAYS),
+        "disease_status": rng.choice(["No evidence of disease", "Stable", "Stable", "Partial response",
+                                      "Progression"]),
+        "ecog_status": rng.choice(["0", "1", "1", "2"]),
+        "weight_kg": round(rng.gauss(71, 14), 1),
+        "cea_ng_ml": round(rng.lognormvariate(1.0, 0.9), 2),
+        "new_metastasis": rng.random() < 0.08,
+        "next_visit": _day(rng, date(2025, 1, 1), 365),
+        "comments": _text(rng, 10, 60),
+    }
+
+
+PAYLOADS = {
+    "registration": _registration_payload,
+    "diagnosis": _diagnosis_payload,
+    "treatment": _treatment_payload,
+    "follow_up": _follow_up_payload,
+}
+
+
+def hospital_code(index: int) -> str:
+    letters = string.ascii_uppercase
+    return letters[index // 26 % 26] + letters[index % 26]
+
+
+def make_payload(template: str, rng: random.Random, code: str, sequence: int) -> dict:
+    """A valid payload for a form built from ``template``.
+
+    Each form numbers its submissions; ``sequence`` goes into the record
+    number, so every payload's unique key is distinct within its form.
+    """
+    return PAYLOADS[template](rng, f"{code}{sequence:07d}", sequence)
+
+
+def manifest_path(database: str) -> str:
+    return database + MANIFEST_SUFFIX
+
+
+def load_manifest(database: str):
+    """The manifest written with ``database``, or None."""
+    try:
+        with open(manifest_path(database)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def build_dataset(database: str, hospitals: int, users: int, studies: int, forms: int, forms_per_study: int,
+                  submissions: int, seed: int = 0, batch_size: int = 5000) -> dict:
+    """Create ``database`` (a new SQLite file) with the dataset; returns its manifest."""
+    if os.path.exists(database):
+        raise FileExistsError(f"{database} already exists; remove it or choose another path")
+    if forms_per_study > forms:
+        raise ValueError("--forms-per-study cannot exceed --forms")
+    spec = {
+        "hospitals": hospitals, "users": users, "studies": studies, "forms": forms,
+        "forms_per_study": forms_per_study, "submissions": submissions, "seed": seed,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+    url = f"sqlite:///{os.path.abspath(database)}"
+    started = time.perf_counter()
+    upgrade(url)
+
+    rng = random.Random(seed)
+    engine = create_engine(url)
+    tables = MetaData()
+    tables.reflect(engine)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    password_hash = get_password_hash(PASSWORD)
+
+    with engine.begin() as conn:
+        conn.execute(tables.tables["hospitals"].insert(), [
+            {"id": index + 1, "name": f"Hospital {hospital_code(index)}",
+             "address": f"{rng.randint(1, 999)} Research Avenue", "contact_info": f"+1 555 {index:04d}",
+             "created_at": now}
+            for index in range(hospitals)
+        ])
+        # A few large centres enter most of the data.
+        hospital_weights = [1 / (index + 1) for index in range(hospitals)]
+
+        conn.execute(tables.tables["users"].insert(), {
+            "id": 1, "email": ADMIN_EMAIL, "password_hash": password_hash, "full_name": "Benchmark Admin",
+            "role": "admin", "hospital_id": None, "is_active": True, "created_at": now,
+        })
+        user_hospitals = [rng.choices(range(hospitals), hospital_weights)[0] for _ in range(users)]
+        conn.execute(tables.tables["users"].insert(), [
+            {"id": index + 2, "email": f"user{index}@{hospital_code(hospital).lower()}.example.org",
+             "password_hash": password_hash, "full_name": f"Research Nurse {index}", "role": "user",
+             "hospital_id": hospital + 1, "is_active": True, "created_at": now}
+            for index, hospital in enumerate(user_hospitals)
+        ])
+        users_by_hospital = {}
+        for index, hospital in enumerate(user_hospitals):
+            users_by_hospital.setdefault(hospital, []).append(index + 2)
+        active_hospitals = sorted(users_by_hospital)
+
+        form_rows = []
+        for index in range(forms):
+            template = list(TEMPLATES)[index % len(TEMPLATES)]
+            schema = TEMPLATES[template]
+            validate_schema_definition(schema)
+            name = TEMPLATE_NAMES[template] + (f" ({index // len(TEMPLATES) + 1})" if index >= len(TEMPLATES) else "")
+            form_rows.append({"id": index + 1, "template": template, "name": name, "schema": schema})
+        conn.execute(tables.tables["forms"].insert(), [
+            {"id": form["id"], "name": form["name"], "description": f"Synthetic {form['template']} form",
+             "schema_json": form["schema"], "schema_version": 1, "schema_hash": schema_hash(form["schema"]),
+             "created_by": 1, "created_at": now}
+            for form in form_rows
+        ])
+        conn.execute(tables.tables["form_versions"].insert(), [
+            {"form_id": form["id"], "version": 1, "schema_json": form["schema"],
+             "schema_hash": schema_hash(form["schema"]), "created_by": 1, "created_at": now}
+            for form in form_rows
+        ])
+
+        study_rows = []
+        for index in range(studies):
+            form_ids = [(index + offset) % forms + 1 for offset in range(forms_per_study)]
+            study_rows.append({"id": index + 1, "form_ids": form_ids})
+        conn.execute(tables.tables["studies"].insert(), [
+            {"id": study["id"], "name": f"Study {study['id']:03d}", "title": f"Synthetic oncology study {study['id']}",
+             "description": _text(rng, 10, 30), "status": "Data Collection", "created_by": 1, "is_active": True,
+             "is_archived": False, "created_at": now}
+            for study in study_rows
+        ])
+        conn.execute(tables.tables["study_forms"].insert(), [
+            {"study_id": study["id"], "form_id": form_id} for study in study_rows for form_id in study["form_ids"]
+        ])
+
+    submissions_table = tables.tables["submissions"]
+    unique_keys_table = tables.tables["submission_unique_keys"]
+    unique_fields = {
+        form["id"]: [field for field in form["schema"]["fields"] if field.get("unique_key")] for form in form_rows
+    }
+    templates = {form["id"]: form["template"] for form in form_rows}
+    sequences = Counter()
+    per_user = Counter()
+    per_study = Counter()
+    history_start = now - timedelta(days=HISTORY_DAYS)
+    step = timedelta(days=HISTORY_DAYS) / max(submissions, 1)
+    hospital_weights = [1 / (position + 1) for position in range(len(active_hospitals))]
+
+    for batch_start in range(0, submissions, batch_size):
+        submission_rows = []
+        key_rows = []
+        for submission_id in range(batch_start + 1, min(batch_start + batch_size, submissions) + 1):
+            hospital = rng.choices(active_hospitals, hospital_weights)[0]
+            user_id = rng.choice(users_by_hospital[hospital])
+            study = rng.choice(study_rows)
+            form_id = rng.choice(study["form_ids"])
+            sequence = sequences[form_id]
+            sequences[form_id] += 1
+            data = make_payload(templates[form_id], rng, hospital_code(hospital), sequence)
+            encoded = encode_payload(data)
+            created_at = history_start + step * submission_id
+            submission_rows.append({
+                "id": submission_id, "form_id": form_id, "study_id": study["id"], "user_id": user_id,
+                "data_json": encoded.data_json, "data_format": encoded.data_format,
+                "data_key_id": encoded.data_key_id, "schema_version": 1, "created_at": created_at,
+                "updated_at": None,
+            })
+            for entry in build_unique_key_entries(unique_fields[form_id], data):
+                key_rows.append({"submission_id": submission_id, "form_id": form_id,
+                                 "key_name": entry["key_name"], "key_value": entry["key_value"],
+                                 "created_at": created_at})
+            per_user[user_id] += 1
+            per_study[study["id"]] += 1
+        with engine.begin() as conn:
+            conn.execute(submissions_table.insert(), submission_rows)
+            conn.execute(unique_keys_table.insert(), key_rows)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    engine.dispose()
+
+    sampled_users = sorted(rng.sample(range(2, users + 2), min(SAMPLED_USERS, users)))
+    manifest = {
+        "spec": spec,
+        "database": os.path.abspath(database),
+        "built_at": now.isoformat(),
+        "build_seconds": round(time.perf_counter() - started, 1),
+        "storage": {"format": encode_payload({}).data_format},
+        "password": PASSWORD,
+        "admin_email": ADMIN_EMAIL,
+        "users": [
+            {"id": user_id, "email": f"user{user_id - 2}@{hospital_code(user_hospitals[user_id - 2]).lower()}.example.org",
+             "hospital_id": user_hospitals[user_id - 2] + 1, "submissions": per_user[user_id]}
+            for user_id in sampled_users
+        ],
+        "forms": [{"id": form["id"], "template": form["template"], "submissions": sequences[form["id"]]}
+                  for form in form_rows],
+        "studies": [{"id": study["id"], "form_ids": study["form_ids"], "submissions": per_study[study["id"]]}
+                    for study in study_rows],
+    }
+    with open(manifest_path(database), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--hospitals", type=int, default=12)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--studies", type=int, default=20)
+    parser.add_argument("--forms", type=int, default=8)
+    parser.add_argument("--forms-per-study", type=int, default=3)
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def dataset_spec(args) -> dict:
+    return {
+        "hospitals": args.hospitals, "users": args.users, "studies": args.studies, "forms": args.forms,
+        "forms_per_study": args.forms_per_study, "submissions": args.submissions, "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", required=True, help="SQLite file to create")
+    add_dataset_arguments(parser)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    manifest = build_dataset(args.database, batch_size=args.batch_size, **dataset_spec(args))
+    print(json.dumps({"database": manifest["database"], "build_seconds": manifest["build_seconds"],
+                      **manifest["spec"]}))
+
+
+if __name__ == "__main__":
+    main()
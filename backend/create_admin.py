@@ -6,13 +6,14 @@ import os
 # Add the app directory to the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app.database import SessionLocal, engine, Base
+from app.database import SessionLocal
+from app.migrations import upgrade
 from app.models import User
 from app.auth import get_password_hash
 from app.config import settings
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Create or upgrade the schema
+upgrade()
 
 # Default credentials - for local development only
 DEV_ADMIN_EMAIL = "ctic_generic@example.com"
@@ -0,0 +1,84 @@
+"""Shared fixtures: the app on a temporary SQLite database, an admin, and helpers to create data.
+
+app.config reads the environment when it is first imported and app.database
+binds its engine then, so the environment is set here before any app import.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+_data_dir = tempfile.mkdtemp(prefix="research-api-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_data_dir}/test.db"
+os.environ.setdefault("SLOW_QUERY_LOG_FILE", os.path.join(_data_dir, "slow_queries.log"))
+os.environ.setdefault("PROFILING_DIR", os.path.join(_data_dir, "profiles"))
+os.environ.setdefault("TRACING_ENABLED", "true")  # installs the middleware; the header stays opt-in
+os.environ.setdefault("PROFILING_ENABLED", "true")
+os.environ.setdefault("METRICS_ENABLED", "true")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+ORIGIN = "http://localhost:3000"
+ADMIN_EMAIL = "admin@example.org"
+ADMIN_PASSWORD = "admin-password"
+
+SCHEMA = {"fields": [
+    {"name": "mrn", "label": "MRN", "type": "text", "required": True, "unique_key": True,
+     "validation": {"pattern": r"^[A-Z]\d+$"}},
+    {"name": "age", "label": "Age", "type": "number", "validation": {"min": 0, "max": 120}},
+    {"name": "sex", "label": "Sex", "type": "select", "options": ["M", "F"]},
+]}
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app, headers={"Origin": ORIGIN}) as test_client:
+        response = test_client.post(
+            "/api/auth/register", json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD, "full_name": "Admin"}
+        )
+        assert response.status_code == 200, response.text
+        yield test_client
+
+
+def login(client, email: str, password: str) -> dict:
+    response = client.post("/api/auth/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    client.cookies.clear()  # tests authenticate with explicit headers only
+    return response.json()
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    return {"Authorization": f"Bearer {login(client, ADMIN_EMAIL, ADMIN_PASSWORD)['access_token']}"}
+
+
+def unique_name(prefix: str) -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture
+def form_in_study(client, admin_headers):
+    """A new form with ``SCHEMA`` assigned to a new study; returns (form_id, study_id)."""
+    form = client.post("/api/forms", json={"name": unique_name("form"), "schema_json": SCHEMA}, headers=admin_headers)
+    assert form.status_code == 200, form.text
+    study = client.post("/api/studies", json={"name": unique_name("study")}, headers=admin_headers)
+    assert study.status_code == 200, study.text
+    form_id, study_id = form.json()["id"], study.json()["id"]
+    assigned = client.post(f"/api/studies/{study_id}/forms/{form_id}", headers=admin_headers)
+    assert assigned.status_code == 200, assigned.text
+    return form_id, study_id
+
+
+@pytest.fixture
+def user_credentials(client, admin_headers):
+    """A new regular user; returns (email, password, user id)."""
+    email, password = f"{unique_name('user')}@example.org", "user-password"
+    response = client.post(
+        "/api/users", json={"email": email, "password": password, "full_name": "User"}, headers=admin_headers
+    )
+    assert response.status_code == 200, response.text
+    return email, password, response.json()["id"]
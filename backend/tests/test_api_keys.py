@@ -0,0 +1,84 @@
+import pytest
+
+from tests.conftest import unique_name
+
+
+def create_key(client, admin_headers, scopes, study_id=None):
+    response = client.post(
+        "/api/admin/api-keys", json={"name": "etl", "scopes": scopes, "study_id": study_id}, headers=admin_headers
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def key_headers(key):
+    return {"X-API-Key": key["key"]}
+
+
+def test_read_scope_allows_reads_only(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+    headers = key_headers(create_key(client, admin_headers, ["read"]))
+
+    assert client.get(f"/api/studies/{study_id}", headers=headers).status_code == 200
+    submitted = client.post(
+        "/api/submissions", json={"form_id": form_id, "study_id": study_id, "data_json": {"mrn": "R1"}},
+        headers=headers,
+    )
+    assert submitted.status_code == 403
+    assert submitted.json()["detail"] == "API key does not allow this operation"
+    assert client.post("/api/export/csv", json={"study_id": study_id}, headers=headers).status_code == 403
+
+
+def test_submit_and_export_scopes(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+    headers = key_headers(create_key(client, admin_headers, ["submit", "export"]))
+
+    submitted = client.post(
+        "/api/submissions", json={"form_id": form_id, "study_id": study_id, "data_json": {"mrn": "S1"}},
+        headers=headers,
+    )
+    assert submitted.status_code == 200, submitted.text
+    assert client.post("/api/export/csv", json={"study_id": study_id}, headers=headers).status_code == 200
+    assert client.get(f"/api/studies/{study_id}", headers=headers).status_code == 403
+
+
+@pytest.mark.parametrize("method, path", [
+    ("GET", "/api/admin/api-keys"),
+    ("POST", "/api/admin/api-keys"),
+    ("GET", "/api/users"),
+])
+def test_keys_never_reach_management_endpoints(client, admin_headers, method, path):
+    headers = key_headers(create_key(client, admin_headers, ["read", "submit", "export"]))
+    response = client.request(method, path, headers=headers, json={"name": "x", "scopes": ["read"]})
+    assert response.status_code == 403
+
+
+def test_study_limited_key(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+    other = client.post("/api/studies", json={"name": unique_name("study")}, headers=admin_headers).json()["id"]
+    headers = key_headers(create_key(client, admin_headers, ["read", "submit"], study_id=study_id))
+
+    assert client.get(f"/api/studies/{study_id}", headers=headers).status_code == 200
+    assert client.get(f"/api/studies/{other}", headers=headers).status_code == 403
+    assert client.get("/api/forms", headers=headers).status_code == 403
+    wrong_study = client.post(
+        "/api/submissions", json={"form_id": form_id, "study_id": other, "data_json": {"mrn": "W1"}},
+        headers=headers,
+    )
+    assert wrong_study.status_code == 403
+
+
+def test_revoked_and_unknown_keys_are_rejected(client, admin_headers, form_in_study):
+    _, study_id = form_in_study
+    key = create_key(client, admin_headers, ["read"])
+    assert client.get(f"/api/studies/{study_id}", headers=key_headers(key)).status_code == 200
+
+    assert client.delete(f"/api/admin/api-keys/{key['id']}", headers=admin_headers).status_code == 200
+    assert client.get(f"/api/studies/{study_id}", headers=key_headers(key)).status_code == 401
+    unknown = {"Authorization": f"Bearer {key['key'][:-4]}abcd"}
+    assert client.get(f"/api/studies/{study_id}", headers=unknown).status_code == 401
+
+
+def test_invalid_scopes_are_refused(client, admin_headers):
+    response = client.post("/api/admin/api-keys", json={"name": "etl", "scopes": ["admin"]}, headers=admin_headers)
+    assert response.status_code == 400
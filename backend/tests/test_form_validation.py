@@ -0,0 +1,106 @@
+import pytest
+
+from app.form_validation import CompiledFormSchema, FormSchemaError, compile_js_pattern, validate_schema_definition
+
+from tests.conftest import SCHEMA
+
+
+def compiled(*fields):
+    return CompiledFormSchema({"fields": list(fields)})
+
+
+def test_valid_payload_has_no_errors():
+    assert CompiledFormSchema(SCHEMA).validate({"mrn": "A1", "age": 40, "sex": "M"}) == []
+
+
+def test_required_fields():
+    schema = compiled(
+        {"name": "mrn", "label": "MRN", "type": "text", "required": True},
+        {"name": "consent", "label": "Consent", "type": "checkbox", "required": True},
+    )
+    assert schema.validate({"mrn": "  ", "consent": False}) == ["MRN is required", "Consent is required"]
+    assert schema.validate({"mrn": "A1", "consent": True}) == []
+
+
+def test_optional_empty_values_are_not_checked():
+    schema = compiled(
+        {"name": "age", "label": "Age", "type": "number", "validation": {"min": 0}},
+        {"name": "code", "label": "Code", "type": "text", "validation": {"pattern": "^C$"}},
+    )
+    assert schema.validate({}) == []
+    assert schema.validate({"age": "", "code": "   "}) == []
+
+
+def test_whitespace_only_required_text_is_rejected_by_the_api(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+    response = client.post(
+        "/api/submissions", json={"form_id": form_id, "study_id": study_id, "data_json": {"mrn": " \t "}},
+        headers=admin_headers,
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid submission data: MRN is required"
+
+
+def test_number_bounds_and_type():
+    schema = compiled({"name": "age", "label": "Age", "type": "number", "validation": {"min": 0, "max": 120}})
+    assert schema.validate({"age": "41"}) == []
+    assert schema.validate({"age": "forty"}) == ["Age must be a number"]
+    assert schema.validate({"age": True}) == ["Age must be a number"]
+    assert schema.validate({"age": -1}) == ["Age must be at least 0"]
+    assert schema.validate({"age": 121}) == ["Age must be at most 120"]
+
+
+def test_pattern_applies_to_text_fields_only():
+    schema = compiled(
+        {"name": "mrn", "label": "MRN", "type": "text", "validation": {"pattern": r"^[A-Z]\d+$"}},
+        {"name": "notes", "label": "Notes", "type": "textarea", "validation": {"pattern": r"^[A-Z]\d+$"}},
+    )
+    assert schema.validate({"mrn": "a1", "notes": "free text"}) == ["MRN format is invalid"]
+
+
+def test_options_dates_and_checkboxes():
+    schema = compiled(
+        {"name": "sex", "label": "Sex", "type": "select", "options": ["M", "F"]},
+        {"name": "dob", "label": "Date of birth", "type": "date"},
+        {"name": "smoker", "label": "Smoker", "type": "checkbox"},
+    )
+    assert schema.validate({"sex": "F", "dob": "1970-01-31T00:00:00.000Z", "smoker": False}) == []
+    assert schema.validate({"sex": "X", "dob": "31/01/1970", "smoker": "yes"}) == [
+        "Sex must be one of: M, F",
+        "Date of birth is not a valid date",
+        "Smoker must be true or false",
+    ]
+
+
+def test_javascript_named_groups_are_translated():
+    assert compile_js_pattern(r"^(?<site>[A-Z]{2})-\k<site>$").search("AB-AB")
+    assert compile_js_pattern(r"(?<=a)b").search("ab")
+    schema = compiled(
+        {"name": "code", "label": "Code", "type": "text", "validation": {"pattern": r"^(?<prefix>C)\d{2}$"}}
+    )
+    assert schema.validate({"code": "C50"}) == []
+
+
+def test_invalid_pattern_is_rejected_when_the_schema_is_saved():
+    with pytest.raises(FormSchemaError):
+        validate_schema_definition(
+            {"fields": [{"name": "mrn", "label": "MRN", "type": "text", "validation": {"pattern": "(unclosed"}}]}
+        )
+
+
+def test_validate_many_reports_failures_by_position():
+    schema = CompiledFormSchema(SCHEMA)
+    assert schema.validate_many([{"mrn": "A1"}, {"mrn": "bad"}, "not an object"]) == {
+        1: ["MRN format is invalid"],
+        2: ["Submission data must be an object"],
+    }
+
+
+def test_submission_api_rejects_invalid_payloads(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+    response = client.post(
+        "/api/submissions", json={"form_id": form_id, "study_id": study_id, "data_json": {"mrn": "A1", "age": 500}},
+        headers=admin_headers,
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid submission data: Age must be at most 120"
@@ -0,0 +1,103 @@
+import csv
+import io
+
+from app.database import SessionLocal
+from app.form_validation import schema_hash
+from app.models import Form, FormVersion
+
+from tests.conftest import SCHEMA
+
+
+def changed_schema():
+    fields = [dict(field) for field in SCHEMA["fields"]]
+    fields[1]["validation"] = {"min": 0, "max": 110}
+    return {"fields": fields}
+
+
+def test_get_form_etag_and_not_modified(client, admin_headers, form_in_study):
+    form_id, _ = form_in_study
+    first = client.get(f"/api/forms/{form_id}", headers=admin_headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag == f'"1-{first.json()["schema_hash"]}"'
+
+    cached = client.get(f"/api/forms/{form_id}", headers={**admin_headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+
+
+def test_schema_change_creates_a_version_and_a_new_etag(client, admin_headers, form_in_study):
+    form_id, _ = form_in_study
+    etag = client.get(f"/api/forms/{form_id}", headers=admin_headers).headers["ETag"]
+
+    unchanged = client.put(f"/api/forms/{form_id}", json={"schema_json": SCHEMA}, headers=admin_headers)
+    assert unchanged.json()["schema_version"] == 1
+
+    updated = client.put(f"/api/forms/{form_id}", json={"schema_json": changed_schema()}, headers=admin_headers)
+    assert updated.status_code == 200, updated.text
+    assert updated.json()["schema_version"] == 2
+
+    stale = client.get(f"/api/forms/{form_id}", headers={**admin_headers, "If-None-Match": etag})
+    assert stale.status_code == 200
+    assert stale.headers["ETag"] != etag
+    versions = client.get(f"/api/forms/{form_id}/versions", headers=admin_headers).json()
+    assert [version["version"] for version in versions] == [1, 2]
+
+
+def test_conflicting_version_answers_409(client, admin_headers, form_in_study):
+    form_id, _ = form_in_study
+    # Another writer already recorded version 2 of this form.
+    db = SessionLocal()
+    try:
+        db.add(FormVersion(form_id=form_id, version=2, schema_json=SCHEMA, schema_hash="other"))
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.put(f"/api/forms/{form_id}", json={"schema_json": changed_schema()}, headers=admin_headers)
+    assert response.status_code == 409
+    assert client.get(f"/api/forms/{form_id}", headers=admin_headers).json()["schema_version"] == 1
+
+
+def test_csv_export_keeps_data_column_position(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+    created = client.post(
+        "/api/submissions", json={"form_id": form_id, "study_id": study_id, "data_json": {"mrn": "C1", "age": 3}},
+        headers=admin_headers,
+    )
+    assert created.status_code == 200, created.text
+
+    response = client.post("/api/export/csv", json={"study_id": study_id}, headers=admin_headers)
+    assert response.status_code == 200
+    header, row = list(csv.reader(io.StringIO(response.text)))[:2]
+    assert header[8:] == ["Data (JSON)", "Schema Version"]
+    assert '"mrn": "C1"' in row[8]
+    assert row[9] == "1"
+
+
+def test_schema_changed_by_another_process_is_not_served_from_cache(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+
+    def submit(mrn, age):
+        return client.post(
+            "/api/submissions", json={"form_id": form_id, "study_id": study_id, "data_json": {"mrn": mrn, "age": age}},
+            headers=admin_headers,
+        )
+
+    assert submit("X1", 100).status_code == 200  # compiles and caches the schema
+    # Another worker (or a new form reusing this id) stores a different schema under the same version.
+    new_schema = changed_schema()
+    new_schema["fields"][1]["validation"] = {"min": 0, "max": 50}
+    db = SessionLocal()
+    try:
+        db.query(Form).filter(Form.id == form_id).update(
+            {"schema_json": new_schema, "schema_hash": schema_hash(new_schema)}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    rejected = submit("X2", 100)
+    assert rejected.status_code == 400
+    assert rejected.json()["detail"] == "Invalid submission data: Age must be at most 50"
@@ -0,0 +1,65 @@
+import sys
+import threading
+
+import pytest
+
+from app.config import settings
+from app.middleware import http_middleware
+from app.profiling import SamplingProfiler
+
+from tests.conftest import login
+
+
+def test_server_timing_is_opt_in(client, admin_headers, monkeypatch):
+    assert "server-timing" not in client.get("/api/forms", headers=admin_headers).headers
+
+    monkeypatch.setattr(settings, "TRACE_SERVER_TIMING", True)
+    server_timing = client.get("/api/forms", headers=admin_headers).headers["server-timing"]
+    assert "handler;dur=" in server_timing and "db;dur=" in server_timing
+
+
+def test_profile_flag_of_an_admin_stores_a_profile(client, admin_headers):
+    response = client.get("/api/forms?_profile=1", headers=admin_headers)
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+    assert client.get(f"/api/admin/profiles/{profile_id}", headers=admin_headers).status_code == 200
+
+
+def test_profile_flag_is_ignored_for_other_users(client, user_credentials):
+    email, password, _ = user_credentials
+    headers = {"Authorization": f"Bearer {login(client, email, password)['access_token']}", "X-Profile": "1"}
+    response = client.get("/api/forms", headers=headers)
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+
+
+def test_profile_flag_without_credentials_skips_the_user_lookup(client, monkeypatch):
+    def fail(scope):
+        raise AssertionError("authorize_profiling called for an anonymous request")
+
+    monkeypatch.setattr(http_middleware, "authorize_profiling", fail)
+    response = client.get("/api/forms?_profile=1")
+    assert response.status_code == 401
+    assert "x-profile-id" not in response.headers
+
+
+def test_failed_profiler_start_releases_the_profiling_slot(client, admin_headers, monkeypatch):
+    switch_interval = sys.getswitchinterval()
+
+    class UnstartableThread(threading.Thread):
+        def start(self):
+            raise RuntimeError("can't start new thread")
+
+    class FailingProfiler(SamplingProfiler):
+        def __init__(self, *args):
+            super().__init__(*args)
+            self._thread = UnstartableThread(target=self._run, daemon=True)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(http_middleware, "SamplingProfiler", FailingProfiler)
+        with pytest.raises(RuntimeError):
+            client.get("/api/forms?_profile=1", headers=admin_headers)
+    assert sys.getswitchinterval() == switch_interval
+
+    response = client.get("/api/forms?_profile=1", headers=admin_headers)
+    assert "x-profile-id" in response.headers
@@ -0,0 +1,20 @@
+from app.config import Settings
+
+from tests.conftest import login
+
+
+def test_metrics_are_opt_in_and_admin_only_by_default():
+    assert Settings.model_fields["METRICS_ENABLED"].default is False
+    assert Settings.model_fields["METRICS_ALLOWED_NETWORKS"].default == ""
+
+
+def test_metrics_require_an_admin(client, admin_headers, user_credentials):
+    assert client.get("/metrics").status_code == 401
+
+    email, password, _ = user_credentials
+    token = login(client, email, password)["access_token"]
+    assert client.get("/metrics", headers={"Authorization": f"Bearer {token}"}).status_code == 403
+
+    response = client.get("/metrics", headers=admin_headers)
+    assert response.status_code == 200
+    assert "http_requests_total" in response.text
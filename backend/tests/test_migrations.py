@@ -0,0 +1,108 @@
+import json
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.form_validation import schema_hash
+from app.models import Base
+from app.migrations import current_version, ensure_schema_current, head_version, upgrade
+
+LEGACY_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, email VARCHAR NOT NULL UNIQUE, password_hash VARCHAR NOT NULL,
+    full_name VARCHAR NOT NULL, role VARCHAR, hospital_id INTEGER, is_active BOOLEAN, created_at DATETIME
+);
+CREATE TABLE studies (
+    id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, description TEXT, created_by INTEGER NOT NULL,
+    is_active BOOLEAN, created_at DATETIME, data_submission_deadline DATE
+);
+CREATE TABLE forms (
+    id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, description TEXT, schema_json JSON NOT NULL,
+    created_by INTEGER NOT NULL, created_at DATETIME
+);
+CREATE TABLE study_forms (study_id INTEGER NOT NULL, form_id INTEGER NOT NULL, PRIMARY KEY (study_id, form_id));
+CREATE TABLE submissions (
+    id INTEGER PRIMARY KEY, form_id INTEGER NOT NULL, study_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+    data_json TEXT NOT NULL, created_at DATETIME, updated_at DATETIME
+);
+"""
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'migrations.db'}"
+
+
+@pytest.fixture
+def engine(database_url):
+    target = create_engine(database_url)
+    yield target
+    target.dispose()
+
+
+def test_new_database_matches_the_models(database_url, engine):
+    assert upgrade(database_url) == head_version()
+    assert current_version(engine) == head_version()
+    ensure_schema_current(engine)
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        assert set(table.columns.keys()) <= columns, table.name
+
+
+def test_upgrade_from_the_baseline_keeps_rows(database_url, engine):
+    assert upgrade(database_url, target_version=1) == 1
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO reencryption_jobs (status, last_submission_id, processed_count, reencrypted_count, failed_count) "
+            "VALUES ('completed', 7, 7, 7, 0)"
+        ))
+
+    assert upgrade(database_url) == head_version()
+    with engine.connect() as conn:
+        job = conn.execute(text("SELECT status, processed_count, rows_per_second FROM reencryption_jobs")).one()
+        assert tuple(job) == ("completed", 7, None)
+        assert conn.execute(text("SELECT COUNT(*) FROM backfill_runs")).scalar() == 0
+    # Re-running is a no-op.
+    assert upgrade(database_url) == head_version()
+
+
+def test_upgrade_from_a_pre_versioning_database(database_url, engine, tmp_path):
+    schema = {"fields": [
+        {"name": "notes", "label": "Notes", "type": "text"},
+        {"name": "patient_mrn", "label": "MRN", "type": "text"},
+    ]}
+    connection = sqlite3.connect(tmp_path / "migrations.db")
+    connection.executescript(LEGACY_SCHEMA)
+    connection.execute("INSERT INTO users VALUES (1, 'a@example.org', 'x', 'A', 'admin', NULL, 1, '2024-01-01')")
+    connection.execute("INSERT INTO studies VALUES (1, 'Study', NULL, 1, 1, '2024-01-01', NULL)")
+    connection.execute("INSERT INTO forms VALUES (1, 'Form', NULL, ?, 1, '2024-01-01')", (json.dumps(schema),))
+    connection.execute("INSERT INTO study_forms VALUES (1, 1)")
+    for submission_id, mrn in ((1, "A1"), (2, "A2")):
+        connection.execute(
+            "INSERT INTO submissions VALUES (?, 1, 1, 1, ?, '2024-01-02', NULL)",
+            (submission_id, json.dumps({"notes": "same", "patient_mrn": mrn})),
+        )
+    connection.commit()
+    connection.close()
+
+    assert upgrade(database_url) == head_version()
+    with engine.connect() as conn:
+        assert tuple(conn.execute(text("SELECT status, is_archived FROM studies")).one()) == ("Data Collection", 0)
+        if sqlite3.sqlite_version_info >= (3, 35):
+            assert "data_submission_deadline" not in {c["name"] for c in inspect(conn).get_columns("studies")}
+
+        # The old picker prefers the field without duplicates and with an id-like name.
+        raw_schema, stored_hash = conn.execute(text("SELECT schema_json, schema_hash FROM forms")).one()
+        stored = json.loads(raw_schema)
+        assert [field.get("unique_key", False) for field in stored["fields"]] == [False, True]
+        # The baseline's frozen copy still hashes like the app does.
+        assert stored_hash == schema_hash(stored)
+        assert conn.execute(text("SELECT version FROM form_versions WHERE form_id = 1")).scalar() == 1
+
+        # Submissions have no key rows yet, so the form is re-indexed in the background.
+        assert conn.execute(text("SELECT status FROM unique_key_reindex_jobs WHERE form_id = 1")).scalar() == "pending"
+        rows = conn.execute(text("SELECT schema_version, updated_at FROM submissions ORDER BY id")).all()
+        assert [tuple(row) for row in rows] == [(None, "2024-01-02"), (None, "2024-01-02")]
@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+
+REFRESH_THREADS = 8
+
+
+def refresh(client, refresh_token):
+    """POST /api/auth/refresh with only this refresh cookie; returns (status, new refresh token)."""
+    client.cookies.clear()
+    client.cookies.set(settings.REFRESH_COOKIE_NAME, refresh_token)
+    response = client.post("/api/auth/refresh")
+    client.cookies.clear()
+    return response.status_code, response.cookies.get(settings.REFRESH_COOKIE_NAME)
+
+
+def start_session(client, user_credentials):
+    email, password, _ = user_credentials
+    client.cookies.clear()
+    response = client.post("/api/auth/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    client.cookies.clear()
+    return response.cookies[settings.REFRESH_COOKIE_NAME]
+
+
+def test_refresh_rotates_the_token(client, user_credentials):
+    first = start_session(client, user_credentials)
+    status_code, second = refresh(client, first)
+    assert status_code == 200 and second and second != first
+    status_code, third = refresh(client, second)
+    assert status_code == 200 and third not in (first, second)
+
+
+def test_reusing_a_rotated_token_revokes_the_session(client, user_credentials, monkeypatch):
+    monkeypatch.setattr(settings, "REFRESH_TOKEN_REUSE_GRACE_SECONDS", -1)
+    first = start_session(client, user_credentials)
+    _, second = refresh(client, first)
+
+    assert refresh(client, first) == (401, None)
+    # The whole family is revoked, including the token the reuse raced against.
+    assert refresh(client, second)[0] == 401
+
+
+def test_parallel_refresh_within_the_grace_period_is_tolerated(client, user_credentials):
+    first = start_session(client, user_credentials)
+    _, second = refresh(client, first)
+    status_code, sibling = refresh(client, first)
+    assert status_code == 200 and sibling != second
+    assert refresh(client, second)[0] == 200
+
+
+def test_logout_revokes_the_refresh_token(client, user_credentials):
+    token = start_session(client, user_credentials)
+    client.cookies.set(settings.REFRESH_COOKIE_NAME, token)
+    assert client.post("/api/auth/logout").status_code == 200
+    client.cookies.clear()
+    assert refresh(client, token)[0] == 401
+
+
+def test_access_token_from_refresh_authenticates(client, user_credentials):
+    user_id = user_credentials[2]
+    token = start_session(client, user_credentials)
+    client.cookies.set(settings.REFRESH_COOKIE_NAME, token)
+    response = client.post("/api/auth/refresh")
+    client.cookies.clear()
+    me = client.get("/api/auth/me", headers={"Authorization": f"Bearer {response.json()['access_token']}"})
+    assert me.json()["id"] == user_id
+
+
+def test_concurrent_refreshes_of_one_token_take_the_grace_path(client, user_credentials):
+    token = start_session(client, user_credentials)
+    barrier = threading.Barrier(REFRESH_THREADS)
+
+    def refresh_once(_):
+        barrier.wait()
+        return client.post("/api/auth/refresh", cookies={settings.REFRESH_COOKIE_NAME: token}).status_code
+
+    with ThreadPoolExecutor(REFRESH_THREADS) as pool:
+        statuses = list(pool.map(refresh_once, range(REFRESH_THREADS)))
+    client.cookies.clear()
+    assert statuses == [200] * REFRESH_THREADS
@@ -0,0 +1,24 @@
+import json
+import time
+
+from app.config import Settings
+from app.slow_queries import SlowQueryLog
+
+
+def test_slow_query_log_is_opt_in():
+    assert Settings.model_fields["SLOW_QUERY_LOG_ENABLED"].default is False
+
+
+def test_log_file_is_created_by_the_first_slow_statement(tmp_path):
+    log_file = tmp_path / "logs" / "slow.log"
+    slow_log = SlowQueryLog(threshold_seconds=0.1, explain=False, log_file=str(log_file), max_bytes=1024, backups=1)
+    assert not log_file.parent.exists()
+
+    slow_log.record("primary", "SELECT * FROM forms WHERE id IN (?, ?)", (1, 2), False, 0.2, None)
+    deadline = time.monotonic() + 5
+    while not (log_file.exists() and log_file.read_text()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    entry = json.loads(log_file.read_text())
+    assert entry["parameters"] == ["int", "int"]
+    assert slow_log.top(1)[0]["statement"] == "SELECT * FROM forms WHERE id IN (...)"
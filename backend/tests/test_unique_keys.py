@@ -0,0 +1,94 @@
+import pytest
+
+from app import submission_storage
+from app.config import settings
+from app.database import SessionLocal
+from app.models import SubmissionUniqueKey, UniqueKeyReindexJob
+from app.unique_keys import queue_stale_unique_key_reindex, run_reindex_job
+
+
+@pytest.fixture
+def encryption_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "SUBMISSION_ENCRYPTION_ENABLED", True)
+    monkeypatch.setattr(settings, "BLIND_INDEX_KEY", "blind-index-test-key")
+    monkeypatch.setattr(submission_storage, "_blind_index_key", None)
+    monkeypatch.setattr(submission_storage, "_blind_index_prefix", None)
+
+
+def submit(client, headers, form_id, study_id, mrn):
+    return client.post(
+        "/api/submissions", json={"form_id": form_id, "study_id": study_id, "data_json": {"mrn": mrn}},
+        headers=headers,
+    )
+
+
+def stored_keys(form_id):
+    db = SessionLocal()
+    try:
+        return [row.key_value for row in db.query(SubmissionUniqueKey).filter(SubmissionUniqueKey.form_id == form_id)]
+    finally:
+        db.close()
+
+
+def test_duplicates_are_rejected_without_encryption(client, admin_headers, form_in_study):
+    form_id, study_id = form_in_study
+    assert submit(client, admin_headers, form_id, study_id, "D1").status_code == 200
+
+    duplicate = submit(client, admin_headers, form_id, study_id, "D1")
+    assert duplicate.status_code == 400
+    assert duplicate.json()["detail"] == "Duplicate value for unique key 'MRN': 'D1'."
+    assert stored_keys(form_id) == ["D1"]
+
+
+def test_duplicates_are_rejected_with_encryption(client, admin_headers, form_in_study, encryption_enabled):
+    form_id, study_id = form_in_study
+    assert submit(client, admin_headers, form_id, study_id, "E1").status_code == 200
+
+    duplicate = submit(client, admin_headers, form_id, study_id, "E1")
+    assert duplicate.status_code == 400
+    assert duplicate.json()["detail"] == "Duplicate value for unique key 'MRN': 'E1'."
+    [key] = stored_keys(form_id)
+    assert key.startswith(submission_storage.blind_index_prefix()) and "E1" not in key
+
+
+def test_enabling_encryption_reindexes_plain_keys(client, admin_headers, form_in_study, monkeypatch):
+    form_id, study_id = form_in_study
+    assert submit(client, admin_headers, form_id, study_id, "P1").status_code == 200
+
+    monkeypatch.setattr(settings, "SUBMISSION_ENCRYPTION_ENABLED", True)
+    monkeypatch.setattr(settings, "BLIND_INDEX_KEY", "blind-index-test-key")
+    monkeypatch.setattr(submission_storage, "_blind_index_key", None)
+    monkeypatch.setattr(submission_storage, "_blind_index_prefix", None)
+    # A submission saved after the switch, before the re-index, already has a blind index.
+    assert submit(client, admin_headers, form_id, study_id, "P2").status_code == 200
+
+    db = SessionLocal()
+    try:
+        assert form_id in queue_stale_unique_key_reindex(db)
+        assert form_id not in queue_stale_unique_key_reindex(db)
+        job_id = db.query(UniqueKeyReindexJob.id).filter(UniqueKeyReindexJob.form_id == form_id).scalar()
+    finally:
+        db.close()
+    assert run_reindex_job(job_id) == "completed"
+
+    keys = stored_keys(form_id)
+    assert len(keys) == 2 and all(key.startswith(submission_storage.blind_index_prefix()) for key in keys)
+    assert submit(client, admin_headers, form_id, study_id, "P1").status_code == 400
+    assert submit(client, admin_headers, form_id, study_id, "P2").status_code == 400
+
+
+def test_changing_the_blind_index_key_reindexes(client, admin_headers, form_in_study, encryption_enabled, monkeypatch):
+    form_id, study_id = form_in_study
+    assert submit(client, admin_headers, form_id, study_id, "K1").status_code == 200
+
+    monkeypatch.setattr(settings, "BLIND_INDEX_KEY", "rotated-blind-index-key")
+    monkeypatch.setattr(submission_storage, "_blind_index_key", None)
+    monkeypatch.setattr(submission_storage, "_blind_index_prefix", None)
+    db = SessionLocal()
+    try:
+        assert form_id in queue_stale_unique_key_reindex(db)
+        job_id = db.query(UniqueKeyReindexJob.id).filter(UniqueKeyReindexJob.form_id == form_id).scalar()
+    finally:
+        db.close()
+    assert run_reindex_job(job_id) == "completed"
+    assert submit(client, admin_headers, form_id, study_id, "K1").status_code == 400
@@ -0,0 +1,20 @@
+from app.api import users
+
+
+def test_password_update_of_an_unknown_user_is_404_without_hashing(client, admin_headers, monkeypatch):
+    async def fail(password):
+        raise AssertionError("password hashed for an unknown user")
+
+    monkeypatch.setattr(users, "get_password_hash_async", fail)
+    response = client.put("/api/users/999999", json={"password": "new-password"}, headers=admin_headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "User not found"
+
+
+def test_password_update_replaces_the_login_password(client, admin_headers, user_credentials):
+    email, password, user_id = user_credentials
+    response = client.put(f"/api/users/{user_id}", json={"password": "changed-password"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert client.post("/api/auth/login", json={"email": email, "password": password}).status_code == 401
+    assert client.post("/api/auth/login", json={"email": email, "password": "changed-password"}).status_code == 200
+    client.cookies.clear()
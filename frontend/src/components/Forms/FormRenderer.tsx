@@ -57,13 +57,16 @@ const FormRenderer: React.FC<FormRendererProps> = ({
       return null;
     }
 
+    // Whitespace-only text counts as empty, as on the server (app/form_validation.py)
+    const isEmpty = value === null || value === undefined || (typeof value === 'string' && value.trim() === '');
+
     // For other fields, check if required
-    if (field.required && (value === null || value === undefined || value === '')) {
+    if (field.required && isEmpty) {
       return `${field.label} is required`;
     }
 
     // Skip validation if field is empty and not required
-    if (value === null || value === undefined || value === '') {
+    if (isEmpty) {
       return null;
     }
 
@@ -1,4 +1,4 @@
-import axios from 'axios';
+import axios, { AxiosRequestConfig } from 'axios';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
@@ -11,13 +11,44 @@ const api = axios.create({
   withCredentials: true, // send httpOnly auth cookie with every request
 });
 
-// Handle 401: redirect to login only for real API calls, not for the initial session check
+// Requests that must never trigger a refresh attempt themselves
+const NO_REFRESH_URLS = ['/api/auth/login', '/api/auth/refresh', '/api/auth/logout', '/api/auth/register'];
+
+// One refresh in flight at a time; concurrent 401s wait for the same result
+let refreshPromise: Promise<void> | null = null;
+
+const refreshSession = (): Promise<void> => {
+  if (!refreshPromise) {
+    refreshPromise = api
+      .post('/api/auth/refresh')
+      .then(() => undefined)
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
+// Handle 401: try one silent refresh and replay the request; otherwise redirect to
+// login, except for the initial session check
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
-      const isSessionCheck = error.config?.url?.includes?.('/api/auth/me');
-      if (!isSessionCheck) {
+  async (error) => {
+    const config = error.config as (AxiosRequestConfig & { _retried?: boolean }) | undefined;
+    const url: string = config?.url || '';
+    if (error.response?.status === 401 && config) {
+      const canRefresh = !config._retried && !NO_REFRESH_URLS.some((path) => url.includes(path));
+      if (canRefresh) {
+        config._retried = true;
+        try {
+          await refreshSession();
+          return api(config);
+        } catch {
+          // fall through to the redirect below
+        }
+      }
+      const isSessionCheck = url.includes('/api/auth/me');
+      if (!isSessionCheck && !url.includes('/api/auth/refresh')) {
         window.location.href = '/login';
       }
     }
@@ -26,4 +57,3 @@ api.interceptors.response.use(
 );
 
 export default api;
-